@@ -1,19 +1,155 @@
 import math
+import json
+import multiprocessing
+import os
+import random
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from analysis_cache import DEFAULT_MAX_ENTRIES, AnalysisCache, params_salt
+from bitbase import DEFAULT_BITBASE_DIR, LOSS, WIN, Bitbases
+from book import DEFAULT_BOOK_PATH, OpeningBook
+from evaluation import DEFAULT_PARAMS_PATH, DEFAULT_TABLES, EvalTables, blend, load_params
+from movegen import generate_moves, is_legal
+from search_board import (BISHOP, COLOR_NAMES, FLAG_CASTLING, FLAG_EN_PASSANT, KNIGHT, PAWN, PIECE_NAMES,
+                          PROMOTION_SHIFT, QUEEN, ROOK, WHITE, SearchBoard, move_to_positions,
+                          move_to_uci)
+from search_stats import JsonTrace, SearchProfiler, ratio
+from transposition import EXACT, LOWER, UPPER, TranspositionTable
+
+MATE_SCORE = 20000
+# Мат через ply полуходов от корня оценивается в MATE_SCORE - ply: ближний мат лучше дальнего.
+# Все, что по модулю не меньше MATE_THRESHOLD, - мат
+MATE_THRESHOLD = MATE_SCORE - 1000
+# Выигрыш по эндшпильной базе: меньше мата, минус полуходы до мата (bitbase.py)
+BITBASE_WIN_SCORE = MATE_SCORE // 2
+# Таблицы есть только для трех фигур, а у ферзя фаза 4: иначе базу можно не спрашивать
+BITBASE_MAX_PHASE = 4
+MAX_DEPTH = 64
+# Ходы-убийцы хранятся по расстоянию от корня
+MAX_PLY = 2 * MAX_DEPTH
+
+# Проверять время и бюджет узлов раз в 64 узла
+TIME_CHECK_MASK = 63
+
+# Уровни сложности: бюджет узлов на ход (сила и затраты не зависят от машины) и шум оценки
+# в сантипешках. max_seconds - предел, под который калибровка (bench.py --calibrate) урезает
+# бюджет на медленной машине
+DIFFICULTY_LEVELS = {
+    'easy': {'nodes': 2000, 'eval_noise': 80, 'max_seconds': 0.5},
+    'medium': {'nodes': 20000, 'eval_noise': 25, 'max_seconds': 2.0},
+    'hard': {'nodes': 200000, 'eval_noise': 0, 'max_seconds': 5.0},
+}
+CALIBRATION_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'calibration.json')
+# Перемешивание ключа позиции для шума оценки
+NOISE_MULTIPLIER = 0x9E3779B97F4A7C15
+
+# Запас отсечения по дельте в форсированном поиске
+DELTA_MARGIN = 200
+
+# Нулевой ход: сокращение глубины и минимальная глубина узла
+NULL_MOVE_REDUCTION = 2
+NULL_MOVE_MIN_DEPTH = 3
+
+# Сокращение поздних ходов: с какой глубины и после скольких ходов
+LMR_MIN_DEPTH = 3
+LMR_MIN_MOVES = 3
 
 
 class ChessAI:
 
-    def __init__(self, depth=3, color='black'):
+    def __init__(self, depth=3, color='black', tt_size_mb=16, verbose=True, workers=1, delta_pruning=True,
+                 pvs=True, null_move=True, lmr=True, check_extensions=True, book_path=DEFAULT_BOOK_PATH,
+                 profile=False, trace_path=None, eval_params=DEFAULT_PARAMS_PATH,
+                 bitbase_dir=DEFAULT_BITBASE_DIR, cache_path=None, cache_entries=DEFAULT_MAX_ENTRIES,
+                 node_limit=None, eval_noise=0, difficulty=None):
         assert depth > 0
         assert color in ['white', 'black']
 
         self.depth = depth
+        self.verbose = verbose
         self.color = color
         self.opponent_color = 'white' if color == 'black' else 'black'
         self.nodes_evaluated = 0
-
-        self.transposition_table = {}
-
+        self.quiescence_nodes = 0
+        self.completed_depth = 0
+        self.delta_pruning = delta_pruning
+        # Приемы поиска включаются по отдельности, чтобы bench.py мог измерить вклад каждого
+        self.pvs = pvs
+        self.null_move = null_move
+        self.lmr = lmr
+        self.check_extensions = check_extensions
+        self.principal_variation = []
+        self.best_move = None
+        self.best_value = None
+        # Итерации последнего поиска: глубина, узлы и время с начала хода
+        self.iterations = []
+        # (ключ позиции, ход), найденный заранее в фоне; get_best_move отдает его сразу
+        self.ready_move = None
+        # Статистика последнего поиска (см. _finish_search) и слушатели событий:
+        # listener('iteration', итерация) после каждой глубины, listener('search', stats) в конце
+        self.stats = {}
+        self.listeners = []
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.profiler = None
+        self._stopped = False
+        # prepare_search уже сбросил флаг остановки: get_best_move его не трогает
+        self._prepared = False
+        self._deadline = None
+        # Бюджет узлов на ход (None - без ограничения); проверяется вместе со временем
+        self.node_limit = node_limit
+        self._node_limit = None
+        self._limited = False
+        # В процессе параллельного поиска: общий для всех процессов счетчик узлов хода
+        # и флаг остановки, который выставляет stop() главного процесса
+        self._node_counter = None
+        self._counted_nodes = 0
+        self._stop_flag = None
+        # Случайная добавка к оценке для слабых уровней; зерно меняется с каждой партией
+        self.eval_noise = 0
+        self.difficulty = None
+        self._noise_seed = random.getrandbits(64)
+
+        # workers > 1: ходы корня делятся между процессами (GIL не дает ускорения потокам)
+        self.workers = workers
+        self._worker_settings = {'depth': depth, 'tt_size_mb': tt_size_mb, 'delta_pruning': delta_pruning,
+                                 'pvs': pvs, 'null_move': null_move, 'lmr': lmr,
+                                 'check_extensions': check_extensions, 'book_path': None,
+                                 'eval_params': eval_params, 'bitbase_dir': bitbase_dir}
+        self._pool = None
+        self._shared_alpha = None
+        self._shared_nodes = None
+        self._shared_stop = None
+        # Номер партии: процессы очищают свои таблицы транспозиций, когда он меняется
+        self._shared_game = None
+
+        # Дебютная книга (book.py); без файла ИИ всегда считает сам
+        self.book = None
+        if book_path and os.path.exists(book_path):
+            try:
+                self.book = OpeningBook(book_path)
+            except (OSError, ValueError) as error:
+                # Испорченная или чужая книга не должна мешать запуску GUI, UCI и матчей
+                print(f'AI: книга не загружена: {error}', file=sys.stderr)
+        # Эндшпильные базы (bitbase.py build); без них окончания считаются поиском
+        self.bitbases = Bitbases(bitbase_dir) if bitbase_dir and os.path.isdir(bitbase_dir) else None
+        if self.bitbases is not None and not self.bitbases:
+            self.bitbases = None
+
+        # Таблица сохраняется между ходами и очищается только в new_game()
+        self.transposition_table = TranspositionTable(size_mb=tt_size_mb)
+
+        # Сортировка ходов по отсечениям в уже просмотренных узлах:
+        # два хода-убийцы на каждый ply, история [сторона][откуда][куда]
+        # и лучший ответ на каждый ход соперника (откуда, куда)
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history_scores = [0] * 8192
+        self.countermoves = [None] * 4096
+        self._root_ply = 0
+
+        # Ценности фигур для сортировки ходов; оценка позиции берет их из eval_tables
         self.piece_values = {
             'Pawn': 100,
             'Knight': 320,
@@ -23,258 +159,862 @@ class ChessAI:
             'King': 20000
         }
 
-        self.pawn_table = [
-            [0, 0, 0, 0, 0, 0, 0, 0],
-            [50, 50, 50, 50, 50, 50, 50, 50],
-            [10, 10, 20, 30, 30, 20, 10, 10],
-            [5, 5, 10, 25, 25, 10, 5, 5],
-            [0, 0, 0, 20, 20, 0, 0, 0],
-            [5, -5, -10, 0, 0, -10, -5, 5],
-            [5, 10, 10, -20, -20, 10, 10, 5],
-            [0, 0, 0, 0, 0, 0, 0, 0]
-        ]
-
-        self.knight_table = [
-            [-50, -40, -30, -30, -30, -30, -40, -50],
-            [-40, -20, 0, 0, 0, 0, -20, -40],
-            [-30, 0, 10, 15, 15, 10, 0, -30],
-            [-30, 5, 15, 20, 20, 15, 5, -30],
-            [-30, 0, 15, 20, 20, 15, 0, -30],
-            [-30, 5, 10, 15, 15, 10, 5, -30],
-            [-40, -20, 0, 5, 5, 0, -20, -40],
-            [-50, -40, -30, -30, -30, -30, -40, -50]
-        ]
-
-        self.king_table = [
-            [-30, -40, -40, -50, -50, -40, -40, -30],
-            [-30, -40, -40, -50, -50, -40, -40, -30],
-            [-30, -40, -40, -50, -50, -40, -40, -30],
-            [-30, -40, -40, -50, -50, -40, -40, -30],
-            [-20, -30, -30, -40, -40, -30, -30, -20],
-            [-10, -20, -20, -20, -20, -20, -20, -10],
-            [20, 20, 0, 0, 0, 0, 20, 20],
-            [20, 30, 10, 0, 0, 10, 30, 20]
-        ]
-
-    def get_best_move(self, board):
-        self.nodes_evaluated = 0
+        # Материал и таблицы полей для миттельшпиля и эндшпиля (evaluation.py);
+        # файл параметров пишет tune.py, без него действуют значения по умолчанию
+        if eval_params and os.path.exists(eval_params):
+            self.eval_tables = EvalTables(load_params(eval_params))
+        else:
+            self.eval_tables = DEFAULT_TABLES
+
+        # Постоянный кэш анализа (analysis_cache.py): общий для процессов и запусков
+        self.analysis_cache = None
+        if cache_path:
+            self.analysis_cache = AnalysisCache(cache_path, cache_entries, params_salt(self.eval_tables.params))
+
+        self._order_values = [0] + [self.piece_values[PIECE_NAMES[piece_type]] for piece_type in range(1, 7)]
+
+        self.set_eval_noise(eval_noise)
+        if difficulty is not None:
+            self.set_difficulty(difficulty)
+        if profile:
+            self.enable_profiling()
+        if trace_path:
+            self.add_listener(JsonTrace(trace_path))
+
+    # Поиск вызывает генератор через атрибуты, чтобы профилировщик мог подменить их
+    # на обертки с таймером у отдельного экземпляра
+    _generate_moves = staticmethod(generate_moves)
+    _is_legal = staticmethod(is_legal)
+
+    def add_listener(self, listener):
+        self.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self.listeners.remove(listener)
+
+    def _notify(self, event, data):
+        for listener in self.listeners:
+            listener(event, data)
+
+    def enable_profiling(self):
+        """Замер времени в генераторе ходов, оценке и таблице транспозиций (замедляет поиск)"""
+        if self.profiler is not None:
+            return
+        profiler = self.profiler = SearchProfiler()
+        self._generate_moves = profiler.wrap('movegen', generate_moves)
+        self._is_legal = profiler.wrap('movegen', is_legal)
+        self._install_evaluation()
+        table = self.transposition_table
+        table.probe = profiler.wrap('hashing', table.probe)
+        table.store = profiler.wrap('hashing', table.store)
+
+    def set_eval_noise(self, noise):
+        """Оценка отклоняется не больше чем на noise сантипешек (0 - точная оценка)"""
+        self.eval_noise = noise
+        self._install_evaluation()
+
+    def set_difficulty(self, level):
+        """Уровень из DIFFICULTY_LEVELS (или калиброванный из calibration.json)"""
+        settings = difficulty_levels()[level]
+        self.difficulty = level
+        self.node_limit = settings['nodes']
+        self.set_eval_noise(settings['eval_noise'])
+
+    def _install_evaluation(self):
+        # Шум и профилировщик подменяют оценку у экземпляра; без них работает метод класса
+        self.__dict__.pop('_evaluate_board_fast', None)
+        evaluate = self._noisy_evaluate if self.eval_noise else None
+        if self.profiler is not None:
+            evaluate = self.profiler.wrap('evaluation', evaluate or self._evaluate_board_fast)
+        if evaluate is not None:
+            self._evaluate_board_fast = evaluate
+
+    def new_game(self):
         self.transposition_table.clear()
+        self._noise_seed = random.getrandbits(64)
+        self.ready_move = None
+        self.history_scores = [0] * 8192
+        self.countermoves = [None] * 4096
+        if self._shared_game is not None:
+            # Процессы пула очистят свои таблицы перед следующим ходом корня
+            with self._shared_game.get_lock():
+                self._shared_game.value += 1
+
+    def start_workers(self):
+        """Запускает процессы параллельного поиска заранее, чтобы первый ход не ждал их создания"""
+        if self.workers <= 1 or self._pool is not None:
+            return
+        self._shared_alpha = multiprocessing.Value('d', -math.inf)
+        self._shared_nodes = multiprocessing.Value('q', 0)
+        self._shared_stop = multiprocessing.Value('b', 0)
+        self._shared_game = multiprocessing.Value('q', 0)
+        self._pool = ProcessPoolExecutor(max_workers=self.workers, initializer=_init_search_worker,
+                                         initargs=(self._worker_settings, self._shared_alpha,
+                                                   self._shared_nodes, self._shared_stop, self._shared_game))
+        wait([self._pool.submit(_worker_ready) for _ in range(self.workers)])
+
+    def close(self):
+        """Останавливает процессы параллельного поиска и закрывает книгу, базы и кэш"""
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+        if self.book is not None:
+            self.book.close()
+            self.book = None
+        if self.bitbases is not None:
+            self.bitbases.close()
+            self.bitbases = None
+        if self.analysis_cache is not None:
+            self.analysis_cache.close()
+            self.analysis_cache = None
+
+    def prepare_search(self):
+        """Вызывается потоком, который ставит поиск в очередь (GUI, UCI), до его запуска.
+
+        stop(), пришедший между постановкой и началом поиска, тогда не теряется:
+        поиск начнется уже остановленным и сразу вернет ход.
+        """
+        self._stopped = False
+        if self._shared_stop is not None:
+            self._shared_stop.value = 0
+        self._prepared = True
+
+    def stop(self):
+        """Прерывает текущий (или подготовленный prepare_search) поиск из другого потока"""
+        self._stopped = True
+        if self._shared_stop is not None:
+            self._shared_stop.value = 1
+
+    def set_time_limit(self, time_limit):
+        """Ограничивает по времени уже идущий поиск (ponderhit в UCI)"""
+        self._deadline = time.perf_counter() + time_limit
+        self._limited = True
+
+    def get_best_move(self, board, time_limit=None, max_depth=None, node_limit=None):
+        """Итеративное углубление 1, 2, 3, ...
+
+        board - доска GUI (ход за self.color) или SearchBoard; для SearchBoard
+        ИИ играет за сторону, которая ходит. Без ограничений поиск идет до
+        max_depth (по умолчанию self.depth). С time_limit (секунды) или
+        node_limit (узлов, по умолчанию self.node_limit) возвращается ход
+        последней завершенной итерации.
+        """
+        self.nodes_evaluated = 0
+        self.quiescence_nodes = 0
+        self.cutoffs = 0
+        self.first_move_cutoffs = 0
+        self.iterations = []
+        self.transposition_table.new_search()
+        self._age_move_ordering()
+        table_before = self.transposition_table.counters()
+        if self.profiler is not None:
+            self.profiler.reset()
+        start_time = time.perf_counter()
+
+        if self._prepared:
+            self._prepared = False
+        else:
+            self._stopped = False
+            if self._shared_stop is not None:
+                self._shared_stop.value = 0
+        self._deadline = start_time + time_limit if time_limit is not None else None
+        self._node_limit = node_limit if node_limit is not None else self.node_limit
+        self._limited = self._deadline is not None or self._node_limit is not None
+        if max_depth is None:
+            max_depth = self.depth if not self._limited else MAX_DEPTH
+
+        # Доска GUI переводится в компактное представление один раз за ход
+        if isinstance(board, SearchBoard):
+            board = board.copy()
+            self.color = COLOR_NAMES[board.side]
+            self.opponent_color = COLOR_NAMES[board.side ^ 1]
+        else:
+            board = SearchBoard.from_board(board, self.color)
+        if board.eval_tables is not self.eval_tables:
+            board.set_eval_tables(self.eval_tables)
+
+        if self.ready_move is not None:
+            ready_key, ready_move = self.ready_move
+            self.ready_move = None
+            if ready_key == board.key and ready_move is not None:
+                self.best_move = ready_move
+                self._finish_search(board, 'ready', start_time, table_before)
+                return move_to_positions(ready_move)
+
+        if self.book is not None:
+            book_move = self.book.choose(board)
+            if book_move is not None:
+                self.best_move = book_move
+                self.best_value = None
+                self.completed_depth = 0
+                self.principal_variation = [book_move]
+                if self.verbose:
+                    print(f"AI: ход из книги {move_to_uci(book_move)}")
+                self._finish_search(board, 'book', start_time, table_before)
+                return move_to_positions(book_move)
+
+        if self.bitbases is not None:
+            known = self.bitbases.choose(board)
+            if known is not None:
+                move, result, distance = known
+                self.best_move = move
+                self.best_value = self._bitbase_score(result, distance)
+                self.completed_depth = 0
+                self.principal_variation = [move]
+                if self.verbose:
+                    print(f"AI: ход из эндшпильной базы {move_to_uci(move)}, оценка: {self.best_value}")
+                self._finish_search(board, 'bitbase', start_time, table_before)
+                return move_to_positions(move)
+
+        possible_moves = self._generate_moves(board)
 
+        if not possible_moves:
+            self.best_move = None
+            self.best_value = None
+            self._finish_search(board, 'no_moves', start_time, table_before)
+            return None
+
+        # Оценки с шумом в общий кэш не попадают
+        if self.analysis_cache is not None and not self.eval_noise:
+            cached = self.analysis_cache.get(board.key)
+            if cached is not None and cached[3] is not None and self._is_legal(board, cached[3]):
+                cached_depth, cached_value, cached_flag, cached_move = cached
+                if time_limit is None and cached_flag == EXACT and cached_depth >= max_depth:
+                    self.best_move = cached_move
+                    self.best_value = cached_value
+                    self.completed_depth = cached_depth
+                    self.principal_variation = [cached_move]
+                    self._finish_search(board, 'cache', start_time, table_before)
+                    return move_to_positions(cached_move)
+                # Мельче, чем нужно: ход из кэша хотя бы смотрится первым
+                self.transposition_table.store(board.key, cached_depth, cached_value, cached_flag, cached_move)
+
+        entry = self.transposition_table.probe(board.key)
+        possible_moves = self._order_moves_smart(board, possible_moves, entry[4] if entry else None)
+
+        best_move = possible_moves[0]
+        best_value = -math.inf
+        self.completed_depth = 0
+
+        for depth in range(1, max_depth + 1):
+            if self.workers > 1 and len(possible_moves) > 1:
+                move, value = self._search_root_parallel(board, possible_moves, depth)
+            else:
+                move, value = self._search_root(board, possible_moves, depth)
+            if self._stopped:
+                break
+
+            best_move, best_value = move, value
+            self.completed_depth = depth
+            self.transposition_table.store(board.key, depth, best_value, EXACT, best_move)
+            self.principal_variation = self._get_principal_variation(board, depth)
+            iteration = {
+                'depth': depth,
+                'nodes': self.nodes_evaluated,
+                'time': time.perf_counter() - start_time,
+                'score': best_value,
+                'pv': self.principal_variation,
+            }
+            self.iterations.append(iteration)
+            self._notify('iteration', iteration)
+
+            # Главный вариант предыдущей итерации идет первым
+            possible_moves.remove(best_move)
+            possible_moves.insert(0, best_move)
+
+            if abs(best_value) >= MATE_THRESHOLD:
+                break
+
+        if self.verbose:
+            print(f"AI: {self.nodes_evaluated} позиций, глубина: {self.completed_depth}, оценка: {best_value}")
+        self.best_move = best_move
+        self.best_value = best_value
+        self._finish_search(board, 'search', start_time, table_before)
+        if self.analysis_cache is not None and not self.eval_noise and self.completed_depth:
+            self._save_analysis(board)
+        return move_to_positions(best_move)
+
+    def _save_analysis(self, board):
+        """Записи таблицы транспозиций вдоль главного варианта - в постоянный кэш"""
+        entries = []
+        for move in self.principal_variation:
+            entry = self.transposition_table.probe(board.key)
+            if entry is None or entry[4] is None:
+                break
+            entries.append(entry[:5])
+            board.make_move(move)
+        for _ in entries:
+            board.unmake_move()
+        self.analysis_cache.store_many(entries)
+
+    def _finish_search(self, board, source, start_time, table_before):
+        """Собирает self.stats по закончившемуся поиску и передает их слушателям.
+
+        source: search - обычный поиск, book - ход из книги, bitbase - ход из
+        эндшпильной базы, cache - результат из постоянного кэша, ready - ход,
+        найденный заранее, no_moves - ходов нет.
+        """
+        elapsed = time.perf_counter() - start_time
+        nodes = self.nodes_evaluated
+        table_after = self.transposition_table.counters()
+        table = {name: table_after[name] - table_before[name] for name in table_after}
+        table['hit_rate'] = ratio(table['hits'], table['probes'])
+
+        iterations = []
+        previous_nodes = 0
+        for iteration in self.iterations:
+            iterations.append({
+                'depth': iteration['depth'],
+                'nodes': iteration['nodes'] - previous_nodes,
+                'time': round(iteration['time'], 4),
+                'score': iteration['score'],
+                'pv': [move_to_uci(move) for move in iteration['pv']],
+            })
+            previous_nodes = iteration['nodes']
+
+        score = self.best_value if source in ('search', 'bitbase', 'cache') else None
+        self.stats = {
+            'source': source,
+            'fen': board.fen(),
+            'move': move_to_uci(self.best_move) if self.best_move is not None else None,
+            'score': score if score is None or math.isfinite(score) else None,
+            'depth': self.completed_depth if source in ('search', 'cache') else 0,
+            'time': round(elapsed, 4),
+            'nodes': nodes,
+            'nps': int(nodes / elapsed) if elapsed else 0,
+            'quiescence_nodes': self.quiescence_nodes,
+            'quiescence_share': ratio(self.quiescence_nodes, nodes),
+            'cutoffs': self.cutoffs,
+            'first_move_cutoffs': self.first_move_cutoffs,
+            'first_move_cutoff_rate': ratio(self.first_move_cutoffs, self.cutoffs),
+            'tt': table,
+            'iterations': iterations,
+        }
+        if self.profiler is not None:
+            profile = {section: round(seconds, 4) for section, seconds in self.profiler.times.items()}
+            profile['other'] = round(max(elapsed - sum(self.profiler.times.values()), 0.0), 4)
+            self.stats['profile'] = profile
+        self._notify('search', self.stats)
+
+    def _search_root(self, board, possible_moves, depth, alpha=-math.inf):
         best_move = None
         best_value = -math.inf
-        alpha = -math.inf
         beta = math.inf
+        self._root_ply = len(board.history)
 
-        possible_moves = self._get_all_possible_moves(board, self.color)
+        for move in possible_moves:
+            board.make_move(move)
 
-        if not possible_moves:
-            return None
+            if best_move is None or not self.pvs:
+                value = -self._negamax(board, depth - 1, -beta, -alpha)
+            else:
+                value = -self._negamax(board, depth - 1, -alpha - 1, -alpha)
+                if value > alpha:
+                    value = -self._negamax(board, depth - 1, -beta, -alpha)
 
-        possible_moves = self._order_moves_smart(board, possible_moves)
-
-        for from_pos, to_pos in possible_moves:
-            piece = board.get_piece(from_pos)
-            captured = board.get_piece(to_pos)
-            old_pos = piece.pos
-            old_has_moved = piece.has_moved
-
-            old_rook_state = None
-            if piece.name == 'King' and abs(to_pos[1] - from_pos[1]) == 2:
-                row = from_pos[0]
-                if to_pos[1] > from_pos[1]:
-                    rook = board.get_piece((row, 7))
-                    old_rook_state = (rook.pos, rook.has_moved) if rook else None
-                else:
-                    rook = board.get_piece((row, 0))
-                    old_rook_state = (rook.pos, rook.has_moved) if rook else None
-
-            board.move_piece(from_pos, to_pos)
-
-            is_capture = captured is not None
-            search_depth = self.depth if not is_capture else self.depth + 1
-
-            value = self._minimax_optimized(board, search_depth - 1, alpha, beta, False)
-
-            board.set_piece(from_pos, piece)
-            board.set_piece(to_pos, captured)
-            piece.pos = old_pos
-            piece.has_moved = old_has_moved
-
-            if old_rook_state:
-                row = from_pos[0]
-                if to_pos[1] > from_pos[1]:  # Короткая
-                    rook = board.get_piece((row, 5))
-                    if rook:
-                        board.set_piece((row, 7), rook)
-                        board.set_piece((row, 5), None)
-                        rook.pos, rook.has_moved = old_rook_state
-                else:
-                    rook = board.get_piece((row, 3))
-                    if rook:
-                        board.set_piece((row, 0), rook)
-                        board.set_piece((row, 3), None)
-                        rook.pos, rook.has_moved = old_rook_state
+            board.unmake_move()
+
+            if self._stopped:
+                break
 
             if value > best_value:
                 best_value = value
-                best_move = (from_pos, to_pos)
+                best_move = move
 
             alpha = max(alpha, value)
 
-            if beta <= alpha:
+        return best_move, best_value
+
+    def _search_root_parallel(self, board, possible_moves, depth):
+        """Первый ход корня считается здесь, остальные - в процессах с общим alpha"""
+        best_move, best_value = self._search_root(board, possible_moves[:1], depth)
+        if self._stopped:
+            return best_move, best_value
+
+        self.start_workers()
+        self._shared_alpha.value = best_value
+        # Бюджет узлов общий: процессы прибавляют свои узлы к уже потраченным здесь
+        self._shared_nodes.value = self.nodes_evaluated
+
+        fen = board.fen()
+        # perf_counter у процессов не общий, поэтому срок передается по time.time()
+        deadline = None
+        if self._deadline is not None:
+            deadline = time.time() + self._deadline - time.perf_counter()
+
+        noise = (self.eval_noise, self._noise_seed)
+        futures = [self._pool.submit(_search_root_move, fen, move, depth, best_value, deadline, self._node_limit,
+                                   noise)
+                   for move in possible_moves[1:]]
+        # Результаты разбираются в порядке ходов, чтобы при равенстве оценок выбор не зависел от таймингов.
+        # После остановки еще не начатые задачи отменяются, а идущие видят общий флаг и сразу возвращаются
+        for future in futures:
+            if self._stopped:
+                future.cancel()
+            if future.cancelled():
+                continue
+            move, value, nodes = future.result()
+            self.nodes_evaluated += nodes
+            if value is None:
+                self.stop()
+            elif value > best_value:
+                best_move, best_value = move, value
+
+        return best_move, best_value
+
+    def _check_limits(self):
+        if self._stop_flag is not None and self._stop_flag.value:
+            self._stopped = True
+            return
+        nodes = self.nodes_evaluated
+        if self._node_counter is not None:
+            nodes = self._count_shared_nodes()
+        if self._node_limit is not None and nodes >= self._node_limit:
+            self._stopped = True
+        elif self._deadline is not None and time.perf_counter() >= self._deadline:
+            self._stopped = True
+
+    def _count_shared_nodes(self):
+        """Добавляет в общий счетчик узлы, посчитанные с прошлого раза; возвращает его значение"""
+        with self._node_counter.get_lock():
+            self._node_counter.value += self.nodes_evaluated - self._counted_nodes
+            nodes = self._node_counter.value
+        self._counted_nodes = self.nodes_evaluated
+        return nodes
+
+    def _get_principal_variation(self, board, depth):
+        """Главный вариант по лучшим ходам из таблицы транспозиций"""
+        pv = []
+        seen = set()
+
+        while len(pv) < depth and board.key not in seen:
+            seen.add(board.key)
+            entry = self.transposition_table.probe(board.key)
+            if entry is None or entry[4] is None or not self._is_legal(board, entry[4]):
                 break
+            pv.append(entry[4])
+            board.make_move(entry[4])
 
-        print(f"AI: {self.nodes_evaluated} позиций, оценка: {best_value}")
-        return best_move
+        for _ in pv:
+            board.unmake_move()
+        return pv
 
-    def _minimax_optimized(self, board, depth, alpha, beta, is_maximizing):
+    def _negamax(self, board, depth, alpha, beta, allow_null=True):
+        """Alpha-beta в форме negamax: оценка относительно стороны, которая ходит"""
         self.nodes_evaluated += 1
 
-        board_hash = self._get_board_hash(board)
-        if board_hash in self.transposition_table:
-            cached_depth, cached_value = self.transposition_table[board_hash]
-            if cached_depth >= depth:
-                return cached_value
-
-        if depth == 0:
-            eval_score = self._evaluate_board_fast(board)
-            self.transposition_table[board_hash] = (depth, eval_score)
-            return eval_score
-
-        color = self.color if is_maximizing else self.opponent_color
-
-        if board.is_checkmate(color):
-            return -20000 if is_maximizing else 20000
-
-        possible_moves = self._get_all_possible_moves(board, color)
-
-        if not possible_moves:
+        if self._limited and not self.nodes_evaluated & TIME_CHECK_MASK:
+            self._check_limits()
+        if self._stopped:
             return 0
 
-        possible_moves = self._order_moves_smart(board, possible_moves)
-
-        if is_maximizing:
-            max_eval = -math.inf
-            for from_pos, to_pos in possible_moves:
-                piece = board.get_piece(from_pos)
-                captured = board.get_piece(to_pos)
-                old_pos = piece.pos
-                board.move_piece(from_pos, to_pos)
-
-                eval = self._minimax_optimized(board, depth - 1, alpha, beta, False)
-
-                board.set_piece(from_pos, piece)
-                board.set_piece(to_pos, captured)
-                piece.pos = old_pos
-
-                max_eval = max(max_eval, eval)
-                alpha = max(alpha, eval)
-
-                if beta <= alpha:
-                    break
+        if self.bitbases is not None and board.phase <= BITBASE_MAX_PHASE:
+            known = self.bitbases.probe(board)
+            if known is not None:
+                return self._bitbase_score(*known)
+
+        board_hash = board.key
+        ply = len(board.history) - self._root_ply
+        entry = self.transposition_table.probe(board_hash)
+        tt_move = None
+        if entry is not None:
+            _, cached_depth, cached_value, cached_flag, tt_move, _ = entry
+            cached_value = _score_from_table(cached_value, ply)
+            if cached_depth >= depth:
+                if cached_flag == EXACT:
+                    return cached_value
+                if cached_flag == LOWER and cached_value >= beta:
+                    return cached_value
+                if cached_flag == UPPER and cached_value <= alpha:
+                    return cached_value
+
+        in_check = board.in_check()
+        if in_check and self.check_extensions and ply < MAX_PLY:
+            # Шах не считается за полуход: форсированные линии не обрываются на горизонте
+            depth += 1
+
+        if depth <= 0:
+            return self._quiescence(board, alpha, beta)
+
+        # Нулевой ход: если даже после пропуска хода оценка не ниже beta, узел отсекается.
+        # Без легких и тяжелых фигур (цугцванг в пешечных окончаниях) не применяется.
+        if (self.null_move and allow_null and not in_check and depth >= NULL_MOVE_MIN_DEPTH
+                and beta < math.inf and self._has_pieces(board)
+                and self._evaluate_board_fast(board) >= beta):
+            reduction = NULL_MOVE_REDUCTION + (depth > 6)
+            board.make_null_move()
+            value = -self._negamax(board, depth - 1 - reduction, -beta, -beta + 1, False)
+            board.unmake_null_move()
+            if self._stopped:
+                return 0
+            if value >= beta:
+                return beta
+
+        alpha_orig = alpha
+        best_value = -math.inf
+        best_move = None
+        moves_searched = 0
+        squares = board.squares
+
+        for move in self._staged_moves(board, tt_move, ply):
+            moves_searched += 1
+            quiet = not (squares[(move >> 6) & 63] or move & FLAG_EN_PASSANT or (move >> PROMOTION_SHIFT) & 7)
+            board.make_move(move)
+
+            if moves_searched == 1:
+                value = -self._negamax(board, depth - 1, -beta, -alpha)
+            else:
+                # Поздние тихие ходы сначала смотрятся на меньшую глубину
+                reduction = 0
+                if (self.lmr and quiet and not in_check and depth >= LMR_MIN_DEPTH
+                        and moves_searched > LMR_MIN_MOVES and not board.in_check()):
+                    reduction = 1 if moves_searched <= 2 * LMR_MIN_MOVES else 2
+                # Нулевое окно: достаточно доказать, что ход не лучше alpha
+                window_beta = alpha + 1 if self.pvs else beta
+                value = -self._negamax(board, depth - 1 - reduction, -window_beta, -alpha)
+                if value > alpha and reduction:
+                    value = -self._negamax(board, depth - 1, -window_beta, -alpha)
+                if self.pvs and alpha < value < beta:
+                    value = -self._negamax(board, depth - 1, -beta, -alpha)
+
+            board.unmake_move()
+
+            if self._stopped:
+                return 0
 
-            self.transposition_table[board_hash] = (depth, max_eval)
-            return max_eval
+            if value > best_value:
+                best_value = value
+                best_move = move
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        self.cutoffs += 1
+                        if moves_searched == 1:
+                            self.first_move_cutoffs += 1
+                        if quiet:
+                            self._record_cutoff(board, move, depth, ply)
+                        break
+
+        if not moves_searched:
+            return -MATE_SCORE + ply if in_check else 0
+
+        if best_value <= alpha_orig:
+            flag = UPPER
+        elif best_value >= beta:
+            flag = LOWER
         else:
-            min_eval = math.inf
-            for from_pos, to_pos in possible_moves:
-                piece = board.get_piece(from_pos)
-                captured = board.get_piece(to_pos)
-                old_pos = piece.pos
-                board.move_piece(from_pos, to_pos)
-
-                eval = self._minimax_optimized(board, depth - 1, alpha, beta, True)
-
-                board.set_piece(from_pos, piece)
-                board.set_piece(to_pos, captured)
-                piece.pos = old_pos
+            flag = EXACT
+        self.transposition_table.store(board_hash, depth, _score_to_table(best_value, ply), flag, best_move)
+        return best_value
+
+    @staticmethod
+    def _bitbase_score(result, distance):
+        """Результат базы -> оценка: чем ближе мат, тем она больше"""
+        if result == WIN:
+            return BITBASE_WIN_SCORE - distance
+        if result == LOSS:
+            return distance - BITBASE_WIN_SCORE
+        return 0
+
+    def _has_pieces(self, board):
+        """Есть ли у стороны, которая ходит, фигуры кроме пешек и короля"""
+        piece_lists = board.piece_lists
+        color = board.side << 3
+        return any(piece_lists[piece_type | color] for piece_type in (KNIGHT, BISHOP, ROOK, QUEEN))
+
+    def _quiescence(self, board, alpha, beta):
+        """Только взятия и превращения, пока позиция не успокоится (negamax)"""
+        self.nodes_evaluated += 1
+        self.quiescence_nodes += 1
 
-                min_eval = min(min_eval, eval)
-                beta = min(beta, eval)
+        if self._limited and not self.nodes_evaluated & TIME_CHECK_MASK:
+            self._check_limits()
+        if self._stopped:
+            return 0
 
-                if beta <= alpha:
-                    break
+        if self.bitbases is not None and board.phase <= BITBASE_MAX_PHASE:
+            known = self.bitbases.probe(board)
+            if known is not None:
+                return self._bitbase_score(*known)
+
+        if board.in_check():
+            # Под шахом оценка "на месте" невозможна: перебираются все ответы
+            possible_moves = self._generate_moves(board)
+            if not possible_moves:
+                return -MATE_SCORE + len(board.history) - self._root_ply
+            best_value = -math.inf
+            stand_pat = None
+        else:
+            stand_pat = self._evaluate_board_fast(board)
+            if stand_pat >= beta:
+                return stand_pat
+            if stand_pat > alpha:
+                alpha = stand_pat
+            best_value = stand_pat
+            possible_moves = self._generate_moves(board, noisy_only=True)
+
+        squares = board.squares
+        order_values = self._order_values
+        for move in self._order_captures(board, possible_moves):
+            if stand_pat is not None and self.delta_pruning and not (move >> PROMOTION_SHIFT) & 7:
+                # Даже выигрыш взятой фигуры с запасом не поднимет alpha
+                victim = squares[(move >> 6) & 63] & 7 or PAWN
+                if stand_pat + order_values[victim] + DELTA_MARGIN <= alpha:
+                    continue
+
+            board.make_move(move)
+            value = -self._quiescence(board, -beta, -alpha)
+            board.unmake_move()
+
+            if self._stopped:
+                return 0
 
-            self.transposition_table[board_hash] = (depth, min_eval)
-            return min_eval
+            if value > best_value:
+                best_value = value
+                if value > alpha:
+                    alpha = value
+                    if alpha >= beta:
+                        break
+
+        return best_value
+
+    def _staged_moves(self, board, tt_move, ply):
+        """Ходы узла по стадиям: ход из таблицы, взятия по MVV-LVA, ходы-убийцы
+        и ответ на прошлый ход соперника, остальные тихие ходы по истории.
+
+        Следующая стадия генерируется и сортируется, только если предыдущие
+        не дали отсечения.
+        """
+        if tt_move is not None and self._is_legal(board, tt_move):
+            yield tt_move
+        else:
+            tt_move = None
+
+        for move in self._order_captures(board, self._generate_moves(board, noisy_only=True)):
+            if move != tt_move:
+                yield move
+
+        quiets = self._generate_moves(board, quiet_only=True)
+        if not quiets:
+            return
+
+        hints = []
+        if ply < MAX_PLY:
+            hints.extend(self.killers[ply])
+        if board.history:
+            hints.append(self.countermoves[board.history[-1][0] & 4095])
+        tried = [tt_move]
+        for move in hints:
+            if move is not None and move not in tried and move in quiets:
+                tried.append(move)
+                yield move
+
+        history = self.history_scores
+        side = board.side << 12
+        quiets.sort(key=lambda move: history[side | (move & 4095)], reverse=True)
+        for move in quiets:
+            if move not in tried:
+                yield move
+
+    def _record_cutoff(self, board, move, depth, ply):
+        """Тихий ход дал отсечение: запоминаем его как убийцу, в истории и как ответ"""
+        if board.squares[(move >> 6) & 63] or move & FLAG_EN_PASSANT or (move >> PROMOTION_SHIFT) & 7:
+            return
+
+        if ply < MAX_PLY:
+            killers = self.killers[ply]
+            if killers[0] != move:
+                killers[1] = killers[0]
+                killers[0] = move
+        self.history_scores[(board.side << 12) | (move & 4095)] += depth * depth
+        if board.history:
+            self.countermoves[board.history[-1][0] & 4095] = move
+
+    def _age_move_ordering(self):
+        """Перед новым поиском: убийцы привязаны к ply и сбрасываются, история ослабевает"""
+        self.killers = [[None, None] for _ in range(MAX_PLY)]
+        self.history_scores = [value >> 1 for value in self.history_scores]
+
+    def _order_captures(self, board, moves):
+        """MVV-LVA: самая ценная жертва, затем самый дешевый нападающий"""
+        squares = board.squares
+        order_values = self._order_values
+
+        def capture_priority(move):
+            victim = squares[(move >> 6) & 63] & 7
+            if not victim and move & FLAG_EN_PASSANT:
+                victim = PAWN
+            attacker = squares[move & 63] & 7
+            return order_values[victim] * 10 + order_values[(move >> PROMOTION_SHIFT) & 7] - order_values[attacker] // 10
+
+        return sorted(moves, key=capture_priority, reverse=True)
 
     def _evaluate_board_fast(self, board):
-        score = 0
-
-        # Только материал и простые позиционные бонусы
-        for row in range(8):
-            for col in range(8):
-                piece = board.get_piece((row, col))
-                if piece:
-                    piece_value = self._get_piece_value_fast(piece, row, col)
-
-                    if piece.color == self.color:
-                        score += piece_value
-                    else:
-                        score -= piece_value
-
-        return score
-
-    def _get_piece_value_fast(self, piece, row, col):
-        base_value = self.piece_values[piece.name]
-        positional_bonus = 0
-
-        if piece.name == 'Pawn':
-            positional_bonus = self.pawn_table[row if piece.color == 'white' else 7 - row][col]
-        elif piece.name == 'Knight':
-            positional_bonus = self.knight_table[row][col]
-        elif piece.name == 'King':
-            positional_bonus = self.king_table[row if piece.color == 'white' else 7 - row][col]
-
-        return base_value + positional_bonus
-
-    def _get_board_hash(self, board):
-        board_str = ""
-        for row in range(8):
-            for col in range(8):
-                piece = board.get_piece((row, col))
-                if piece:
-                    board_str += f"{piece.name[0]}{piece.color[0]}"
-                else:
-                    board_str += "."
-        return hash(board_str)
-
-    def _get_all_possible_moves(self, board, color):
-        moves = []
-        for row in range(8):
-            for col in range(8):
-                piece = board.get_piece((row, col))
-                if piece and piece.color == color:
-                    valid_moves = piece.get_valid_moves(board)
-                    for move in valid_moves:
-                        if board.is_legal_move((row, col), move, color):
-                            moves.append(((row, col), move))
-        return moves
-
-    def _order_moves_smart(self, board, moves):
+        # Суммы таблиц обновляются в make_move, здесь остается только смешать фазы.
+        # Оценка относительно стороны, которая ходит
+        score = blend(board.mg_score, board.eg_score, board.phase)
+        return score if board.side == WHITE else -score
+
+    def _noisy_evaluate(self, board):
+        # Шум зависит только от позиции и партии, поэтому в поиске позиция оценивается одинаково
+        noise = self.eval_noise
+        offset = ((board.key ^ self._noise_seed) * NOISE_MULTIPLIER >> 32) % (2 * noise + 1) - noise
+        return ChessAI._evaluate_board_fast(self, board) + offset
+
+    def _order_moves_smart(self, board, moves, tt_move=None):
+        """Полная сортировка ходов корня; внутри дерева ходы идут по стадиям (_staged_moves)"""
+        squares = board.squares
+        order_values = self._order_values
 
         def move_priority(move):
-            from_pos, to_pos = move
+            from_sq = move & 63
+            to_sq = (move >> 6) & 63
             score = 0
 
-            piece = board.get_piece(from_pos)
-            target = board.get_piece(to_pos)
+            piece = squares[from_sq]
+            target = squares[to_sq]
 
-            if piece.name == 'King' and abs(to_pos[1] - from_pos[1]) == 2:
+            if move & FLAG_CASTLING:
                 score += 5000
 
             if target:
-                score += 10000 + self.piece_values[target.name] - self.piece_values[piece.name] // 10
+                score += 10000 + order_values[target & 7] - order_values[piece & 7] // 10
 
-            row, col = to_pos
+            row, col = to_sq >> 3, to_sq & 7
             if 3 <= row <= 4 and 3 <= col <= 4:
                 score += 50
             elif 2 <= row <= 5 and 2 <= col <= 5:
                 score += 20
 
-            if piece.name in ['Knight', 'Bishop'] and not piece.has_moved:
+            # Неразвитая легкая фигура: еще стоит на первой горизонтали
+            if piece & 7 in (KNIGHT, BISHOP) and from_sq >> 3 == (7 if piece < 8 else 0):
                 score += 30
 
             return score
 
-        return sorted(moves, key=move_priority, reverse=True)
+        moves = sorted(moves, key=move_priority, reverse=True)
+
+        # Лучший ход из таблицы транспозиций проверяется первым
+        if tt_move is not None and tt_move in moves:
+            moves.remove(tt_move)
+            moves.insert(0, tt_move)
+
+        return moves
+
+
+def _score_to_table(value, ply):
+    """Оценка мата от корня -> от позиции узла: в таблице она не зависит от пути к позиции"""
+    if value >= MATE_THRESHOLD:
+        return value + ply
+    if value <= -MATE_THRESHOLD:
+        return value - ply
+    return value
+
+
+def _score_from_table(value, ply):
+    """Оценка мата из таблицы (от позиции) -> от корня текущего поиска"""
+    if value >= MATE_THRESHOLD:
+        return value - ply
+    if value <= -MATE_THRESHOLD:
+        return value + ply
+    return value
+
+
+# Состояние процесса параллельного поиска: свой ChessAI со своей таблицей
+# транспозиций, общие для всех процессов alpha корня, счетчик узлов, флаг остановки
+# и номер партии (_worker_game_seen - номер, с которым совпадает таблица процесса)
+_worker_ai = None
+_worker_alpha = None
+_worker_nodes = None
+_worker_stop = None
+_worker_game = None
+_worker_game_seen = 0
+
+
+def difficulty_levels(path=CALIBRATION_PATH):
+    """Уровни сложности с бюджетами, подобранными калибровкой для этой машины (если она была)"""
+    if not os.path.exists(path):
+        return DIFFICULTY_LEVELS
+    with open(path, encoding='utf-8') as f:
+        calibrated = json.load(f).get('levels', {})
+    return {level: {**settings, **calibrated.get(level, {})} for level, settings in DIFFICULTY_LEVELS.items()}
+
+
+def _init_search_worker(settings, shared_alpha, shared_nodes, shared_stop, shared_game):
+    global _worker_ai, _worker_alpha, _worker_nodes, _worker_stop, _worker_game, _worker_game_seen
+    _worker_ai = ChessAI(verbose=False, **settings)
+    _worker_alpha = shared_alpha
+    _worker_nodes = shared_nodes
+    _worker_stop = shared_stop
+    _worker_game = shared_game
+    _worker_game_seen = shared_game.value
+
+
+def _worker_ready():
+    return _worker_ai is not None
+
+
+def _search_root_move(fen, move, depth, alpha, deadline, node_limit=None, noise=(0, 0)):
+    """Оценка одного хода корня; возвращает (ход, оценка или None при остановке, узлы)"""
+    global _worker_game_seen
+    ai = _worker_ai
+    if _worker_game.value != _worker_game_seen:
+        # Главный процесс начал новую партию (или позицию бенчмарка): старые записи не нужны
+        _worker_game_seen = _worker_game.value
+        ai.new_game()
+    ai.nodes_evaluated = 0
+    ai._counted_nodes = 0
+    ai.quiescence_nodes = 0
+    ai._stopped = False
+    ai._deadline = time.perf_counter() + deadline - time.time() if deadline is not None else None
+    ai._node_limit = node_limit
+    ai._node_counter = _worker_nodes if node_limit is not None else None
+    # Флаг остановки проверяется всегда, даже без срока и бюджета (go infinite, размышление)
+    ai._stop_flag = _worker_stop
+    ai._limited = True
+    # Шум оценки тот же, что у главного процесса
+    if ai.eval_noise != noise[0]:
+        ai.set_eval_noise(noise[0])
+    ai._noise_seed = noise[1]
+
+    board = SearchBoard.from_fen(fen)
+    if board.eval_tables is not ai.eval_tables:
+        board.set_eval_tables(ai.eval_tables)
+    ai.color = COLOR_NAMES[board.side]
+    ai.opponent_color = COLOR_NAMES[board.side ^ 1]
+
+    # Поиск уже остановлен, или бюджет узлов израсходовали другие процессы
+    if _worker_stop.value or (node_limit is not None and _worker_nodes.value >= node_limit):
+        return move, None, 0
+
+    # Другие процессы могли уже поднять alpha
+    alpha = max(alpha, _worker_alpha.value)
+    _, value = ai._search_root(board, [move], depth, alpha)
+    if ai._node_counter is not None:
+        # Хвост меньше TIME_CHECK_MASK узлов, не дошедший до _check_limits
+        ai._count_shared_nodes()
+    if ai._stopped:
+        return move, None, ai.nodes_evaluated
+
+    if value <= alpha:
+        # Отсечение снизу дает только верхнюю границу: ход не лучше уже найденного
+        return move, -math.inf, ai.nodes_evaluated
+
+    with _worker_alpha.get_lock():
+        if value > _worker_alpha.value:
+            _worker_alpha.value = value
+    return move, value, ai.nodes_evaluated
+
+
+if __name__ == '__main__':
+    import argparse
+
+    parser = argparse.ArgumentParser(description='ChessAI без графического интерфейса')
+    parser.add_argument('--uci', action='store_true', help='работать как UCI-движок через stdin/stdout')
+    args = parser.parse_args()
+    if not args.uci:
+        parser.print_help()
+        sys.exit(2)
+
+    from uci import main
+    sys.exit(main())
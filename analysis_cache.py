@@ -0,0 +1,124 @@
+"""Постоянный кэш анализа: результаты поиска по позициям в файле SQLite.
+
+Таблица транспозиций живет только в памяти процесса, а кэш переживает
+перезапуски и общий для всех процессов (журнал WAL, ожидание блокировки).
+ChessAI читает позицию корня перед поиском и записывает главный вариант
+после него. Записей не больше max_entries: при переполнении удаляются
+давно не использованные, причем каждый полуход глубины продлевает жизнь
+записи на DEPTH_BONUS_SECONDS. Время использования обновляется не чаще
+раза в TOUCH_INTERVAL_SECONDS, чтобы чтение почти никогда не брало блокировку
+записи общей базы.
+"""
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+
+DEFAULT_MAX_ENTRIES = 1_000_000
+DEPTH_BONUS_SECONDS = 3600
+# Найденная запись, использованная позже этого, не переписывается
+TOUCH_INTERVAL_SECONDS = 600
+# При переполнении удаляется с запасом, чтобы не чистить кэш после каждого поиска
+PRUNE_FRACTION = 0.1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS positions (
+    key INTEGER PRIMARY KEY,
+    depth INTEGER NOT NULL,
+    score REAL NOT NULL,
+    flag INTEGER NOT NULL,
+    move INTEGER,
+    used REAL NOT NULL
+)
+"""
+
+_UPSERT = """
+INSERT INTO positions (key, depth, score, flag, move, used) VALUES (?, ?, ?, ?, ?, ?)
+ON CONFLICT(key) DO UPDATE SET depth = excluded.depth, score = excluded.score, flag = excluded.flag,
+    move = excluded.move, used = excluded.used
+WHERE excluded.depth >= positions.depth
+"""
+
+
+def params_salt(params):
+    """Число, смешиваемое с ключами: кэши разных параметров оценки не пересекаются"""
+    digest = hashlib.sha1(json.dumps(params, sort_keys=True).encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big')
+
+
+class AnalysisCache:
+
+    def __init__(self, path, max_entries=DEFAULT_MAX_ENTRIES, salt=0):
+        self.path = path
+        self.max_entries = max_entries
+        self.salt = salt
+        # ChessAI создается в одном потоке, а ищет в другом (GUI, UCI): соединение общее, под замком
+        self.connection = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._lock = threading.RLock()
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        self.connection.execute('PRAGMA synchronous=NORMAL')
+        with self.connection:
+            self.connection.execute(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+        # Сколько записей добавлено с последней проверки размера
+        self._stored = max_entries
+
+    def _key(self, key):
+        # В SQLite INTEGER знаковый
+        key ^= self.salt
+        return key - (1 << 64) if key >= 1 << 63 else key
+
+    def get(self, key):
+        """(depth, score, flag, move) или None; найденная запись считается использованной"""
+        key = self._key(key)
+        with self._lock:
+            row = self.connection.execute('SELECT depth, score, flag, move, used FROM positions WHERE key = ?',
+                                          (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            now = time.time()
+            if now - row[4] >= TOUCH_INTERVAL_SECONDS:
+                with self.connection:
+                    self.connection.execute('UPDATE positions SET used = ? WHERE key = ?', (now, key))
+        depth, score, flag, move, _ = row
+        return depth, int(score) if score.is_integer() else score, flag, move
+
+    def store_many(self, entries):
+        """Записи (key, depth, score, flag, move); более мелкий результат не заменяет глубокий"""
+        now = time.time()
+        rows = [(self._key(key), depth, score, flag, move, now)
+                for key, depth, score, flag, move in entries if math.isfinite(score)]
+        if not rows:
+            return
+        with self._lock:
+            with self.connection:
+                self.connection.executemany(_UPSERT, rows)
+            self._stored += len(rows)
+            if self._stored >= self.max_entries * PRUNE_FRACTION:
+                self.prune()
+
+    def prune(self):
+        with self._lock:
+            self._stored = 0
+            count = self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+            if count <= self.max_entries:
+                return
+            excess = count - self.max_entries + int(self.max_entries * PRUNE_FRACTION)
+            with self.connection:
+                self.connection.execute(
+                    'DELETE FROM positions WHERE key IN '
+                    '(SELECT key FROM positions ORDER BY used + depth * ? LIMIT ?)',
+                    (DEPTH_BONUS_SECONDS, excess))
+
+    def __len__(self):
+        with self._lock:
+            return self.connection.execute('SELECT COUNT(*) FROM positions').fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self.connection.close()
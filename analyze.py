@@ -0,0 +1,235 @@
+"""Пакетный анализ позиций из EPD/FEN и PGN в пуле процессов.
+
+    python analyze.py archive.pgn -o analysis.jsonl --depth 5 --workers 8
+    python analyze.py positions.epd -o analysis.csv --movetime 200 --resume
+
+Позиции читаются генератором, в работе одновременно не больше
+--max-pending позиций, а результаты пишутся в порядке входного файла,
+поэтому память не растет с размером архива. Раз в --checkpoint-every
+позиций рядом с выходным файлом сохраняется контрольная точка (сколько
+позиций записано и длина файла); --resume продолжает с нее.
+"""
+import argparse
+import csv
+import io
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from ai_player import ChessAI
+from analysis_cache import DEFAULT_MAX_ENTRIES
+from pgn import parse_san, read_games
+from search_board import BLACK, KING, PAWN, START_FEN, WHITE, SearchBoard
+
+FIELDS = ('id', 'fen', 'best_move', 'score', 'depth', 'nodes', 'time')
+
+
+def iter_positions(path, every=1, skip_plies=0):
+    """(id, FEN) по одной позиции: строки EPD/FEN или позиции партий PGN"""
+    if path.lower().endswith('.pgn'):
+        for game_number, (headers, sans) in enumerate(read_games(path), start=1):
+            board = SearchBoard.from_fen(headers.get('FEN', START_FEN))
+            for ply, san in enumerate(sans):
+                if ply >= skip_plies and (ply - skip_plies) % every == 0:
+                    yield f'{game_number}:{ply}', board.fen()
+                try:
+                    board.make_move(parse_san(board, san))
+                except ValueError:
+                    break
+        return
+
+    with open(path, encoding='utf-8') as f:
+        for line_number, line in enumerate(f, start=1):
+            fields = line.split()
+            if not fields or line.startswith('#'):
+                continue
+            if len(fields) >= 6 and fields[4].isdigit() and fields[5].isdigit():
+                yield str(line_number), ' '.join(fields[:6])
+                continue
+            # EPD: четыре поля позиции, дальше операции вида id "...";
+            position_id = str(line_number)
+            operations = ' '.join(fields[4:])
+            if 'id "' in operations:
+                position_id = operations.split('id "', 1)[1].split('"', 1)[0]
+            yield position_id, ' '.join(fields[:4])
+
+
+# ChessAI процесса пула: создается один раз, таблица транспозиций общая для его позиций
+_analyzer = None
+_movetime = None
+
+
+def _init_worker(ai_options, movetime):
+    global _analyzer, _movetime
+    _analyzer = ChessAI(verbose=False, book_path=None, **ai_options)
+    _movetime = movetime
+
+
+def _is_valid_position(board):
+    """По королю у каждой стороны, пешек нет на крайних горизонталях,
+    и сторона, которая не ходит, не под шахом"""
+    if any(len(board.piece_lists[KING | (color << 3)]) != 1 for color in (WHITE, BLACK)):
+        return False
+    if any(not 8 <= sq < 56 for color in (WHITE, BLACK) for sq in board.piece_lists[PAWN | (color << 3)]):
+        return False
+    return not board.is_square_attacked(board.king_square(board.side ^ 1), board.side)
+
+
+def analyze_position(position_id, fen):
+    result = dict.fromkeys(FIELDS)
+    result.update(id=position_id, fen=fen)
+    try:
+        board = SearchBoard.from_fen(fen)
+    except (ValueError, IndexError, KeyError):
+        # Битая строка входного файла не должна останавливать весь прогон
+        return result
+    if not _is_valid_position(board):
+        return result
+    try:
+        _analyzer.get_best_move(board, time_limit=_movetime)
+    except Exception:
+        # Любая позиция, которую движок не смог разобрать, дает пустую строку, а не обрывает прогон
+        return result
+    stats = _analyzer.stats
+    result.update(best_move=stats['move'], score=stats['score'], depth=stats['depth'],
+                  nodes=stats['nodes'], time=stats['time'])
+    return result
+
+
+class ResultWriter:
+    """Пишет результаты в JSONL или CSV и знает смещение конца последней записи"""
+
+    def __init__(self, path, output_format, offset=None):
+        self.format = output_format
+        exists = os.path.exists(path) and offset is not None
+        self.file = open(path, 'r+b' if exists else 'wb')
+        if exists:
+            # Все, что дописано после контрольной точки, будет посчитано заново
+            self.file.truncate(offset)
+            self.file.seek(offset)
+        elif output_format == 'csv':
+            self._write_row(FIELDS)
+
+    def _write_row(self, values):
+        buffer = io.StringIO()
+        csv.writer(buffer, lineterminator='\n').writerow(values)
+        self.file.write(buffer.getvalue().encode('utf-8'))
+
+    def write(self, result):
+        if self.format == 'csv':
+            self._write_row([result[field] if result[field] is not None else '' for field in FIELDS])
+        else:
+            self.file.write((json.dumps(result, ensure_ascii=False) + '\n').encode('utf-8'))
+
+    def flush(self):
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        return self.file.tell()
+
+    def close(self):
+        self.file.close()
+
+
+def _load_checkpoint(path, input_path):
+    if not os.path.exists(path):
+        return 0, None
+    with open(path, encoding='utf-8') as f:
+        checkpoint = json.load(f)
+    if checkpoint.get('input') != os.path.abspath(input_path):
+        raise SystemExit(f'Контрольная точка {path} относится к другому файлу: {checkpoint.get("input")}')
+    return checkpoint['done'], checkpoint['offset']
+
+
+def _save_checkpoint(path, input_path, done, offset):
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump({'input': os.path.abspath(input_path), 'done': done, 'offset': offset}, f)
+    os.replace(temporary, path)
+
+
+def run_analysis(input_path, output_path, output_format='jsonl', workers=None, ai_options=None, movetime=None,
+                 every=1, skip_plies=0, resume=False, checkpoint_every=100, max_pending=None, out=sys.stderr):
+    """Анализирует все позиции файла; возвращает число проанализированных в этом запуске"""
+    checkpoint_path = output_path + '.checkpoint'
+    done, offset = _load_checkpoint(checkpoint_path, input_path) if resume else (0, None)
+    workers = workers or os.cpu_count()
+    max_pending = max_pending or workers * 4
+
+    positions = iter_positions(input_path, every, skip_plies)
+    for _ in range(done):
+        if next(positions, None) is None:
+            break
+
+    writer = ResultWriter(output_path, output_format, offset)
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                   initargs=(ai_options or {}, movetime / 1000 if movetime else None))
+    # Номер позиции -> Future; результаты пишутся строго по порядку номеров
+    pending = {}
+    finished = {}
+    next_index = next_write = done
+    exhausted = False
+    start = time.perf_counter()
+    try:
+        while True:
+            while not exhausted and next_index - next_write < max_pending:
+                position = next(positions, None)
+                if position is None:
+                    exhausted = True
+                    break
+                pending[executor.submit(analyze_position, *position)] = next_index
+                next_index += 1
+            if not pending:
+                break
+
+            completed, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in completed:
+                finished[pending.pop(future)] = future.result()
+
+            while next_write in finished:
+                writer.write(finished.pop(next_write))
+                next_write += 1
+                if (next_write - done) % checkpoint_every == 0:
+                    _save_checkpoint(checkpoint_path, input_path, next_write, writer.flush())
+                    elapsed = time.perf_counter() - start
+                    print(f'{next_write} позиций, {(next_write - done) / elapsed:.1f} поз/с', file=out, flush=True)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        _save_checkpoint(checkpoint_path, input_path, next_write, writer.flush())
+        writer.close()
+
+    return next_write - done
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Пакетный анализ позиций ChessAI')
+    parser.add_argument('input', help='файл EPD/FEN (позиция на строку) или PGN')
+    parser.add_argument('-o', '--output', required=True, help='файл результатов (.jsonl или .csv)')
+    parser.add_argument('--format', choices=('jsonl', 'csv'), help='по умолчанию - по расширению файла')
+    parser.add_argument('--depth', type=int, default=4, help='глубина поиска')
+    parser.add_argument('--movetime', type=int, help='мс на позицию (вместо фиксированной глубины)')
+    parser.add_argument('--nodes', type=int, help='бюджет узлов на позицию (вместо фиксированной глубины)')
+    parser.add_argument('--tt-size-mb', type=int, default=16, help='таблица транспозиций каждого процесса')
+    parser.add_argument('--cache', help='постоянный кэш анализа SQLite, общий для процессов и запусков')
+    parser.add_argument('--cache-entries', type=int, default=DEFAULT_MAX_ENTRIES, help='размер кэша в записях')
+    parser.add_argument('--workers', type=int, default=None, help='процессов (по умолчанию все ядра)')
+    parser.add_argument('--every', type=int, default=1, help='PGN: каждая N-я позиция партии')
+    parser.add_argument('--skip-plies', type=int, default=0, help='PGN: пропустить первые полуходы')
+    parser.add_argument('--resume', action='store_true', help='продолжить с контрольной точки')
+    parser.add_argument('--checkpoint-every', type=int, default=100, help='позиций между контрольными точками')
+    parser.add_argument('--max-pending', type=int, default=None,
+                        help='позиций в работе одновременно (по умолчанию 4 на процесс)')
+    args = parser.parse_args(argv)
+
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    ai_options = {'depth': args.depth, 'tt_size_mb': args.tt_size_mb, 'node_limit': args.nodes,
+                  'cache_path': args.cache, 'cache_entries': args.cache_entries}
+    analyzed = run_analysis(args.input, args.output, output_format, args.workers, ai_options, args.movetime,
+                            args.every, args.skip_plies, args.resume, args.checkpoint_every, args.max_pending)
+    print(f'Готово: {analyzed} позиций -> {args.output}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
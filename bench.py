@@ -0,0 +1,212 @@
+"""Бенчмарк без окна pygame: perft и поиск ChessAI с отчетом в JSON.
+
+    python bench.py --perft-depth 4 --search-depth 4 --output bench.json
+    python bench.py --perft-depth 0 --search-depth 5 --disable null_move --disable lmr
+    python bench.py --calibrate    # скорость машины и бюджеты уровней сложности в calibration.json
+"""
+import argparse
+import json
+import platform
+import sys
+import time
+
+from ai_player import CALIBRATION_PATH, DIFFICULTY_LEVELS, ChessAI
+from movegen import PERFT_SUITE, perft
+from search_board import SearchBoard, move_to_uci
+
+# Приемы поиска ChessAI, которые можно выключить для сравнения
+SEARCH_FEATURES = ('pvs', 'null_move', 'lmr', 'check_extensions')
+
+# Узлов на позицию при калибровке
+CALIBRATION_NODES = 20000
+
+# Позиции для поиска на фиксированную глубину
+SEARCH_SUITE = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'),
+    ('italian', 'r1bqk1nr/pppp1ppp/2n5/2b1p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4'),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10'),
+    ('tactics', 'r1b1kb1r/pppp1ppp/5q2/4n3/3KP3/2N3PN/PPP4P/R1BQ1B1R b kq - 0 1'),
+    ('rook_endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1'),
+    ('pawn_endgame', '8/8/4k3/8/2p5/8/B2P2K1/8 w - - 0 1'),
+    ('queen_endgame', '6k1/5pp1/7p/8/8/1Q5P/5PPK/q7 b - - 0 1'),
+]
+
+
+def run_perft(max_depth):
+    results = []
+    for name, fen, expected in PERFT_SUITE:
+        board = SearchBoard.from_fen(fen)
+        depth = min(max_depth, len(expected))
+        start = time.perf_counter()
+        nodes = perft(board, depth)
+        elapsed = time.perf_counter() - start
+        results.append({
+            'name': name,
+            'depth': depth,
+            'nodes': nodes,
+            'expected': expected[depth - 1],
+            'ok': nodes == expected[depth - 1],
+            'time': round(elapsed, 4),
+            'nps': int(nodes / elapsed) if elapsed else 0,
+        })
+    return results
+
+
+def _branching_factor(iterations):
+    """Эффективный коэффициент ветвления: узлы(d) / узлы(d - 1) для последней пары итераций"""
+    per_depth = []
+    previous = 0
+    for iteration in iterations:
+        per_depth.append(iteration['nodes'] - previous)
+        previous = iteration['nodes']
+    if len(per_depth) < 2 or not per_depth[-2]:
+        return None
+    return round(per_depth[-1] / per_depth[-2], 2)
+
+
+def run_search(depth, tt_size_mb=16, **ai_options):
+    # Ходы из книги не показывают скорость поиска
+    ai_options.setdefault('book_path', None)
+    # Один ChessAI на весь набор: процессы параллельного поиска создаются до замеров,
+    # а new_game перед каждой позицией начинает ее с пустой таблицы транспозиций
+    ai = ChessAI(depth=depth, tt_size_mb=tt_size_mb, verbose=False, **ai_options)
+    ai.start_workers()
+    results = []
+    for name, fen in SEARCH_SUITE:
+        ai.new_game()
+        board = SearchBoard.from_fen(fen)
+
+        start = time.perf_counter()
+        ai.get_best_move(board)
+        elapsed = time.perf_counter() - start
+
+        results.append({
+            'name': name,
+            'depth': ai.completed_depth,
+            'nodes': ai.nodes_evaluated,
+            'time': round(elapsed, 4),
+            'nps': int(ai.nodes_evaluated / elapsed) if elapsed else 0,
+            'time_to_depth': [round(iteration['time'], 4) for iteration in ai.iterations],
+            'nodes_to_depth': [iteration['nodes'] for iteration in ai.iterations],
+            'tt_hit_rate': round(ai.stats['tt']['hit_rate'], 4),
+            'tt_overwrites': ai.stats['tt']['overwrites'],
+            'first_move_cutoff_rate': ai.stats['first_move_cutoff_rate'],
+            'quiescence_share': ai.stats['quiescence_share'],
+            'branching_factor': _branching_factor(ai.iterations),
+            'best_move': move_to_uci(ai.best_move) if ai.best_move is not None else None,
+            'score': ai.best_value,
+        })
+    ai.close()
+    return results
+
+
+def _totals(results):
+    nodes = sum(result['nodes'] for result in results)
+    elapsed = sum(result['time'] for result in results)
+    return {'nodes': nodes, 'time': round(elapsed, 4), 'nps': int(nodes / elapsed) if elapsed else 0}
+
+
+def compare_workers(search_depth, workers, tt_size_mb=16, **ai_options):
+    """Ускорение параллельного поиска относительно одного процесса на тех же позициях"""
+    serial = run_search(search_depth, tt_size_mb, **ai_options)
+    parallel = run_search(search_depth, tt_size_mb, workers=workers, **ai_options)
+    positions = []
+    for one, many in zip(serial, parallel):
+        positions.append({
+            'name': one['name'],
+            'time_1': one['time'],
+            f'time_{workers}': many['time'],
+            'speedup': round(one['time'] / many['time'], 2) if many['time'] else None,
+            'nodes_1': one['nodes'],
+            f'nodes_{workers}': many['nodes'],
+            'same_move': one['best_move'] == many['best_move'],
+        })
+    serial_time = sum(result['time'] for result in serial)
+    parallel_time = sum(result['time'] for result in parallel)
+    return {
+        'workers': workers,
+        'positions': positions,
+        'speedup': round(serial_time / parallel_time, 2) if parallel_time else None,
+    }
+
+
+def calibrate(path=CALIBRATION_PATH, nodes=CALIBRATION_NODES):
+    """Скорость поиска на этой машине; бюджет уровня урезается, если он дольше max_seconds"""
+    total_nodes = 0
+    total_time = 0.0
+    for name, fen in SEARCH_SUITE:
+        ai = ChessAI(verbose=False, book_path=None, node_limit=nodes)
+        start = time.perf_counter()
+        ai.get_best_move(SearchBoard.from_fen(fen))
+        total_time += time.perf_counter() - start
+        total_nodes += ai.nodes_evaluated
+        ai.close()
+
+    nps = int(total_nodes / total_time)
+    calibration = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'nps': nps,
+        'levels': {level: {'nodes': min(settings['nodes'], int(nps * settings['max_seconds']))}
+                   for level, settings in DIFFICULTY_LEVELS.items()},
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(calibration, f, indent=2, ensure_ascii=False)
+        f.write('\n')
+    return calibration
+
+
+def run_benchmark(perft_depth=3, search_depth=3, tt_size_mb=16, workers=1, **ai_options):
+    report = {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+    }
+    if perft_depth:
+        perft_results = run_perft(perft_depth)
+        report['perft'] = {'positions': perft_results, 'total': _totals(perft_results),
+                           'ok': all(result['ok'] for result in perft_results)}
+    if search_depth:
+        search_results = run_search(search_depth, tt_size_mb, **ai_options)
+        report['search'] = {'positions': search_results, 'total': _totals(search_results)}
+    if search_depth and workers > 1:
+        report['parallel'] = compare_workers(search_depth, workers, tt_size_mb, **ai_options)
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Бенчмарк генератора ходов и поиска ChessAI')
+    parser.add_argument('--perft-depth', type=int, default=3, help='глубина perft (0 - пропустить)')
+    parser.add_argument('--search-depth', type=int, default=3, help='глубина поиска (0 - пропустить)')
+    parser.add_argument('--tt-size-mb', type=int, default=16, help='размер таблицы транспозиций')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='сравнить поиск в N процессах с одним процессом')
+    parser.add_argument('--disable', action='append', default=[], choices=SEARCH_FEATURES,
+                        help='выключить прием поиска (можно указать несколько раз)')
+    parser.add_argument('--output', help='файл для JSON (по умолчанию stdout)')
+    parser.add_argument('--calibrate', action='store_true',
+                        help='измерить скорость машины и записать бюджеты уровней сложности')
+    parser.add_argument('--calibration-file', default=CALIBRATION_PATH)
+    args = parser.parse_args(argv)
+
+    if args.calibrate:
+        print(json.dumps(calibrate(args.calibration_file), indent=2, ensure_ascii=False))
+        return 0
+
+    ai_options = {feature: False for feature in args.disable}
+    report = run_benchmark(args.perft_depth, args.search_depth, args.tt_size_mb, args.workers, **ai_options)
+    if ai_options:
+        report['disabled'] = sorted(ai_options)
+
+    text = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    return 0 if report.get('perft', {}).get('ok', True) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
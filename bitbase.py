@@ -0,0 +1,302 @@
+"""Эндшпильные базы KQK, KRK и KPK, построенные ретроградным анализом.
+
+    python bitbase.py build                  # все таблицы в каталог bitbases/
+    python bitbase.py probe --fen "8/8/8/4k3/8/8/4P3/4K3 w - - 0 1"
+
+Таблица хранит по байту на позицию: выигрыш, ничья или проигрыш для
+стороны, которая ходит, и число полуходов до мата. Позиция записывается
+для сильной стороны белыми (у черных доска отражается), индекс -
+(очередь хода, белый король, черный король, фигура), 2 * 64^3 байт.
+Файлы открываются через mmap, поэтому проверка позиции в поиске - одно
+чтение байта.
+"""
+import argparse
+import mmap
+import os
+import sys
+import time
+
+from bitboards import KING_ATTACKS, PAWN_ATTACKS, bishop_attacks, iter_squares, lsb, popcount, rook_attacks
+from movegen import generate_moves
+from search_board import BISHOP, BLACK, KING, KNIGHT, PAWN, QUEEN, ROOK, WHITE, SearchBoard, move_to_uci
+
+DEFAULT_BITBASE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'bitbases')
+
+# Таблица по типу единственной фигуры сильной стороны; KPK строится после KQK и KRK (превращения)
+TABLES = {'KQK': QUEEN, 'KRK': ROOK, 'KPK': PAWN}
+TABLE_SIZE = 2 * 64 * 64 * 64
+
+WIN = 1
+DRAW = 0
+LOSS = -1
+
+# Байт таблицы: 0 - ничья (или невозможная позиция), 1..127 - выигрыш за столько полуходов,
+# 128 + n - мат через n полуходов
+LOSS_BASE = 128
+
+
+def position_index(side, white_king, black_king, piece):
+    return (side << 18) | (white_king << 12) | (black_king << 6) | piece
+
+
+def decode(value):
+    """Байт таблицы -> (WIN/DRAW/LOSS, полуходов до мата)"""
+    if value == 0:
+        return DRAW, 0
+    if value < LOSS_BASE:
+        return WIN, value
+    return LOSS, value - LOSS_BASE
+
+
+def _piece_attacks(piece_type, sq, occupied):
+    if piece_type == PAWN:
+        return PAWN_ATTACKS[WHITE][sq]
+    if piece_type == ROOK:
+        return rook_attacks(sq, occupied)
+    return rook_attacks(sq, occupied) | bishop_attacks(sq, occupied)
+
+
+def generate_table(piece_type, promotions=None):
+    """Таблица (bytearray) для белых король + фигура против черного короля.
+
+    promotions - готовые таблицы {QUEEN: ..., ROOK: ...} для превращений в KPK.
+    Поиск в ширину от матов: проигрыш черных через d полуходов дает выигрыш белых
+    через d + 1 во всех позициях, откуда в него есть ход; позиция черных
+    проиграна, когда все ее ходы ведут в выигрыш белых. Взятие фигуры - ничья,
+    поэтому такие ходы никогда не вычитаются из счетчика.
+    """
+    valid = bytearray(TABLE_SIZE)
+    remaining = bytearray(TABLE_SIZE)
+    buckets = [[]]
+
+    def push(distance, index):
+        while len(buckets) <= distance:
+            buckets.append([])
+        buckets[distance].append(index)
+
+    for white_king in range(64):
+        near_white_king = KING_ATTACKS[white_king]
+        for black_king in range(64):
+            if black_king == white_king or near_white_king >> black_king & 1:
+                continue
+            for piece in range(64):
+                if piece in (white_king, black_king) or (piece_type == PAWN and not 8 <= piece < 56):
+                    continue
+                occupied = (1 << white_king) | (1 << black_king) | (1 << piece)
+                in_check = _piece_attacks(piece_type, piece, occupied) >> black_king & 1
+
+                # Ход черных: король не ходит под бой; взятие незащищенной фигуры тоже ход
+                black_to_move = position_index(1, white_king, black_king, piece)
+                valid[black_to_move] = 1
+                moves = 0
+                for target in iter_squares(KING_ATTACKS[black_king] & ~near_white_king):
+                    if target != piece and _piece_attacks(
+                            piece_type, piece, (1 << white_king) | (1 << target) | (1 << piece)) >> target & 1:
+                        continue
+                    moves += 1
+                remaining[black_to_move] = moves
+                if not moves and in_check:
+                    push(0, black_to_move)
+
+                # Ход белых возможен, только если черный король не под шахом
+                if in_check:
+                    continue
+                white_to_move = position_index(0, white_king, black_king, piece)
+                valid[white_to_move] = 1
+                if piece_type == PAWN and piece < 16 and piece - 8 not in (white_king, black_king):
+                    # Превращение: ход в готовую таблицу ферзя или ладьи
+                    for table in promotions.values():
+                        result, distance = decode(table[position_index(1, white_king, black_king, piece - 8)])
+                        if result == LOSS:
+                            push(distance + 1, white_to_move)
+
+    table = bytearray(TABLE_SIZE)
+    done = bytearray(TABLE_SIZE)
+    distance = 0
+    while distance < len(buckets):
+        for index in buckets[distance]:
+            if done[index]:
+                continue
+            done[index] = 1
+            white_king, black_king, piece = (index >> 12) & 63, (index >> 6) & 63, index & 63
+            occupied = (1 << white_king) | (1 << black_king) | (1 << piece)
+
+            if index >> 18:
+                # Черные проигрывают: в эту позицию ведут выигрывающие ходы белых
+                table[index] = LOSS_BASE + distance
+                for source in iter_squares(KING_ATTACKS[white_king] & ~occupied):
+                    predecessor = position_index(0, source, black_king, piece)
+                    if valid[predecessor] and not done[predecessor]:
+                        push(distance + 1, predecessor)
+                if piece_type == PAWN:
+                    sources = []
+                    if piece < 48 and not occupied >> (piece + 8) & 1:
+                        sources.append(piece + 8)
+                        if 32 <= piece < 40 and not occupied >> (piece + 16) & 1:
+                            sources.append(piece + 16)
+                else:
+                    sources = iter_squares(_piece_attacks(piece_type, piece, occupied) & ~occupied)
+                for source in sources:
+                    predecessor = position_index(0, white_king, black_king, source)
+                    if valid[predecessor] and not done[predecessor]:
+                        push(distance + 1, predecessor)
+            else:
+                # Белые выигрывают: у черных, пришедших сюда, одним спасительным ходом меньше
+                table[index] = distance
+                for source in iter_squares(KING_ATTACKS[black_king] & ~occupied):
+                    predecessor = position_index(1, white_king, source, piece)
+                    if valid[predecessor] and not done[predecessor]:
+                        remaining[predecessor] -= 1
+                        if not remaining[predecessor]:
+                            push(distance + 1, predecessor)
+        distance += 1
+
+    assert len(buckets) < LOSS_BASE
+    return table
+
+
+def build_tables(directory=DEFAULT_BITBASE_DIR, names=tuple(TABLES), out=sys.stderr):
+    """Строит и записывает таблицы names; KPK тянет за собой KQK и KRK - без них
+    выигрыши через превращение выглядели бы ничьими"""
+    os.makedirs(directory, exist_ok=True)
+    built = {}
+    for name, piece_type in TABLES.items():
+        if name not in names and not (piece_type != PAWN and 'KPK' in names):
+            continue
+        start = time.perf_counter()
+        promotions = {QUEEN: built['KQK'], ROOK: built['KRK']} if piece_type == PAWN else None
+        built[name] = generate_table(piece_type, promotions)
+        with open(os.path.join(directory, name + '.bin'), 'wb') as f:
+            f.write(built[name])
+        print(f'{name}: {time.perf_counter() - start:.1f} с', file=out)
+
+
+class Bitbases:
+    """Таблицы из каталога (те, что найдены); probe - результат позиции SearchBoard"""
+
+    def __init__(self, directory=DEFAULT_BITBASE_DIR):
+        self.tables = {}
+        self._files = []
+        for name, piece_type in TABLES.items():
+            path = os.path.join(directory, name + '.bin')
+            if not os.path.exists(path) or os.path.getsize(path) != TABLE_SIZE:
+                continue
+            f = open(path, 'rb')
+            self._files.append(f)
+            self.tables[piece_type] = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def __bool__(self):
+        return bool(self.tables)
+
+    def close(self):
+        for table in self.tables.values():
+            table.close()
+        for f in self._files:
+            f.close()
+        self.tables = {}
+        self._files = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def probe(self, board):
+        """(WIN/DRAW/LOSS для стороны, которая ходит, полуходов до мата) или None, если таблицы нет"""
+        white, black = board.occupied
+        count = popcount(white | black)
+        if count == 2:
+            return DRAW, 0
+        if count != 3:
+            return None
+
+        strong = WHITE if popcount(white) == 2 else BLACK
+        king_code = KING | (strong << 3)
+        piece = lsb(board.occupied[strong] & ~board.bitboards[king_code])
+        table = self.tables.get(board.squares[piece] & 7)
+        if table is None:
+            return None
+
+        strong_king = lsb(board.bitboards[king_code])
+        weak_king = lsb(board.bitboards[KING | ((strong ^ 1) << 3)])
+        side = board.side ^ strong
+        if strong != WHITE:
+            strong_king ^= 56
+            weak_king ^= 56
+            piece ^= 56
+        return decode(table[position_index(side, strong_king, weak_king, piece)])
+
+    @staticmethod
+    def _single_minor(board):
+        """Кроме королей на доске один слон или конь"""
+        white, black = board.occupied
+        if popcount(white | black) != 3:
+            return False
+        kings = board.bitboards[KING] | board.bitboards[KING | 8]
+        return board.squares[lsb((white | black) & ~kings)] & 7 in (KNIGHT, BISHOP)
+
+    def choose(self, board):
+        """Лучший ход по таблице: быстрейший мат, иначе ничья, иначе самое долгое сопротивление.
+
+        (ход, результат, полуходов) или None, если позиции нет в таблицах или
+        какой-то ход ведет в позицию без таблицы (тогда ход выбирает поиск).
+        """
+        if self.probe(board) is None:
+            return None
+        best = None
+        for move in generate_moves(board):
+            board.make_move(move)
+            known = self.probe(board)
+            minor_only = known is None and self._single_minor(board)
+            board.unmake_move()
+            if known is None and not minor_only:
+                # Превращение в ферзя или ладью, а их таблицы нет
+                return None
+            # Превращение в слона или коня - ничья
+            result, distance = known if known is not None else (DRAW, 0)
+            rank = (result, -distance if result == WIN else distance)
+            if best is None or rank < best[0]:
+                best = (rank, move, -result, distance + 1 if result else 0)
+        if best is None:
+            return None
+        return best[1:]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Эндшпильные базы ChessAI')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    build = subparsers.add_parser('build', help='построить таблицы ретроградным анализом')
+    build.add_argument('tables', nargs='*', help=f'из {", ".join(TABLES)}; по умолчанию все')
+    build.add_argument('--dir', default=DEFAULT_BITBASE_DIR)
+
+    probe = subparsers.add_parser('probe', help='результат позиции и лучший ход')
+    probe.add_argument('--fen', required=True)
+    probe.add_argument('--dir', default=DEFAULT_BITBASE_DIR)
+
+    args = parser.parse_args(argv)
+    if args.command == 'build':
+        unknown = set(args.tables) - set(TABLES)
+        if unknown:
+            parser.error(f'неизвестные таблицы: {", ".join(sorted(unknown))}')
+        build_tables(args.dir, args.tables or tuple(TABLES))
+        return 0
+
+    with Bitbases(args.dir) as bitbases:
+        board = SearchBoard.from_fen(args.fen)
+        known = bitbases.probe(board)
+        if known is None:
+            print('Позиции нет в таблицах')
+            return 1
+        names = {WIN: 'выигрыш', DRAW: 'ничья', LOSS: 'проигрыш'}
+        result, distance = known
+        print(f'{names[result]}' + (f', мат через {distance} полуходов' if result != DRAW else ''))
+        chosen = bitbases.choose(board)
+        if chosen is not None:
+            print(f'лучший ход: {move_to_uci(chosen[0])}')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
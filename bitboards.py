@@ -0,0 +1,139 @@
+"""Битборды: бит sq = row * 8 + col, строка 0 - восьмая горизонталь"""
+
+FULL = (1 << 64) - 1
+
+# Шаги по направлениям; положительные увеличивают номер поля
+ROOK_DIRECTIONS = ((1, 0), (-1, 0), (0, 1), (0, -1))
+BISHOP_DIRECTIONS = ((1, 1), (1, -1), (-1, 1), (-1, -1))
+
+
+def iter_squares(bb):
+    while bb:
+        low = bb & -bb
+        yield low.bit_length() - 1
+        bb ^= low
+
+
+def lsb(bb):
+    return (bb & -bb).bit_length() - 1
+
+
+def popcount(bb):
+    return bin(bb).count('1')
+
+
+def _step_attacks(steps):
+    table = []
+    for sq in range(64):
+        row, col = sq >> 3, sq & 7
+        bb = 0
+        for dr, dc in steps:
+            r, c = row + dr, col + dc
+            if 0 <= r < 8 and 0 <= c < 8:
+                bb |= 1 << (r * 8 + c)
+        table.append(bb)
+    return table
+
+
+def _ray(sq, dr, dc):
+    bb = 0
+    r, c = (sq >> 3) + dr, (sq & 7) + dc
+    while 0 <= r < 8 and 0 <= c < 8:
+        bb |= 1 << (r * 8 + c)
+        r, c = r + dr, c + dc
+    return bb
+
+
+KNIGHT_ATTACKS = _step_attacks([(1, 2), (2, 1), (-1, 2), (-2, 1), (1, -2), (2, -1), (-1, -2), (-2, -1)])
+KING_ATTACKS = _step_attacks([(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (1, -1), (-1, 1), (-1, -1)])
+# Поля, которые бьет пешка данного цвета с поля sq; белые идут к строке 0
+PAWN_ATTACKS = (_step_attacks([(-1, -1), (-1, 1)]), _step_attacks([(1, -1), (1, 1)]))
+
+# (луч, луч идет к большим номерам полей) для каждого поля
+ROOK_RAYS = [[(_ray(sq, dr, dc), dr * 8 + dc > 0) for dr, dc in ROOK_DIRECTIONS] for sq in range(64)]
+BISHOP_RAYS = [[(_ray(sq, dr, dc), dr * 8 + dc > 0) for dr, dc in BISHOP_DIRECTIONS] for sq in range(64)]
+# Атаки на пустой доске (лучи не пересекаются, поэтому сумма равна объединению)
+ROOK_EMPTY_ATTACKS = [sum(ray for ray, _ in ROOK_RAYS[sq]) for sq in range(64)]
+BISHOP_EMPTY_ATTACKS = [sum(ray for ray, _ in BISHOP_RAYS[sq]) for sq in range(64)]
+
+
+def _build_between():
+    between = [[0] * 64 for _ in range(64)]
+    for sq in range(64):
+        for dr, dc in ROOK_DIRECTIONS + BISHOP_DIRECTIONS:
+            bb = 0
+            r, c = (sq >> 3) + dr, (sq & 7) + dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                target = r * 8 + c
+                between[sq][target] = bb
+                bb |= 1 << target
+                r, c = r + dr, c + dc
+    return between
+
+
+# Поля строго между двумя полями на одной линии (иначе 0)
+BETWEEN = _build_between()
+
+
+def _slider_attacks(rays, occupied):
+    attacks = 0
+    for ray, positive in rays:
+        blockers = ray & occupied
+        if blockers:
+            if positive:
+                first = (blockers & -blockers).bit_length() - 1
+            else:
+                first = blockers.bit_length() - 1
+            # Луч до первой блокирующей фигуры включительно
+            attacks |= ray & ~_ray_beyond(ray, first, positive)
+        else:
+            attacks |= ray
+    return attacks
+
+
+def _ray_beyond(ray, first, positive):
+    if positive:
+        return ray & ~((2 << first) - 1)
+    return ray & ((1 << first) - 1)
+
+
+def _relevant_mask(rays):
+    mask = 0
+    for ray, positive in rays:
+        mask |= ray & ~_ray_end(ray, positive)
+    return mask
+
+
+def _ray_end(ray, positive):
+    if not ray:
+        return 0
+    last = ray.bit_length() - 1 if positive else (ray & -ray).bit_length() - 1
+    return 1 << last
+
+
+# Маски полей, от занятости которых зависят атаки: последнее поле луча не влияет
+ROOK_MASKS = [_relevant_mask(ROOK_RAYS[sq]) for sq in range(64)]
+BISHOP_MASKS = [_relevant_mask(BISHOP_RAYS[sq]) for sq in range(64)]
+
+# Атаки дальнобойных фигур по занятости значимых полей; таблицы
+# заполняются при первом обращении, дальше это один поиск в словаре
+_rook_cache = [{} for _ in range(64)]
+_bishop_cache = [{} for _ in range(64)]
+
+
+def rook_attacks(sq, occupied):
+    occupied &= ROOK_MASKS[sq]
+    cache = _rook_cache[sq]
+    attacks = cache.get(occupied)
+    if attacks is None:
+        attacks = cache[occupied] = _slider_attacks(ROOK_RAYS[sq], occupied)
+    return attacks
+
+
+def bishop_attacks(sq, occupied):
+    occupied &= BISHOP_MASKS[sq]
+    cache = _bishop_cache[sq]
+    attacks = cache.get(occupied)
+    if attacks is None:
+        attacks = cache[occupied] = _slider_attacks(BISHOP_RAYS[sq], occupied)
+    return attacks
@@ -0,0 +1,221 @@
+"""Дебютная книга в формате Polyglot (.bin).
+
+Запись книги - 16 байт big-endian: ключ позиции (8), ход (2), вес (2),
+поле learn (4); записи отсортированы по ключу. Файл открывается через
+mmap и ищется двоичным поиском, поэтому книга не читается в память.
+
+Ключ позиции - стандартный ключ Polyglot (polyglot_key, числа Random64 из
+zobrist.py), а не Zobrist поиска, поэтому подходят книги других программ.
+Книгу из своих партий строит команда build:
+
+    python book.py build games.pgn -o book.bin --max-ply 24
+    python book.py probe book.bin --fen "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+"""
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+
+from bitboards import PAWN_ATTACKS
+from movegen import generate_moves
+from pgn import parse_san, read_games
+from search_board import (CASTLING_ROOKS, FLAG_CASTLING, PAWN, PROMOTION_SHIFT, START_FEN, WHITE, SearchBoard,
+                          move_to_uci)
+from zobrist import POLYGLOT_RANDOM64
+
+ENTRY = struct.Struct('>QHHI')
+ENTRY_SIZE = ENTRY.size
+
+DEFAULT_BOOK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'book.bin')
+
+# Вес хода при построении: победа стороны, сделавшей ход, и ничья
+WIN_WEIGHT = 2
+DRAW_WEIGHT = 1
+MAX_WEIGHT = 0xFFFF
+
+POLYGLOT_CASTLING = 768
+POLYGLOT_EN_PASSANT = 772
+POLYGLOT_TURN = 780
+
+
+def polyglot_key(board):
+    """Ключ Polyglot позиции SearchBoard.
+
+    Вид фигуры - 2 * (тип - 1) + 1 у белых, поля считаются от a1; вертикаль
+    взятия на проходе учитывается, только если рядом стоит пешка стороны,
+    которая ходит (легальность взятия не важна).
+    """
+    key = 0
+    for code, squares in enumerate(board.piece_lists):
+        if not squares:
+            continue
+        base = 64 * (2 * ((code & 7) - 1) + (code >> 3 == WHITE))
+        for sq in squares:
+            key ^= POLYGLOT_RANDOM64[base + (sq ^ 56)]
+    # Порядок прав K, Q, k, q совпадает с битами board.castling
+    for bit in range(4):
+        if board.castling & (1 << bit):
+            key ^= POLYGLOT_RANDOM64[POLYGLOT_CASTLING + bit]
+    ep_square = board.ep_square
+    if ep_square is not None and PAWN_ATTACKS[board.side ^ 1][ep_square] & board.bitboards[PAWN | (board.side << 3)]:
+        key ^= POLYGLOT_RANDOM64[POLYGLOT_EN_PASSANT + (ep_square & 7)]
+    if board.side == WHITE:
+        key ^= POLYGLOT_RANDOM64[POLYGLOT_TURN]
+    return key
+
+
+def encode_book_move(move):
+    """Ход SearchBoard -> 16-битный ход Polyglot (горизонтали от первой, рокировка - король берет ладью)"""
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    if move & FLAG_CASTLING:
+        to_sq = CASTLING_ROOKS[to_sq][0]
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    return ((to_sq & 7) | ((7 - (to_sq >> 3)) << 3) | ((from_sq & 7) << 6) | ((7 - (from_sq >> 3)) << 9)
+            | ((promotion - 1 if promotion else 0) << 12))
+
+
+class OpeningBook:
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        if size % ENTRY_SIZE:
+            self._file.close()
+            raise ValueError(f'{path}: размер {size} не кратен записи Polyglot ({ENTRY_SIZE} байт)')
+        # mmap не умеет отображать пустой файл
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._count = size // ENTRY_SIZE
+
+    def __len__(self):
+        return self._count
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def close(self):
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    def entries(self, key):
+        """Записи (ход Polyglot, вес, learn) для позиции с ключом key"""
+        low, high = 0, self._count
+        while low < high:
+            middle = (low + high) // 2
+            if ENTRY.unpack_from(self._map, middle * ENTRY_SIZE)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+
+        entries = []
+        for index in range(low, self._count):
+            entry_key, move, weight, learn = ENTRY.unpack_from(self._map, index * ENTRY_SIZE)
+            if entry_key != key:
+                break
+            entries.append((move, weight, learn))
+        return entries
+
+    def moves(self, board):
+        """Легальные ходы книги для позиции SearchBoard: [(ход, вес)]"""
+        entries = self.entries(polyglot_key(board))
+        if not entries:
+            return []
+        legal = {encode_book_move(move): move for move in generate_moves(board)}
+        return [(legal[book_move], weight) for book_move, weight, _ in entries
+                if weight and book_move in legal]
+
+    def choose(self, board, rng=random):
+        """Случайный ход книги с вероятностью, пропорциональной весу (None - позиции нет в книге)"""
+        moves = self.moves(board)
+        if not moves:
+            return None
+        return rng.choices([move for move, _ in moves], weights=[weight for _, weight in moves])[0]
+
+
+def build_book(pgn_paths, out_path, max_ply=24, min_games=2, out=sys.stdout):
+    """Строит книгу из партий PGN; ход попадает в книгу, если встретился хотя бы в min_games партиях"""
+    # ключ Polyglot -> ход Polyglot -> [партии, очки]
+    positions = {}
+    games = skipped = 0
+    for path in pgn_paths:
+        for headers, sans in read_games(path):
+            result = headers.get('Result', '*')
+            if result not in ('1-0', '0-1', '1/2-1/2'):
+                skipped += 1
+                continue
+            games += 1
+
+            board = SearchBoard.from_fen(headers.get('FEN', START_FEN))
+            for san in sans[:max_ply]:
+                try:
+                    move = parse_san(board, san)
+                except ValueError:
+                    break
+                if result == '1/2-1/2':
+                    score = DRAW_WEIGHT
+                else:
+                    score = WIN_WEIGHT if (result == '1-0') == (board.side == WHITE) else 0
+                stats = positions.setdefault(polyglot_key(board), {}).setdefault(encode_book_move(move), [0, 0])
+                stats[0] += 1
+                stats[1] += score
+                board.make_move(move)
+
+    entries = []
+    for key, moves in positions.items():
+        for book_move, (count, score) in moves.items():
+            if count >= min_games and score:
+                entries.append((key, book_move, score))
+
+    # Веса должны поместиться в 16 бит
+    top = max((score for _, _, score in entries), default=0)
+    scale = MAX_WEIGHT / top if top > MAX_WEIGHT else 1
+
+    entries.sort(key=lambda entry: (entry[0], -entry[2]))
+    with open(out_path, 'wb') as f:
+        for key, book_move, score in entries:
+            f.write(ENTRY.pack(key, book_move, max(1, int(score * scale)), 0))
+
+    print(f'{games} партий ({skipped} без результата пропущено), '
+          f'{len({entry[0] for entry in entries})} позиций, {len(entries)} ходов -> {out_path}', file=out)
+    return len(entries)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Дебютная книга ChessAI')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    build = commands.add_parser('build', help='построить книгу из файлов PGN')
+    build.add_argument('pgn', nargs='+', help='файлы PGN')
+    build.add_argument('-o', '--output', default=DEFAULT_BOOK_PATH, help='файл книги')
+    build.add_argument('--max-ply', type=int, default=24, help='сколько полуходов партии брать в книгу')
+    build.add_argument('--min-games', type=int, default=2, help='минимум партий с ходом')
+
+    probe = commands.add_parser('probe', help='показать ходы книги для позиции')
+    probe.add_argument('book', nargs='?', default=DEFAULT_BOOK_PATH, help='файл книги')
+    probe.add_argument('--fen', default=None, help='позиция (по умолчанию начальная)')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'build':
+        build_book(args.pgn, args.output, args.max_ply, args.min_games)
+        return 0
+
+    board = SearchBoard.from_fen(args.fen or START_FEN)
+    with OpeningBook(args.book) as book:
+        moves = book.moves(board)
+        total = sum(weight for _, weight in moves)
+        for move, weight in sorted(moves, key=lambda item: -item[1]):
+            print(f'{move_to_uci(move):6} {weight:>6} {100 * weight / total:5.1f}%')
+    return 0 if moves else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,260 @@
+"""Оценка позиции: материал и таблицы полей для миттельшпиля и эндшпиля.
+
+Таблицы записаны для белых, строка 0 - восьмая горизонталь (как на доске
+GUI); для черных поле отражается по вертикали. Итоговая оценка -
+смешение двух фаз по оставшимся фигурам.
+
+Параметры, подобранные tune.py, лежат в eval_params.json рядом с модулем
+и загружаются ChessAI при запуске; без файла действуют DEFAULT_PARAMS.
+"""
+import copy
+import json
+import os
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from zobrist import PIECE_CODES
+
+PIECE_ORDER = ('Pawn', 'Knight', 'Bishop', 'Rook', 'Queen', 'King')
+
+# Вклад фигуры в фазу партии; 24 - все фигуры на доске
+PHASE_WEIGHTS = {'Pawn': 0, 'Knight': 1, 'Bishop': 1, 'Rook': 2, 'Queen': 4, 'King': 0}
+MAX_PHASE = 24
+
+DEFAULT_PARAMS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'eval_params.json')
+
+DEFAULT_PARAMS = {
+    'piece_values_mg': {'Pawn': 100, 'Knight': 320, 'Bishop': 330, 'Rook': 500, 'Queen': 900, 'King': 0},
+    'piece_values_eg': {'Pawn': 120, 'Knight': 300, 'Bishop': 320, 'Rook': 520, 'Queen': 920, 'King': 0},
+    'pst_mg': {
+        'Pawn': [
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [50, 50, 50, 50, 50, 50, 50, 50],
+            [10, 10, 20, 30, 30, 20, 10, 10],
+            [5, 5, 10, 25, 25, 10, 5, 5],
+            [0, 0, 0, 20, 20, 0, 0, 0],
+            [5, -5, -10, 0, 0, -10, -5, 5],
+            [5, 10, 10, -20, -20, 10, 10, 5],
+            [0, 0, 0, 0, 0, 0, 0, 0]
+        ],
+        'Knight': [
+            [-50, -40, -30, -30, -30, -30, -40, -50],
+            [-40, -20, 0, 0, 0, 0, -20, -40],
+            [-30, 0, 10, 15, 15, 10, 0, -30],
+            [-30, 5, 15, 20, 20, 15, 5, -30],
+            [-30, 0, 15, 20, 20, 15, 0, -30],
+            [-30, 5, 10, 15, 15, 10, 5, -30],
+            [-40, -20, 0, 5, 5, 0, -20, -40],
+            [-50, -40, -30, -30, -30, -30, -40, -50]
+        ],
+        'Bishop': [
+            [-20, -10, -10, -10, -10, -10, -10, -20],
+            [-10, 0, 0, 0, 0, 0, 0, -10],
+            [-10, 0, 5, 10, 10, 5, 0, -10],
+            [-10, 5, 5, 10, 10, 5, 5, -10],
+            [-10, 0, 10, 10, 10, 10, 0, -10],
+            [-10, 10, 10, 10, 10, 10, 10, -10],
+            [-10, 5, 0, 0, 0, 0, 5, -10],
+            [-20, -10, -10, -10, -10, -10, -10, -20]
+        ],
+        'Rook': [
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [5, 10, 10, 10, 10, 10, 10, 5],
+            [-5, 0, 0, 0, 0, 0, 0, -5],
+            [-5, 0, 0, 0, 0, 0, 0, -5],
+            [-5, 0, 0, 0, 0, 0, 0, -5],
+            [-5, 0, 0, 0, 0, 0, 0, -5],
+            [-5, 0, 0, 0, 0, 0, 0, -5],
+            [0, 0, 0, 5, 5, 0, 0, 0]
+        ],
+        'Queen': [
+            [-20, -10, -10, -5, -5, -10, -10, -20],
+            [-10, 0, 0, 0, 0, 0, 0, -10],
+            [-10, 0, 5, 5, 5, 5, 0, -10],
+            [-5, 0, 5, 5, 5, 5, 0, -5],
+            [0, 0, 5, 5, 5, 5, 0, -5],
+            [-10, 5, 5, 5, 5, 5, 0, -10],
+            [-10, 0, 5, 0, 0, 0, 0, -10],
+            [-20, -10, -10, -5, -5, -10, -10, -20]
+        ],
+        'King': [
+            [-30, -40, -40, -50, -50, -40, -40, -30],
+            [-30, -40, -40, -50, -50, -40, -40, -30],
+            [-30, -40, -40, -50, -50, -40, -40, -30],
+            [-30, -40, -40, -50, -50, -40, -40, -30],
+            [-20, -30, -30, -40, -40, -30, -30, -20],
+            [-10, -20, -20, -20, -20, -20, -20, -10],
+            [20, 20, 0, 0, 0, 0, 20, 20],
+            [20, 30, 10, 0, 0, 10, 30, 20]
+        ],
+    },
+    'pst_eg': {
+        'Pawn': [
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [80, 80, 80, 80, 80, 80, 80, 80],
+            [50, 50, 50, 50, 50, 50, 50, 50],
+            [30, 30, 30, 30, 30, 30, 30, 30],
+            [15, 15, 15, 15, 15, 15, 15, 15],
+            [5, 5, 5, 5, 5, 5, 5, 5],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0]
+        ],
+        'Knight': [
+            [-50, -40, -30, -30, -30, -30, -40, -50],
+            [-40, -20, 0, 0, 0, 0, -20, -40],
+            [-30, 0, 10, 15, 15, 10, 0, -30],
+            [-30, 5, 15, 20, 20, 15, 5, -30],
+            [-30, 0, 15, 20, 20, 15, 0, -30],
+            [-30, 5, 10, 15, 15, 10, 5, -30],
+            [-40, -20, 0, 5, 5, 0, -20, -40],
+            [-50, -40, -30, -30, -30, -30, -40, -50]
+        ],
+        'Bishop': [
+            [-20, -10, -10, -10, -10, -10, -10, -20],
+            [-10, 0, 0, 0, 0, 0, 0, -10],
+            [-10, 0, 5, 10, 10, 5, 0, -10],
+            [-10, 5, 5, 10, 10, 5, 5, -10],
+            [-10, 0, 10, 10, 10, 10, 0, -10],
+            [-10, 10, 10, 10, 10, 10, 10, -10],
+            [-10, 5, 0, 0, 0, 0, 5, -10],
+            [-20, -10, -10, -10, -10, -10, -10, -20]
+        ],
+        'Rook': [
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [5, 10, 10, 10, 10, 10, 10, 5],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0],
+            [0, 0, 0, 0, 0, 0, 0, 0]
+        ],
+        'Queen': [
+            [-20, -10, -10, -5, -5, -10, -10, -20],
+            [-10, 0, 0, 0, 0, 0, 0, -10],
+            [-10, 0, 5, 5, 5, 5, 0, -10],
+            [-5, 0, 5, 5, 5, 5, 0, -5],
+            [-5, 0, 5, 5, 5, 5, 0, -5],
+            [-10, 0, 5, 5, 5, 5, 0, -10],
+            [-10, 0, 0, 0, 0, 0, 0, -10],
+            [-20, -10, -10, -5, -5, -10, -10, -20]
+        ],
+        'King': [
+            [-50, -40, -30, -20, -20, -30, -40, -50],
+            [-30, -20, -10, 0, 0, -10, -20, -30],
+            [-30, -10, 20, 30, 30, 20, -10, -30],
+            [-30, -10, 30, 40, 40, 30, -10, -30],
+            [-30, -10, 30, 40, 40, 30, -10, -30],
+            [-30, -10, 20, 30, 30, 20, -10, -30],
+            [-30, -30, 0, 0, 0, 0, -30, -30],
+            [-50, -30, -30, -30, -30, -30, -30, -50]
+        ],
+    },
+}
+
+
+class EvalTables:
+    """Готовые таблицы по кодам фигур: материал + бонус поля, у черных со знаком минус"""
+
+    def __init__(self, params=None):
+        self.params = params or DEFAULT_PARAMS
+        self.mg = [[0] * 64 for _ in range(16)]
+        self.eg = [[0] * 64 for _ in range(16)]
+        self.phase = [0] * 16
+
+        for name in PIECE_ORDER:
+            for color_bit, sign in ((0, 1), (8, -1)):
+                code = PIECE_CODES[name] | color_bit
+                self.phase[code] = PHASE_WEIGHTS[name]
+                for sq in range(64):
+                    # Для черных таблица читается с их стороны доски
+                    row, col = (sq >> 3, sq & 7) if sign > 0 else (7 - (sq >> 3), sq & 7)
+                    self.mg[code][sq] = sign * (self.params['piece_values_mg'][name]
+                                                + self.params['pst_mg'][name][row][col])
+                    self.eg[code][sq] = sign * (self.params['piece_values_eg'][name]
+                                                + self.params['pst_eg'][name][row][col])
+
+        self._arrays = None
+
+    def evaluate(self, squares):
+        """Полный пересчет оценки за белых по списку из 64 кодов фигур"""
+        mg = eg = phase = 0
+        for sq, code in enumerate(squares):
+            if code:
+                mg += self.mg[code][sq]
+                eg += self.eg[code][sq]
+                phase += self.phase[code]
+        return blend(mg, eg, phase)
+
+    def evaluate_batch(self, positions):
+        """Оценки за белых для многих позиций сразу (нужен numpy).
+
+        positions - массив кодов фигур формы (N, 64) или список SearchBoard.
+        """
+        if np is None:
+            raise ImportError('Для пакетной оценки нужен numpy: pip install numpy')
+        if self._arrays is None:
+            self._arrays = (np.array(self.mg, dtype=np.int64), np.array(self.eg, dtype=np.int64),
+                            np.array(self.phase, dtype=np.int64))
+        mg_table, eg_table, phase_table = self._arrays
+
+        codes = squares_array(positions)
+        columns = np.arange(64)
+        mg = mg_table[codes, columns].sum(axis=1)
+        eg = eg_table[codes, columns].sum(axis=1)
+        phase = np.minimum(phase_table[codes].sum(axis=1), MAX_PHASE)
+        return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def load_params(path):
+    """Параметры оценки из JSON; недостающие разделы и фигуры берутся из DEFAULT_PARAMS"""
+    with open(path, encoding='utf-8') as f:
+        loaded = json.load(f)
+    params = copy.deepcopy(DEFAULT_PARAMS)
+    for section, values in params.items():
+        for name in PIECE_ORDER:
+            value = loaded.get(section, {}).get(name)
+            if value is None:
+                continue
+            if section.startswith('pst') and (len(value) != 8 or any(len(row) != 8 for row in value)):
+                raise ValueError(f'{path}: таблица {section}/{name} должна быть 8x8')
+            values[name] = value
+    return params
+
+
+def save_params(params, path):
+    """JSON в том же виде, что DEFAULT_PARAMS: строка таблицы - одна строка файла"""
+    sections = []
+    for section in ('piece_values_mg', 'piece_values_eg', 'pst_mg', 'pst_eg'):
+        values = params[section]
+        if section.startswith('piece_values'):
+            sections.append(f'  "{section}": {json.dumps(values)}')
+            continue
+        tables = []
+        for name in PIECE_ORDER:
+            rows = ',\n'.join(f'      {json.dumps(row)}' for row in values[name])
+            tables.append(f'    "{name}": [\n{rows}\n    ]')
+        sections.append(f'  "{section}": {{\n' + ',\n'.join(tables) + '\n  }')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n' + ',\n'.join(sections) + '\n}\n')
+
+
+def blend(mg, eg, phase):
+    if phase > MAX_PHASE:
+        phase = MAX_PHASE
+    return (mg * phase + eg * (MAX_PHASE - phase)) // MAX_PHASE
+
+
+def squares_array(positions):
+    """Массив кодов фигур (N, 64) uint8 из списка SearchBoard или готового массива"""
+    if np is None:
+        raise ImportError('Для пакетной оценки нужен numpy: pip install numpy')
+    if isinstance(positions, np.ndarray):
+        return positions
+    return np.array([board.squares for board in positions], dtype=np.uint8)
+
+
+DEFAULT_TABLES = EvalTables()
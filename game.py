@@ -1,82 +1,164 @@
+from concurrent.futures import ThreadPoolExecutor, wait
+
 import pygame
 from board import Board
 from ai_player import ChessAI
+from movegen import is_legal
+from search_board import SearchBoard
+
+# Один фоновый поток на все партии: поиск ИИ не блокирует цикл pygame,
+# а таблица транспозиций остается в памяти между ходами
+_ai_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='chess-ai')
+
+
+PIECE_SYMBOLS = {
+    'white': {'King': '♔', 'Queen': '♕', 'Rook': '♖',
+              'Bishop': '♗', 'Knight': '♘', 'Pawn': '♙'},
+    'black': {'King': '♚', 'Queen': '♛', 'Rook': '♜',
+              'Bishop': '♝', 'Knight': '♞', 'Pawn': '♟'}
+}
+PIECE_FONT_SIZE = 70
+
+# Шрифты, готовые фигуры с обводкой и фон доски строятся один раз,
+# а не на каждом кадре
+_fonts = {}
+_piece_surfaces = {}
+_backgrounds = {}
+
+
+def _piece_font(size):
+    font = _fonts.get(size)
+    if font is None:
+        try:
+            font = pygame.font.SysFont('segoeuisymbol', size)
+        except:
+            try:
+                font = pygame.font.SysFont('dejavusans', size)
+            except:
+                font = pygame.font.Font(None, size)
+        _fonts[size] = font
+    return font
+
+
+def _piece_surface(color, name, size=PIECE_FONT_SIZE):
+    """Фигура с обводкой в один пиксель на прозрачном фоне"""
+    key = (color, name, size)
+    surface = _piece_surfaces.get(key)
+    if surface is None:
+        font = _piece_font(size)
+        symbol = PIECE_SYMBOLS[color][name]
+        fill, outline_color = ((255, 255, 255), (0, 0, 0)) if color == 'white' else ((0, 0, 0), (255, 255, 255))
+        text = font.render(symbol, True, fill)
+        outline = font.render(symbol, True, outline_color)
+
+        surface = pygame.Surface((text.get_width() + 2, text.get_height() + 2), pygame.SRCALPHA)
+        for dx, dy in [(0, 0), (0, 2), (2, 0), (2, 2)]:
+            surface.blit(outline, (dx, dy))
+        surface.blit(text, (1, 1))
+        _piece_surfaces[key] = surface
+    return surface
+
+
+def _board_background(square_size, light, dark):
+    key = (square_size, light, dark)
+    surface = _backgrounds.get(key)
+    if surface is None:
+        surface = pygame.Surface((square_size * 8, square_size * 8))
+        for row in range(8):
+            for col in range(8):
+                color = light if (row + col) % 2 == 0 else dark
+                pygame.draw.rect(surface, color, (col * square_size, row * square_size, square_size, square_size))
+        _backgrounds[key] = surface
+    return surface
+
 
 class Game:
+
+    # Future текущего фонового поиска ИИ (None - поиск не идет)
+    ai_future = None
+    # Размышление на времени соперника: Future и ключ позиции после ожидаемого ответа
+    ponder_enabled = True
+    ponder_future = None
+    _ponder_key = None
+    # Состояние полей на последнем кадре (None - нужна полная перерисовка)
+    _square_states = None
     
     def draw(self):
-        self.draw_board()
-        self.draw_pieces()
-        
-        if self.selected_pos:
-            self.draw_selection()
-        
-        if self.valid_moves:
-            self.draw_valid_moves() 
-        
+        """Перерисовывает только изменившиеся поля.
+
+        Возвращает прямоугольники для pygame.display.update: пустой список,
+        если на доске ничего не поменялось.
+        """
         if self.game_over:
+            self.draw_board()
+            self.draw_pieces()
+            if self.selected_pos:
+                self.draw_selection()
+            if self.valid_moves:
+                self.draw_valid_moves()
             self.draw_game_over()
-    
-    def draw_board(self):
+            self._square_states = None
+            return [self.screen.get_rect()]
+
+        states = self._get_square_states()
+        previous = self._square_states
+        self._square_states = states
+
+        dirty = []
+        for index, state in enumerate(states):
+            if previous is None or state != previous[index]:
+                dirty.append(self._draw_square(index // 8, index % 8, state))
+        if previous is None:
+            return [self.screen.get_rect()]
+        return dirty
+
+    def invalidate(self):
+        """Следующий draw перерисует всю доску (экран был закрыт чем-то другим)"""
+        self._square_states = None
+
+    def _get_square_states(self):
+        """Что видно на каждом поле: (цвет и имя фигуры, выделено, возможный ход)"""
+        valid_moves = set(self.valid_moves) if self.valid_moves else ()
+        states = []
         for row in range(8):
             for col in range(8):
-                color = self.WHITE if (row + col) % 2 == 0 else self.BLACK
-                pygame.draw.rect(
-                    self.screen,
-                    color,
-                    (col * self.SQUARE_SIZE, row * self.SQUARE_SIZE,
-                     self.SQUARE_SIZE, self.SQUARE_SIZE)
-                )
-    
+                piece = self.board.get_piece((row, col))
+                states.append((
+                    (piece.color, piece.name) if piece else None,
+                    self.selected_pos == (row, col),
+                    (row, col) in valid_moves,
+                ))
+        return states
+
+    def _draw_square(self, row, col, state):
+        piece, selected, valid_move = state
+        size = self.SQUARE_SIZE
+        rect = pygame.Rect(col * size, row * size, size, size)
+
+        self.screen.blit(_board_background(size, self.WHITE, self.BLACK), rect, rect)
+        if piece:
+            glyph = _piece_surface(*piece)
+            self.screen.blit(glyph, glyph.get_rect(center=rect.center))
+        if selected:
+            pygame.draw.rect(self.screen, self.HIGHLIGHT, rect, 5)
+        if valid_move:
+            pygame.draw.circle(self.screen, self.VALID_MOVE, rect.center, 15)
+        return rect
+
+    def draw_board(self):
+        self.screen.blit(_board_background(self.SQUARE_SIZE, self.WHITE, self.BLACK), (0, 0))
+
     def draw_pieces(self):
-        piece_symbols = {
-            'white': {'King': '♔', 'Queen': '♕', 'Rook': '♖', 
-                    'Bishop': '♗', 'Knight': '♘', 'Pawn': '♙'},
-            'black': {'King': '♚', 'Queen': '♛', 'Rook': '♜',
-                    'Bishop': '♝', 'Knight': '♞', 'Pawn': '♟'}
-        }
-        
-        try:
-            font = pygame.font.SysFont('segoeuisymbol', 70)
-        except:
-            try:
-                font = pygame.font.SysFont('dejavusans', 70)
-            except:
-                font = pygame.font.Font(None, 70)
-        
         for row in range(8):
             for col in range(8):
                 piece = self.board.get_piece((row, col))
                 if piece:
-                    symbol = piece_symbols[piece.color][piece.name]
-                    
-                    if piece.color == 'white':
-                        color = (255, 255, 255)
-                    else:
-                        color = (0, 0, 0)
-                    
-                    text = font.render(symbol, True, color)
-                    text_rect = text.get_rect(
+                    glyph = _piece_surface(piece.color, piece.name)
+                    glyph_rect = glyph.get_rect(
                         center=(col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2,
                                 row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2)
                     )
-                    
-                    if piece.color == 'white':
-                        outline = font.render(symbol, True, (0, 0, 0))
-                        for dx, dy in [(-1,-1), (-1,1), (1,-1), (1,1)]:
-                            outline_rect = text_rect.copy()
-                            outline_rect.x += dx
-                            outline_rect.y += dy
-                            self.screen.blit(outline, outline_rect)
-                    else:
-                        outline = font.render(symbol, True, (255, 255, 255))
-                        for dx, dy in [(-1,-1), (-1,1), (1,-1), (1,1)]:
-                            outline_rect = text_rect.copy()
-                            outline_rect.x += dx
-                            outline_rect.y += dy
-                            self.screen.blit(outline, outline_rect)
-                    
-                    self.screen.blit(text, text_rect)
+                    self.screen.blit(glyph, glyph_rect)
 
     def draw_selection(self):
         row, col = self.selected_pos
@@ -96,4 +178,84 @@ class Game:
                 (col * self.SQUARE_SIZE + self.SQUARE_SIZE // 2,
                  row * self.SQUARE_SIZE + self.SQUARE_SIZE // 2),
                 15
-            )
\ No newline at end of file
+            )
+
+    def start_ai_move(self, callback=None):
+        """Запускает поиск хода ИИ в фоновом потоке и возвращает Future.
+
+        Поиск идет по снимку доски, поэтому окно можно перерисовывать.
+        callback(future) вызывается в фоновом потоке по окончании поиска.
+        Если ИИ угадал ответ и уже думает над этой позицией, новый поиск
+        не запускается.
+        """
+        if self.ai_future is None:
+            snapshot = SearchBoard.from_board(self.board, self.ai.color)
+            ponder_future, ponder_key = self.ponder_future, self._ponder_key
+            self.ponder_future = self._ponder_key = None
+
+            if ponder_future is not None and ponder_key == snapshot.key:
+                self.ai_future = ponder_future
+            else:
+                if ponder_future is not None:
+                    # Не угадали: прерываем размышление, таблица транспозиций остается
+                    self._stop_search(ponder_future)
+                self.ai.prepare_search()
+                self.ai_future = _ai_executor.submit(self._search_ai_move, snapshot)
+            if callback is not None:
+                self.ai_future.add_done_callback(callback)
+        return self.ai_future
+
+    def _search_ai_move(self, snapshot):
+        self.ai.get_best_move(snapshot)
+        return snapshot.key, self.ai.best_move
+
+    def poll_ai_move(self):
+        """Делает ход ИИ, если фоновый поиск закончился; вызывается из цикла pygame"""
+        future = self.ai_future
+        if future is None or not future.done():
+            return False
+
+        self.ai_future = None
+        if future.cancelled():
+            return False
+
+        # make_ai_move возьмет готовый ход у ChessAI, не запуская поиск заново
+        self.ai.ready_move = future.result()
+        self.make_ai_move()
+        if self.ponder_enabled and not self.game_over:
+            self.start_pondering()
+        return True
+
+    def start_pondering(self):
+        """Пока человек думает, ИИ считает ответ на ожидаемый ход соперника.
+
+        Ожидаемый ход - второй ход главного варианта. Если человек сыграет
+        его, start_ai_move подхватит уже идущий поиск.
+        """
+        pv = self.ai.principal_variation
+        if self.ponder_future is not None or len(pv) < 2 or pv[0] != self.ai.best_move:
+            return None
+
+        snapshot = SearchBoard.from_board(self.board, self.ai.opponent_color)
+        if not is_legal(snapshot, pv[1]):
+            return None
+        snapshot.make_move(pv[1])
+
+        self._ponder_key = snapshot.key
+        self.ai.prepare_search()
+        self.ponder_future = _ai_executor.submit(self._search_ai_move, snapshot)
+        return self.ponder_future
+
+    def _stop_search(self, future):
+        """Отменяет поиск, который еще не начался, или дожидается остановки идущего"""
+        if future.cancel():
+            return
+        self.ai.stop()
+        wait([future])
+
+    def cancel_ai_move(self):
+        """Останавливает фоновый поиск и размышление (Escape или закрытие окна)"""
+        for future in (self.ai_future, self.ponder_future):
+            if future is not None:
+                self._stop_search(future)
+        self.ai_future = self.ponder_future = self._ponder_key = None
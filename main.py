@@ -91,9 +91,13 @@ def main():
             difficulty = show_difficulty_menu(screen)
             if difficulty is None:
                 continue
-            game = Game(screen, ai_enabled=True, ai_color='black', ai_depth=difficulty)
+            game = Game(screen, ai_enabled=True, ai_color='black')
+            # Уровень - бюджет узлов и шум оценки, а не глубина: время хода не скачет от позиции
+            game.ai.set_difficulty(difficulty)
         else:
             game = Game(screen, ai_enabled=False)
+        # Экран только что занимало меню: первый кадр рисует всю доску
+        game.invalidate()
         
         clock = pygame.time.Clock()
         running = True
@@ -103,24 +107,37 @@ def main():
             
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
+                    game.cancel_ai_move()
                     pygame.quit()
                     return
                 
                 elif event.type == pygame.KEYDOWN:
                     if event.key == pygame.K_ESCAPE:
+                        game.cancel_ai_move()
                         running = False
                 
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     game.handle_click(pygame.mouse.get_pos())
+                
+                elif event.type in (pygame.VIDEOEXPOSE, pygame.WINDOWEXPOSED):
+                    # Окно было перекрыто: поля, не менявшиеся с прошлого кадра, тоже нужно перерисовать
+                    game.invalidate()
+            
+            if not running:
+                break
             
             game.update()
-            game.draw()
-            pygame.display.flip()
+            # Обновляются только поля, которые изменились с прошлого кадра
+            pygame.display.update(game.draw())
             
+            # ИИ думает в фоновом потоке, окно продолжает перерисовываться
             if game.ai_thinking:
-                game.make_ai_move()
+                game.start_ai_move()
+                game.poll_ai_move()
             
             if game.game_over:
+                # Размышление над ответом могло еще идти: поток ИИ не должен пережить партию
+                game.cancel_ai_move()
                 show_game_over_screen(screen, game.winner)
                 running = False
     
@@ -157,11 +174,11 @@ def show_difficulty_menu(screen):
                 button.handle_event(event)
             
             if easy_button.handle_event(event):
-                return 2
+                return 'easy'
             if medium_button.handle_event(event):
-                return 3
+                return 'medium'
             if hard_button.handle_event(event):
-                return 4
+                return 'hard'
             if back_button.handle_event(event):
                 return None
         
@@ -0,0 +1,403 @@
+"""Матч ChessAI против ChessAI без окна: партии в пуле процессов, PGN и Elo/SPRT.
+
+    python match.py --engine new lmr=true --engine base lmr=false \\
+        --openings openings.epd --games 2000 --movetime 100 --sprt 0 10 --pgn match.pgn
+
+Каждый дебют играется дважды со сменой цветов. Без --openings берутся
+встроенные DEFAULT_OPENINGS; когда дебюты кончаются, к ним добавляются
+случайные полуходы, чтобы детерминированные движки не повторяли партии.
+Результаты считаются для первого движка. Партии дописываются в PGN по мере
+окончания, а матч останавливается, как только SPRT принимает одну из гипотез.
+"""
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from ai_player import ChessAI
+from movegen import generate_moves
+from pgn import format_game, move_to_san, parse_san, read_games
+from search_board import BISHOP, BLACK, KING, KNIGHT, START_FEN, WHITE, SearchBoard
+
+# Присуждение результата: обе стороны согласны, что перевес не меньше
+# RESIGN_SCORE, RESIGN_PLIES полуходов подряд; ничья - если после
+# DRAW_MIN_PLY оценка держится в пределах DRAW_SCORE DRAW_PLIES полуходов
+RESIGN_SCORE = 1000
+RESIGN_PLIES = 6
+DRAW_MIN_PLY = 80
+DRAW_SCORE = 10
+DRAW_PLIES = 12
+MAX_PLIES = 400
+
+# Дебюты по умолчанию (SAN от начальной позиции): начальная позиция у детерминированных
+# движков дает одну и ту же пару партий, и Elo со SPRT считали бы повторы независимыми
+DEFAULT_OPENINGS = (
+    'e4 e5 Nf3 Nc6 Bb5 a6',
+    'e4 e5 Nf3 Nc6 Bc4 Bc5',
+    'e4 e5 Nf3 Nf6',
+    'e4 e5 f4',
+    'e4 c5 Nf3 d6 d4 cxd4',
+    'e4 c5 Nf3 Nc6',
+    'e4 c5 Nc3 Nc6',
+    'e4 e6 d4 d5 Nc3',
+    'e4 e6 d4 d5 e5',
+    'e4 c6 d4 d5 e5',
+    'e4 d5 exd5 Qxd5',
+    'e4 d6 d4 Nf6 Nc3 g6',
+    'd4 d5 c4 e6 Nc3 Nf6',
+    'd4 d5 c4 c6',
+    'd4 d5 c4 dxc4',
+    'd4 Nf6 c4 e6 Nc3 Bb4',
+    'd4 Nf6 c4 g6 Nc3 Bg7',
+    'd4 Nf6 c4 c5 d5',
+    'd4 Nf6 Nf3 e6 Bg5',
+    'd4 f5 g3 Nf6',
+    'c4 e5 Nc3 Nf6',
+    'c4 c5 Nf3 Nc6',
+    'Nf3 d5 g3 Nf6 Bg2',
+    'b3 e5 Bb2 Nc6',
+)
+# Псевдопартии каждого исхода в дисперсии SPRT
+SPRT_PRIOR = 0.5
+# Сколько случайных полуходов добавляется к дебюту на каждом следующем круге
+RANDOM_PLIES = 2
+
+
+def parse_engine(spec):
+    """['имя', 'ключ=значение', ...] -> (имя, параметры ChessAI); значения читаются как JSON"""
+    name, options = spec[0], {'book_path': None}
+    for item in spec[1:]:
+        key, _, value = item.partition('=')
+        try:
+            options[key] = json.loads(value)
+        except ValueError:
+            options[key] = value
+    return name, options
+
+
+def load_openings(path):
+    """Стартовые позиции: FEN/EPD по строке или партии PGN (позиция после всех ходов)"""
+    if path is None:
+        openings = []
+        for line in DEFAULT_OPENINGS:
+            board = SearchBoard.from_fen(START_FEN)
+            for san in line.split():
+                board.make_move(parse_san(board, san))
+            openings.append(board.fen())
+        return openings
+    if path.lower().endswith('.pgn'):
+        openings = []
+        for headers, sans in read_games(path):
+            board = SearchBoard.from_fen(headers.get('FEN', START_FEN))
+            for san in sans:
+                board.make_move(parse_san(board, san))
+            openings.append(board.fen())
+        return openings
+
+    openings = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split()
+            if fields and not line.startswith('#'):
+                # У EPD после четырех полей идут операции, а не счетчики ходов
+                openings.append(' '.join(fields[:6] if len(fields) >= 6 and fields[4].isdigit()
+                                         else fields[:4]))
+    return openings
+
+
+def schedule_openings(openings, pairs, seed=0):
+    """Дебют для каждой пары партий.
+
+    Первый круг - дебюты как есть; на круге n к дебюту добавляется n * RANDOM_PLIES
+    случайных легальных полуходов (генератор зависит от seed и номера пары),
+    а повторившиеся позиции перевыбираются.
+    """
+    scheduled = []
+    seen = set()
+    for pair in range(pairs):
+        cycle, number = divmod(pair, len(openings))
+        fen = openings[number]
+        rng = random.Random(seed * 1_000_003 + pair)
+        for _ in range(100 if cycle else 1):
+            board = SearchBoard.from_fen(openings[number])
+            for _ in range(cycle * RANDOM_PLIES):
+                moves = generate_moves(board)
+                if not moves:
+                    break
+                board.make_move(rng.choice(moves))
+            fen = board.fen()
+            if fen not in seen and game_over(board, Counter([board.key])) is None:
+                break
+        seen.add(fen)
+        scheduled.append(fen)
+    return scheduled
+
+
+def insufficient_material(board):
+    """Голые короли или король с одной легкой фигурой против короля"""
+    minors = 0
+    for code, squares in enumerate(board.piece_lists):
+        if not squares or code & 7 == KING:
+            continue
+        if code & 7 not in (KNIGHT, BISHOP):
+            return False
+        minors += len(squares)
+    return minors <= 1
+
+
+def game_over(board, repetitions):
+    """(результат, причина) или None, если партия продолжается"""
+    if not generate_moves(board):
+        if board.in_check():
+            return ('0-1' if board.side == WHITE else '1-0'), 'мат'
+        return '1/2-1/2', 'пат'
+    if repetitions[board.key] >= 3:
+        return '1/2-1/2', 'троекратное повторение'
+    if board.halfmove_clock >= 100:
+        return '1/2-1/2', 'правило 50 ходов'
+    if insufficient_material(board):
+        return '1/2-1/2', 'недостаточно материала'
+    return None
+
+
+# Движки процесса пула по именам: таблица транспозиций переживает партию,
+# но очищается перед следующей
+_engines = {}
+
+
+def _get_engine(name, options):
+    engine = _engines.get(name)
+    if engine is None:
+        options = dict(options)
+        options.pop('movetime', None)
+        engine = _engines[name] = ChessAI(verbose=False, **options)
+    return engine
+
+
+def play_game(index, white, black, fen, max_plies=MAX_PLIES):
+    """Одна партия; white и black - (имя, параметры). movetime в параметрах - мс на ход"""
+    board = SearchBoard.from_fen(fen)
+    engines = {WHITE: _get_engine(*white), BLACK: _get_engine(*black)}
+    movetimes = {WHITE: white[1].get('movetime'), BLACK: black[1].get('movetime')}
+    for engine in engines.values():
+        engine.new_game()
+
+    sans = []
+    repetitions = Counter([board.key])
+    resign_streak = draw_streak = 0
+    outcome = None
+    start = time.perf_counter()
+
+    while outcome is None:
+        outcome = game_over(board, repetitions)
+        if outcome is not None:
+            break
+        if len(sans) >= max_plies:
+            outcome = '1/2-1/2', 'лимит ходов'
+            break
+
+        side = board.side
+        engine = engines[side]
+        movetime = movetimes[side]
+        engine.get_best_move(board, time_limit=movetime / 1000 if movetime else None)
+        move = engine.best_move
+
+        # Оценка best_value - за сторону, которая ходила; для присуждения переводим ее за белых.
+        # Без законченной итерации (ход из книги, крошечный бюджет) оценки нет или это -inf
+        score = engine.best_value
+        if engine.completed_depth >= 1 and score is not None and math.isfinite(score):
+            white_score = score if side == WHITE else -score
+            if white_score >= RESIGN_SCORE:
+                resign_streak = max(resign_streak, 0) + 1
+            elif white_score <= -RESIGN_SCORE:
+                resign_streak = min(resign_streak, 0) - 1
+            else:
+                resign_streak = 0
+            draw_streak = draw_streak + 1 if len(sans) >= DRAW_MIN_PLY and abs(score) <= DRAW_SCORE else 0
+
+        sans.append(move_to_san(board, move))
+        board.make_move(move)
+        repetitions[board.key] += 1
+
+        if abs(resign_streak) >= RESIGN_PLIES:
+            outcome = ('1-0' if resign_streak > 0 else '0-1'), 'присуждено по оценке'
+        elif draw_streak >= DRAW_PLIES:
+            outcome = '1/2-1/2', 'ничья по оценке'
+
+    result, reason = outcome
+    return {
+        'index': index,
+        'white': white[0],
+        'black': black[0],
+        'fen': fen,
+        'moves': sans,
+        'result': result,
+        'termination': reason,
+        'time': round(time.perf_counter() - start, 2),
+    }
+
+
+def elo_difference(wins, draws, losses):
+    """Разница Elo и полуширина 95% интервала по набранным очкам"""
+    games = wins + draws + losses
+    if not games:
+        return 0.0, math.inf
+    score = (wins + draws / 2) / games
+    if score <= 0 or score >= 1:
+        return (math.inf if score >= 1 else -math.inf), math.inf
+
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    margin_score = 1.96 * math.sqrt(variance / games)
+
+    def to_elo(value):
+        value = min(max(value, 1e-6), 1 - 1e-6)
+        return -400 * math.log10(1 / value - 1)
+
+    elo = to_elo(score)
+    return elo, (to_elo(score + margin_score) - to_elo(score - margin_score)) / 2
+
+
+def sprt_llr(wins, draws, losses, elo0, elo1):
+    """Логарифм отношения правдоподобия H1 (elo1) к H0 (elo0), нормальное приближение.
+
+    К каждому исходу добавляется SPRT_PRIOR партий: иначе при одних победах
+    или одних поражениях дисперсия нулевая и матч не останавливается.
+    """
+    games = wins + draws + losses
+    if not games:
+        return 0.0
+    wins, draws, losses = wins + SPRT_PRIOR, draws + SPRT_PRIOR, losses + SPRT_PRIOR
+    counted = wins + draws + losses
+    score = (wins + draws / 2) / counted
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / counted
+    score0 = 1 / (1 + 10 ** (-elo0 / 400))
+    score1 = 1 / (1 + 10 ** (-elo1 / 400))
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha=0.05, beta=0.05):
+    return math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha)
+
+
+def run_match(engine_a, engine_b, openings, games, workers=None, pgn_path=None, sprt=None,
+              max_plies=MAX_PLIES, out=sys.stderr, seed=0):
+    """Играет матч и возвращает сводку; sprt - (elo0, elo1, alpha, beta) или None"""
+    pair_openings = schedule_openings(openings, (games + 1) // 2, seed)
+    schedule = []
+    for index in range(games):
+        fen = pair_openings[index // 2]
+        # Каждый дебют - пара партий со сменой цветов
+        white, black = (engine_a, engine_b) if index % 2 == 0 else (engine_b, engine_a)
+        schedule.append((index, white, black, fen))
+
+    wins = draws = losses = 0
+    llr = 0.0
+    bounds = sprt_bounds(*sprt[2:]) if sprt else None
+    decision = None
+    pgn_file = open(pgn_path, 'a', encoding='utf-8') if pgn_path else None
+
+    executor = ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+    try:
+        pending = {executor.submit(play_game, *task, max_plies) for task in schedule}
+        while pending and decision is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game = future.result()
+                a_is_white = game['white'] == engine_a[0]
+                if game['result'] == '1/2-1/2':
+                    draws += 1
+                elif (game['result'] == '1-0') == a_is_white:
+                    wins += 1
+                else:
+                    losses += 1
+
+                if pgn_file is not None:
+                    headers = {'Event': 'ChessAI match', 'Round': str(game['index'] + 1),
+                               'White': game['white'], 'Black': game['black'],
+                               'Termination': game['termination']}
+                    fields = game['fen'].split()
+                    if game['fen'] != START_FEN:
+                        headers['FEN'] = game['fen']
+                        headers['SetUp'] = '1'
+                    pgn_file.write(format_game(headers, game['moves'], game['result'],
+                                               int(fields[5]) if len(fields) > 5 else 1,
+                                               len(fields) > 1 and fields[1] == 'b'))
+                    pgn_file.flush()
+
+                elo, margin = elo_difference(wins, draws, losses)
+                played = wins + draws + losses
+                line = f'{played}/{games}: +{wins} ={draws} -{losses}  Elo {elo:+.1f} ± {margin:.1f}'
+                if sprt:
+                    llr = sprt_llr(wins, draws, losses, sprt[0], sprt[1])
+                    line += f'  LLR {llr:.2f} [{bounds[0]:.2f}, {bounds[1]:.2f}]'
+                    if llr <= bounds[0]:
+                        decision = 'H0'
+                    elif llr >= bounds[1]:
+                        decision = 'H1'
+                print(line, file=out, flush=True)
+    finally:
+        executor.shutdown(cancel_futures=True)
+        if pgn_file is not None:
+            pgn_file.close()
+
+    elo, margin = elo_difference(wins, draws, losses)
+    summary = {
+        'engines': [engine_a[0], engine_b[0]],
+        'games': wins + draws + losses,
+        'wins': wins,
+        'draws': draws,
+        'losses': losses,
+        'elo': round(elo, 1) if math.isfinite(elo) else None,
+        'elo_margin': round(margin, 1) if math.isfinite(margin) else None,
+    }
+    if sprt:
+        summary['sprt'] = {'elo0': sprt[0], 'elo1': sprt[1], 'llr': round(llr, 3),
+                           'bounds': [round(bound, 3) for bound in bounds], 'decision': decision}
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Матч ChessAI против ChessAI')
+    parser.add_argument('--engine', nargs='+', action='append', required=True, metavar='ИМЯ [КЛЮЧ=ЗНАЧЕНИЕ]',
+                        help='имя движка и параметры ChessAI (depth=4, lmr=false, movetime=100)')
+    parser.add_argument('--openings', help='файл FEN/EPD или PGN с дебютами (по умолчанию DEFAULT_OPENINGS)')
+    parser.add_argument('--games', type=int, default=100, help='число партий (четное: дебют за оба цвета)')
+    parser.add_argument('--depth', type=int, help='глубина для всех движков, если не задана своя')
+    parser.add_argument('--movetime', type=int, help='мс на ход для всех движков, если не задано свое')
+    parser.add_argument('--workers', type=int, default=None, help='процессов (по умолчанию все ядра)')
+    parser.add_argument('--pgn', help='дописывать партии в этот файл')
+    parser.add_argument('--sprt', nargs=2, type=float, metavar=('ELO0', 'ELO1'),
+                        help='остановить матч, когда SPRT примет H0 или H1')
+    parser.add_argument('--alpha', type=float, default=0.05)
+    parser.add_argument('--beta', type=float, default=0.05)
+    parser.add_argument('--max-plies', type=int, default=MAX_PLIES, help='ничья после стольких полуходов')
+    parser.add_argument('--seed', type=int, default=0, help='зерно случайных полуходов после дебютов')
+    args = parser.parse_args(argv)
+
+    if len(args.engine) != 2:
+        parser.error('нужно ровно два --engine')
+    engines = []
+    for spec in args.engine:
+        name, options = parse_engine(spec)
+        if args.depth is not None:
+            options.setdefault('depth', args.depth)
+        if args.movetime is not None:
+            options.setdefault('movetime', args.movetime)
+        engines.append((name, options))
+    if engines[0][0] == engines[1][0]:
+        parser.error('у движков должны быть разные имена')
+
+    sprt = (args.sprt[0], args.sprt[1], args.alpha, args.beta) if args.sprt else None
+    summary = run_match(engines[0], engines[1], load_openings(args.openings), args.games, args.workers,
+                        args.pgn, sprt, args.max_plies, seed=args.seed)
+    print(json.dumps(summary, indent=2, ensure_ascii=False))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,330 @@
+"""Генератор легальных ходов для SearchBoard на битбордах.
+
+Связки и шахи считаются один раз на позицию, поэтому легальные ходы
+получаются за один проход без пробного хода для каждого кандидата
+(кроме редкого взятия на проходе).
+"""
+import argparse
+import sys
+import time
+
+from bitboards import (BETWEEN, BISHOP_EMPTY_ATTACKS, FULL, KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS,
+                       ROOK_EMPTY_ATTACKS, bishop_attacks, rook_attacks)
+from search_board import (BISHOP, FLAG_CASTLING, FLAG_DOUBLE_PUSH, FLAG_EN_PASSANT, KING, KNIGHT, PAWN,
+                          PROMOTION_SHIFT, QUEEN, ROOK, WHITE, SearchBoard)
+
+PROMOTIONS = (QUEEN << PROMOTION_SHIFT, ROOK << PROMOTION_SHIFT,
+              BISHOP << PROMOTION_SHIFT, KNIGHT << PROMOTION_SHIFT)
+
+# Эталонные числа узлов perft: (название, FEN, узлы на глубинах 1, 2, ...)
+PERFT_SUITE = [
+    ('startpos', 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1',
+     [20, 400, 8902, 197281, 4865609]),
+    ('kiwipete', 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1',
+     [48, 2039, 97862, 4085603]),
+    ('endgame', '8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1',
+     [14, 191, 2812, 43238, 674624]),
+    ('promotions', 'r3k2r/Pppp1ppp/1b3nbN/nP6/BBP1P3/q4N2/Pp1P2PP/R2Q1RK1 w kq - 0 1',
+     [6, 264, 9467, 422333]),
+    ('talkchess', 'rnbq1k1r/pp1Pbppp/2p5/8/2B5/8/PPP1NnPP/RNBQK2R w KQ - 1 8',
+     [44, 1486, 62379, 2103487]),
+    ('middlegame', 'r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10',
+     [46, 2079, 89890, 3894594]),
+]
+
+
+def attackers_to(board, sq, by_color, occupied):
+    bitboards = board.bitboards
+    them = by_color << 3
+    queens = bitboards[QUEEN | them]
+    return ((KNIGHT_ATTACKS[sq] & bitboards[KNIGHT | them])
+            | (PAWN_ATTACKS[by_color ^ 1][sq] & bitboards[PAWN | them])
+            | (KING_ATTACKS[sq] & bitboards[KING | them])
+            | (rook_attacks(sq, occupied) & (bitboards[ROOK | them] | queens))
+            | (bishop_attacks(sq, occupied) & (bitboards[BISHOP | them] | queens)))
+
+
+def _pins(board, king_sq, us, occupied):
+    """Связанные фигуры -> маска полей, по которым им можно ходить"""
+    bitboards = board.bitboards
+    them = (us ^ 1) << 3
+    own = board.occupied[us]
+    queens = bitboards[QUEEN | them]
+    snipers = ((ROOK_EMPTY_ATTACKS[king_sq] & (bitboards[ROOK | them] | queens))
+               | (BISHOP_EMPTY_ATTACKS[king_sq] & (bitboards[BISHOP | them] | queens)))
+
+    pins = {}
+    between_king = BETWEEN[king_sq]
+    while snipers:
+        low = snipers & -snipers
+        snipers ^= low
+        sniper_sq = low.bit_length() - 1
+        blockers = between_king[sniper_sq] & occupied
+        if blockers and not blockers & (blockers - 1) and blockers & own:
+            pins[blockers.bit_length() - 1] = between_king[sniper_sq] | low
+    return pins
+
+
+def generate_moves(board, noisy_only=False, quiet_only=False):
+    """Легальные ходы.
+
+    noisy_only - только взятия и превращения (для форсированного поиска),
+    quiet_only - все остальные; вместе они дают полный список, что позволяет
+    генерировать ходы по стадиям.
+    """
+    moves = []
+    append = moves.append
+    us = board.side
+    them = us ^ 1
+    own_bits = us << 3
+    bitboards = board.bitboards
+    own = board.occupied[us]
+    enemy = board.occupied[them]
+    occupied = own | enemy
+    if noisy_only:
+        allowed = enemy
+    elif quiet_only:
+        allowed = ~occupied
+    else:
+        allowed = ~own
+
+    king_bb = bitboards[KING | own_bits]
+    king_sq = king_bb.bit_length() - 1
+
+    # Ходы короля: поле не должно быть под боем, даже если король уйдет с линии
+    without_king = occupied ^ king_bb
+    targets = KING_ATTACKS[king_sq] & allowed
+    while targets:
+        low = targets & -targets
+        targets ^= low
+        to_sq = low.bit_length() - 1
+        if not attackers_to(board, to_sq, them, without_king):
+            append(king_sq | (to_sq << 6))
+
+    checkers = attackers_to(board, king_sq, them, occupied)
+    if checkers & (checkers - 1):
+        # Двойной шах: только ход королем
+        return moves
+    if checkers:
+        check_mask = BETWEEN[king_sq][checkers.bit_length() - 1] | checkers
+    else:
+        check_mask = FULL
+        if board.castling and not noisy_only:
+            _add_castling_moves(board, moves, us, occupied)
+
+    pins = _pins(board, king_sq, us, occupied)
+    target_mask = allowed & check_mask
+
+    knights = bitboards[KNIGHT | own_bits]
+    while knights:
+        low = knights & -knights
+        knights ^= low
+        sq = low.bit_length() - 1
+        if sq in pins:
+            # Связанный конь не может ходить никуда
+            continue
+        targets = KNIGHT_ATTACKS[sq] & target_mask
+        while targets:
+            to_low = targets & -targets
+            targets ^= to_low
+            append(sq | ((to_low.bit_length() - 1) << 6))
+
+    queens = bitboards[QUEEN | own_bits]
+    for sliders, attacks in ((bitboards[BISHOP | own_bits] | queens, bishop_attacks),
+                             (bitboards[ROOK | own_bits] | queens, rook_attacks)):
+        while sliders:
+            low = sliders & -sliders
+            sliders ^= low
+            sq = low.bit_length() - 1
+            targets = attacks(sq, occupied) & target_mask
+            if sq in pins:
+                targets &= pins[sq]
+            while targets:
+                to_low = targets & -targets
+                targets ^= to_low
+                append(sq | ((to_low.bit_length() - 1) << 6))
+
+    _add_pawn_moves(board, moves, us, occupied, enemy, check_mask, pins, noisy_only, quiet_only)
+    return moves
+
+
+def _add_pawn_moves(board, moves, us, occupied, enemy, check_mask, pins, noisy_only, quiet_only):
+    append = moves.append
+    forward = -8 if us == WHITE else 8
+    start_row = 6 if us == WHITE else 1
+    promotion_row = 0 if us == WHITE else 7
+    pawn_attacks = PAWN_ATTACKS[us]
+    ep_square = board.ep_square
+
+    pawns = board.bitboards[PAWN | (us << 3)]
+    while pawns:
+        low = pawns & -pawns
+        pawns ^= low
+        sq = low.bit_length() - 1
+        allowed = check_mask & pins[sq] if sq in pins else check_mask
+
+        to_sq = sq + forward
+        if not (occupied >> to_sq) & 1:
+            if (allowed >> to_sq) & 1:
+                if to_sq >> 3 == promotion_row:
+                    if not quiet_only:
+                        for promotion in PROMOTIONS:
+                            append(sq | (to_sq << 6) | promotion)
+                elif not noisy_only:
+                    append(sq | (to_sq << 6))
+            if sq >> 3 == start_row and not noisy_only:
+                double_sq = to_sq + forward
+                if not (occupied >> double_sq) & 1 and (allowed >> double_sq) & 1:
+                    append(sq | (double_sq << 6) | FLAG_DOUBLE_PUSH)
+
+        if quiet_only:
+            continue
+
+        targets = pawn_attacks[sq] & enemy & allowed
+        while targets:
+            to_low = targets & -targets
+            targets ^= to_low
+            to_sq = to_low.bit_length() - 1
+            if to_sq >> 3 == promotion_row:
+                for promotion in PROMOTIONS:
+                    append(sq | (to_sq << 6) | promotion)
+            else:
+                append(sq | (to_sq << 6))
+
+        if ep_square is not None and (pawn_attacks[sq] >> ep_square) & 1:
+            # Взятие на проходе убирает две пешки с одной горизонтали,
+            # поэтому его легальность проверяется пробным ходом
+            move = sq | (ep_square << 6) | FLAG_EN_PASSANT
+            board.make_move(move)
+            if not board.is_square_attacked(board.king_square(us), us ^ 1):
+                append(move)
+            board.unmake_move()
+
+
+def _add_castling_moves(board, moves, us, occupied):
+    if us == WHITE:
+        king_sq, kingside, queenside = 60, 1, 2
+    else:
+        king_sq, kingside, queenside = 4, 4, 8
+    them = us ^ 1
+
+    if (board.castling & kingside and not (occupied >> (king_sq + 1)) & 3
+            and not attackers_to(board, king_sq + 1, them, occupied)
+            and not attackers_to(board, king_sq + 2, them, occupied)):
+        moves.append(king_sq | ((king_sq + 2) << 6) | FLAG_CASTLING)
+    if (board.castling & queenside and not (occupied >> (king_sq - 3)) & 7
+            and not attackers_to(board, king_sq - 1, them, occupied)
+            and not attackers_to(board, king_sq - 2, them, occupied)):
+        moves.append(king_sq | ((king_sq - 2) << 6) | FLAG_CASTLING)
+
+
+def is_legal(board, move):
+    """Легален ли ход, взятый не из генератора (из таблицы транспозиций, книги).
+
+    Сначала дешевая проверка, что фигура вообще так ходит, затем пробный ход
+    на шах своему королю.
+    """
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    squares = board.squares
+    piece = squares[from_sq]
+    us = board.side
+    if move >> 18 or not piece or piece >> 3 != us or from_sq == to_sq:
+        return False
+    target = squares[to_sq]
+    if target and (target >> 3 == us or target & 7 == KING):
+        return False
+
+    piece_type = piece & 7
+    to_bit = 1 << to_sq
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    if move & FLAG_CASTLING:
+        castling = []
+        if board.castling and piece_type == KING and not board.in_check():
+            _add_castling_moves(board, castling, us, board.occupied[0] | board.occupied[1])
+        return move in castling
+    if piece_type == PAWN:
+        forward = -8 if us == WHITE else 8
+        if (to_sq >> 3 in (0, 7)) != bool(promotion) or promotion in (PAWN, KING, 7):
+            return False
+        if move & FLAG_EN_PASSANT:
+            if move & FLAG_DOUBLE_PUSH:
+                return False
+            if to_sq != board.ep_square or not PAWN_ATTACKS[us][from_sq] & to_bit:
+                return False
+        elif move & FLAG_DOUBLE_PUSH:
+            if (from_sq >> 3 != (6 if us == WHITE else 1) or target
+                    or squares[from_sq + forward] or to_sq != from_sq + 2 * forward):
+                return False
+        elif target:
+            if not PAWN_ATTACKS[us][from_sq] & to_bit:
+                return False
+        elif to_sq != from_sq + forward:
+            return False
+    else:
+        if promotion or move & (FLAG_EN_PASSANT | FLAG_DOUBLE_PUSH):
+            return False
+        occupied = board.occupied[0] | board.occupied[1]
+        if piece_type == KNIGHT:
+            attacks = KNIGHT_ATTACKS[from_sq]
+        elif piece_type == KING:
+            attacks = KING_ATTACKS[from_sq]
+        elif piece_type == BISHOP:
+            attacks = bishop_attacks(from_sq, occupied)
+        elif piece_type == ROOK:
+            attacks = rook_attacks(from_sq, occupied)
+        else:
+            attacks = bishop_attacks(from_sq, occupied) | rook_attacks(from_sq, occupied)
+        if not attacks & to_bit:
+            return False
+
+    board.make_move(move)
+    legal = not board.is_square_attacked(board.king_square(us), us ^ 1)
+    board.unmake_move()
+    return legal
+
+
+def perft(board, depth):
+    if depth == 0:
+        return 1
+    moves = generate_moves(board)
+    if depth == 1:
+        return len(moves)
+    nodes = 0
+    for move in moves:
+        board.make_move(move)
+        nodes += perft(board, depth - 1)
+        board.unmake_move()
+    return nodes
+
+
+def run_perft_suite(max_depth=3, out=sys.stdout):
+    """Проверяет генератор на эталонных позициях; возвращает True, если все совпало"""
+    all_ok = True
+    for name, fen, expected in PERFT_SUITE:
+        board = SearchBoard.from_fen(fen)
+        for depth, expected_nodes in enumerate(expected[:max_depth], start=1):
+            start = time.perf_counter()
+            nodes = perft(board, depth)
+            elapsed = time.perf_counter() - start
+            ok = nodes == expected_nodes
+            all_ok = all_ok and ok
+            print(f"{name:12} depth {depth}: {nodes:>10} {'ok' if ok else f'ОЖИДАЛОСЬ {expected_nodes}'}"
+                  f"  {elapsed:.2f} c", file=out)
+    return all_ok
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='perft для генератора ходов ChessAI')
+    parser.add_argument('--depth', type=int, default=3, help='максимальная глубина эталонного набора')
+    parser.add_argument('--fen', help='посчитать perft для одной позиции')
+    args = parser.parse_args(argv)
+
+    if args.fen:
+        print(perft(SearchBoard.from_fen(args.fen), args.depth))
+        return 0
+    return 0 if run_perft_suite(args.depth) else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
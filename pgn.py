@@ -0,0 +1,178 @@
+"""Чтение партий PGN и запись ходов в алгебраической нотации (SAN).
+
+Файл читается построчно, партии отдаются по одной, поэтому большие
+коллекции не загружаются в память целиком.
+"""
+import re
+
+from movegen import generate_moves
+from search_board import (BISHOP, FLAG_CASTLING, KING, KNIGHT, PAWN, PROMOTION_SHIFT, QUEEN, ROOK,
+                          square_name)
+
+SAN_PIECES = {'N': KNIGHT, 'B': BISHOP, 'R': ROOK, 'Q': QUEEN, 'K': KING}
+SAN_SYMBOLS = {code: symbol for symbol, code in SAN_PIECES.items()}
+RESULTS = ('1-0', '0-1', '1/2-1/2', '*')
+
+_HEADER_RE = re.compile(r'\[\s*(\w+)\s+"(.*)"\s*\]')
+_SAN_RE = re.compile(r'^([NBRQK])?([a-h])?([1-8])?x?([a-h][1-8])(?:=?([NBRQ]))?$')
+_MOVE_NUMBER_RE = re.compile(r'^\d+\.+')
+
+
+def read_games(source):
+    """Партии из файла PGN (путь или открытый файл): (заголовки, список ходов SAN)"""
+    if isinstance(source, str):
+        with open(source, encoding='utf-8', errors='replace') as f:
+            yield from read_games(f)
+        return
+
+    headers = {}
+    movetext = []
+    for line in source:
+        line = line.strip()
+        if line.startswith('%'):
+            continue
+        if line.startswith('['):
+            if movetext:
+                yield headers, parse_movetext('\n'.join(movetext))
+                headers, movetext = {}, []
+            match = _HEADER_RE.match(line)
+            if match:
+                headers[match.group(1)] = match.group(2)
+        elif line:
+            movetext.append(line)
+    if headers or movetext:
+        yield headers, parse_movetext('\n'.join(movetext))
+
+
+def parse_movetext(text):
+    """Ходы SAN основного варианта без комментариев, вариантов, NAG и номеров ходов"""
+    moves = []
+    depth = 0
+    in_comment = False
+    for token in re.findall(r'\{|\}|\(|\)|;[^\n]*|[^\s{}();]+', text):
+        if in_comment:
+            in_comment = token != '}'
+            continue
+        if token == '{':
+            in_comment = True
+        elif token == '(':
+            depth += 1
+        elif token == ')':
+            depth -= 1
+        elif depth or token.startswith((';', '$')) or token in RESULTS:
+            continue
+        else:
+            token = _MOVE_NUMBER_RE.sub('', token)
+            if token:
+                moves.append(token)
+    return moves
+
+
+def parse_san(board, san):
+    """Ход SearchBoard по записи SAN; ValueError, если ход нелегален или запись неоднозначна"""
+    text = san.rstrip('+#!?')
+    moves = generate_moves(board)
+
+    if text in ('O-O', '0-0', 'O-O-O', '0-0-0'):
+        kingside = len(text) == 3
+        for move in moves:
+            if move & FLAG_CASTLING and (((move >> 6) & 7) == 6) == kingside:
+                return move
+        raise ValueError(f'Рокировка {san} невозможна')
+
+    match = _SAN_RE.match(text)
+    if not match:
+        raise ValueError(f'Непонятная запись хода: {san}')
+    piece_symbol, from_file, from_rank, to_name, promotion_symbol = match.groups()
+    piece_type = SAN_PIECES[piece_symbol] if piece_symbol else PAWN
+    to_sq = (8 - int(to_name[1])) * 8 + ord(to_name[0]) - ord('a')
+    promotion = SAN_PIECES[promotion_symbol] if promotion_symbol else 0
+
+    squares = board.squares
+    candidates = []
+    for move in moves:
+        from_sq = move & 63
+        if ((move >> 6) & 63 != to_sq or squares[from_sq] & 7 != piece_type
+                or (move >> PROMOTION_SHIFT) & 7 != promotion):
+            continue
+        if from_file and from_sq & 7 != ord(from_file) - ord('a'):
+            continue
+        if from_rank and from_sq >> 3 != 8 - int(from_rank):
+            continue
+        candidates.append(move)
+
+    if len(candidates) != 1:
+        raise ValueError(f'Ход {san} {"неоднозначен" if candidates else "невозможен"}')
+    return candidates[0]
+
+
+def move_to_san(board, move):
+    """Запись SAN легального хода в текущей позиции (с + и #)"""
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    squares = board.squares
+    piece_type = squares[from_sq] & 7
+
+    if move & FLAG_CASTLING:
+        san = 'O-O' if to_sq & 7 == 6 else 'O-O-O'
+    else:
+        is_capture = bool(squares[to_sq]) or (piece_type == PAWN and from_sq & 7 != to_sq & 7)
+        if piece_type == PAWN:
+            san = square_name(from_sq)[0] + 'x' if is_capture else ''
+        else:
+            san = SAN_SYMBOLS[piece_type]
+            rivals = [other & 63 for other in generate_moves(board)
+                      if (other >> 6) & 63 == to_sq and other & 63 != from_sq
+                      and squares[other & 63] & 7 == piece_type]
+            if rivals:
+                name = square_name(from_sq)
+                if all(sq & 7 != from_sq & 7 for sq in rivals):
+                    san += name[0]
+                elif all(sq >> 3 != from_sq >> 3 for sq in rivals):
+                    san += name[1]
+                else:
+                    san += name
+            if is_capture:
+                san += 'x'
+        san += square_name(to_sq)
+        promotion = (move >> PROMOTION_SHIFT) & 7
+        if promotion:
+            san += '=' + SAN_SYMBOLS[promotion]
+
+    board.make_move(move)
+    if board.in_check():
+        san += '#' if not generate_moves(board) else '+'
+    board.unmake_move()
+    return san
+
+
+def format_game(headers, sans, result, first_move_number=1, black_first=False):
+    """Текст партии PGN: заголовки (семь обязательных первыми) и ходы по 80 символов в строке"""
+    tags = dict.fromkeys(('Event', 'Site', 'Date', 'Round', 'White', 'Black', 'Result'), '?')
+    tags.update(headers)
+    tags['Result'] = result
+    lines = [f'[{name} "{value}"]' for name, value in tags.items()]
+    lines.append('')
+
+    tokens = []
+    number = first_move_number
+    if black_first and sans:
+        tokens.append(f'{number}...')
+    for index, san in enumerate(sans):
+        white_to_move = (index % 2 == 0) != black_first
+        if white_to_move:
+            tokens.append(f'{number}.')
+        else:
+            number += 1
+        tokens.append(san)
+    tokens.append(result)
+
+    line = ''
+    for token in tokens:
+        if line and len(line) + 1 + len(token) > 80:
+            lines.append(line)
+            line = token
+        else:
+            line = f'{line} {token}' if line else token
+    lines.append(line)
+    return '\n'.join(lines) + '\n\n'
@@ -0,0 +1,397 @@
+from evaluation import DEFAULT_TABLES
+from bitboards import KING_ATTACKS, KNIGHT_ATTACKS, PAWN_ATTACKS, bishop_attacks, rook_attacks
+from zobrist import (CASTLING_KEYS, CASTLING_MASKS, EN_PASSANT_KEYS, PIECE_CODES, PIECE_KEYS, SIDE_KEY,
+                     castling_rights, en_passant_file, piece_code)
+
+WHITE = 0
+BLACK = 1
+COLOR_NAMES = ('white', 'black')
+
+EMPTY = 0
+PAWN = 1
+KNIGHT = 2
+BISHOP = 3
+ROOK = 4
+QUEEN = 5
+KING = 6
+PIECE_NAMES = {code: name for name, code in PIECE_CODES.items()}
+
+START_FEN = 'rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'
+
+# Ход - целое число: from | to << 6 | фигура превращения << 12 | флаги
+PROMOTION_SHIFT = 12
+FLAG_CASTLING = 1 << 15
+FLAG_EN_PASSANT = 1 << 16
+FLAG_DOUBLE_PUSH = 1 << 17
+# Пустой ход: a8-a8 не встречается среди настоящих ходов
+NULL_MOVE = 0
+
+FEN_PIECES = {'p': PAWN, 'n': KNIGHT, 'b': BISHOP, 'r': ROOK, 'q': QUEEN, 'k': KING}
+FEN_SYMBOLS = {code: symbol for symbol, code in FEN_PIECES.items()}
+
+# Ладья при рокировке: поле назначения короля -> (откуда, куда)
+CASTLING_ROOKS = {62: (63, 61), 58: (56, 59), 6: (7, 5), 2: (0, 3)}
+
+
+def encode_move(from_sq, to_sq, promotion=0, flags=0):
+    return from_sq | (to_sq << 6) | (promotion << PROMOTION_SHIFT) | flags
+
+
+def square_name(sq):
+    return 'abcdefgh'[sq & 7] + str(8 - (sq >> 3))
+
+
+def parse_square(name):
+    return (8 - int(name[1])) * 8 + 'abcdefgh'.index(name[0])
+
+
+def move_to_uci(move):
+    text = square_name(move & 63) + square_name((move >> 6) & 63)
+    promotion = (move >> PROMOTION_SHIFT) & 7
+    if promotion:
+        text += FEN_SYMBOLS[promotion]
+    return text
+
+
+def move_to_positions(move):
+    """Ход в формате GUI: ((row, col), (row, col))"""
+    from_sq = move & 63
+    to_sq = (move >> 6) & 63
+    return (from_sq >> 3, from_sq & 7), (to_sq >> 3, to_sq & 7)
+
+
+class SearchBoard:
+    """Компактная доска для поиска: 64 целых числа, списки полей и битборды по фигурам.
+
+    make_move/unmake_move кладут записи отката в стек, поэтому позицию
+    можно откатить на любое число ходов без копирования объектов. Суммы
+    таблиц оценки (mg_score, eg_score) и фаза партии тоже ведутся
+    инкрементально, так что оценка листа стоит O(1).
+    """
+
+    def __init__(self, eval_tables=DEFAULT_TABLES):
+        self.squares = [EMPTY] * 64
+        self.piece_lists = [[] for _ in range(16)]
+        self.bitboards = [0] * 16
+        self.occupied = [0, 0]
+        self.side = WHITE
+        self.castling = 0
+        self.ep_square = None
+        self.halfmove_clock = 0
+        self.fullmove_number = 1
+        self.key = 0
+        self.history = []
+
+        self.eval_tables = eval_tables
+        self.mg_score = 0
+        self.eg_score = 0
+        self.phase = 0
+
+    @classmethod
+    def from_fen(cls, fen=START_FEN):
+        board = cls()
+        fields = fen.split()
+        for row, rank in enumerate(fields[0].split('/')):
+            col = 0
+            for symbol in rank:
+                if symbol.isdigit():
+                    col += int(symbol)
+                    continue
+                code = FEN_PIECES[symbol.lower()] | (0 if symbol.isupper() else 8)
+                board._put(code, row * 8 + col)
+                col += 1
+
+        board.side = WHITE if len(fields) < 2 or fields[1] == 'w' else BLACK
+        rights = fields[2] if len(fields) > 2 else '-'
+        for symbol, flag in zip('KQkq', (1, 2, 4, 8)):
+            if symbol in rights:
+                board.castling |= flag
+        if len(fields) > 3 and fields[3] != '-':
+            board.ep_square = parse_square(fields[3])
+        if len(fields) > 5:
+            board.halfmove_clock = int(fields[4])
+            board.fullmove_number = int(fields[5])
+
+        board.key = board.compute_key()
+        return board
+
+    @classmethod
+    def from_board(cls, gui_board, side_to_move):
+        """Снимок доски GUI; права на рокировку берутся из флагов has_moved"""
+        board = cls()
+        for row in range(8):
+            for col in range(8):
+                piece = gui_board.get_piece((row, col))
+                if piece:
+                    board._put(piece_code(piece), row * 8 + col)
+
+        board.side = WHITE if side_to_move == 'white' else BLACK
+        board.castling = castling_rights(gui_board)
+        ep_file = en_passant_file(gui_board)
+        if ep_file is not None:
+            board.ep_square = (2 if board.side == WHITE else 5) * 8 + ep_file
+
+        board.key = board.compute_key()
+        return board
+
+    def copy(self):
+        board = SearchBoard(self.eval_tables)
+        board.squares = self.squares[:]
+        board.piece_lists = [squares[:] for squares in self.piece_lists]
+        board.bitboards = self.bitboards[:]
+        board.occupied = self.occupied[:]
+        board.side = self.side
+        board.castling = self.castling
+        board.ep_square = self.ep_square
+        board.halfmove_clock = self.halfmove_clock
+        board.fullmove_number = self.fullmove_number
+        board.key = self.key
+        board.history = self.history[:]
+        board.mg_score = self.mg_score
+        board.eg_score = self.eg_score
+        board.phase = self.phase
+        return board
+
+    def fen(self):
+        ranks = []
+        for row in range(8):
+            rank = ''
+            empty = 0
+            for col in range(8):
+                code = self.squares[row * 8 + col]
+                if code == EMPTY:
+                    empty += 1
+                    continue
+                if empty:
+                    rank += str(empty)
+                    empty = 0
+                symbol = FEN_SYMBOLS[code & 7]
+                rank += symbol.upper() if code < 8 else symbol
+            if empty:
+                rank += str(empty)
+            ranks.append(rank)
+
+        rights = ''.join(symbol for symbol, flag in zip('KQkq', (1, 2, 4, 8)) if self.castling & flag)
+        ep = square_name(self.ep_square) if self.ep_square is not None else '-'
+        return (f"{'/'.join(ranks)} {'wb'[self.side]} {rights or '-'} {ep} "
+                f"{self.halfmove_clock} {self.fullmove_number}")
+
+    def _put(self, code, sq):
+        self.squares[sq] = code
+        self.piece_lists[code].append(sq)
+        self.bitboards[code] |= 1 << sq
+        self.occupied[code >> 3] |= 1 << sq
+        self.mg_score += self.eval_tables.mg[code][sq]
+        self.eg_score += self.eval_tables.eg[code][sq]
+        self.phase += self.eval_tables.phase[code]
+
+    def set_eval_tables(self, eval_tables):
+        """Другие таблицы оценки (например, после настройки); суммы пересчитываются"""
+        self.eval_tables = eval_tables
+        self.mg_score = self.eg_score = self.phase = 0
+        for sq, code in enumerate(self.squares):
+            if code:
+                self.mg_score += eval_tables.mg[code][sq]
+                self.eg_score += eval_tables.eg[code][sq]
+                self.phase += eval_tables.phase[code]
+
+    def compute_key(self):
+        key = 0
+        for sq, code in enumerate(self.squares):
+            if code:
+                key ^= PIECE_KEYS[code][sq]
+        key ^= CASTLING_KEYS[self.castling]
+        if self.ep_square is not None:
+            key ^= EN_PASSANT_KEYS[self.ep_square & 7]
+        if self.side == BLACK:
+            key ^= SIDE_KEY
+        return key
+
+    def king_square(self, color):
+        return self.piece_lists[KING | (color << 3)][0]
+
+    def is_square_attacked(self, sq, by_color):
+        bitboards = self.bitboards
+        them = by_color << 3
+        if KNIGHT_ATTACKS[sq] & bitboards[KNIGHT | them]:
+            return True
+        if PAWN_ATTACKS[by_color ^ 1][sq] & bitboards[PAWN | them]:
+            return True
+        if KING_ATTACKS[sq] & bitboards[KING | them]:
+            return True
+        occupied = self.occupied[0] | self.occupied[1]
+        queens = bitboards[QUEEN | them]
+        if rook_attacks(sq, occupied) & (bitboards[ROOK | them] | queens):
+            return True
+        return bool(bishop_attacks(sq, occupied) & (bitboards[BISHOP | them] | queens))
+
+    def in_check(self):
+        return self.is_square_attacked(self.king_square(self.side), self.side ^ 1)
+
+    def make_move(self, move):
+        squares = self.squares
+        piece_lists = self.piece_lists
+        bitboards = self.bitboards
+        occupied = self.occupied
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+        piece = squares[from_sq]
+        captured = squares[to_sq]
+        us = piece >> 3
+        mg_table = self.eval_tables.mg
+        eg_table = self.eval_tables.eg
+
+        self.history.append((move, captured, self.castling, self.ep_square, self.halfmove_clock, self.key,
+                             self.mg_score, self.eg_score, self.phase))
+
+        key = self.key ^ PIECE_KEYS[piece][from_sq]
+        mg = self.mg_score - mg_table[piece][from_sq]
+        eg = self.eg_score - eg_table[piece][from_sq]
+        if captured:
+            key ^= PIECE_KEYS[captured][to_sq]
+            mg -= mg_table[captured][to_sq]
+            eg -= eg_table[captured][to_sq]
+            self.phase -= self.eval_tables.phase[captured]
+            piece_lists[captured].remove(to_sq)
+            bitboards[captured] ^= to_bit
+            occupied[us ^ 1] ^= to_bit
+        elif move & FLAG_EN_PASSANT:
+            victim_sq = (from_sq & 56) | (to_sq & 7)
+            victim = squares[victim_sq]
+            key ^= PIECE_KEYS[victim][victim_sq]
+            mg -= mg_table[victim][victim_sq]
+            eg -= eg_table[victim][victim_sq]
+            piece_lists[victim].remove(victim_sq)
+            bitboards[victim] ^= 1 << victim_sq
+            occupied[us ^ 1] ^= 1 << victim_sq
+            squares[victim_sq] = EMPTY
+
+        squares[from_sq] = EMPTY
+        occupied[us] ^= from_bit | to_bit
+        promotion = (move >> PROMOTION_SHIFT) & 7
+        if promotion:
+            piece_lists[piece].remove(from_sq)
+            bitboards[piece] ^= from_bit
+            piece = promotion | (piece & 8)
+            piece_lists[piece].append(to_sq)
+            bitboards[piece] ^= to_bit
+            self.phase += self.eval_tables.phase[piece]
+        else:
+            squares_list = piece_lists[piece]
+            squares_list[squares_list.index(from_sq)] = to_sq
+            bitboards[piece] ^= from_bit | to_bit
+        squares[to_sq] = piece
+        key ^= PIECE_KEYS[piece][to_sq]
+        mg += mg_table[piece][to_sq]
+        eg += eg_table[piece][to_sq]
+
+        if move & FLAG_CASTLING:
+            rook_from, rook_to = CASTLING_ROOKS[to_sq]
+            rook = squares[rook_from]
+            squares[rook_from] = EMPTY
+            squares[rook_to] = rook
+            rook_list = piece_lists[rook]
+            rook_list[rook_list.index(rook_from)] = rook_to
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            bitboards[rook] ^= rook_bits
+            occupied[us] ^= rook_bits
+            key ^= PIECE_KEYS[rook][rook_from] ^ PIECE_KEYS[rook][rook_to]
+            mg += mg_table[rook][rook_to] - mg_table[rook][rook_from]
+            eg += eg_table[rook][rook_to] - eg_table[rook][rook_from]
+
+        castling = self.castling & CASTLING_MASKS[from_sq] & CASTLING_MASKS[to_sq]
+        if castling != self.castling:
+            key ^= CASTLING_KEYS[self.castling] ^ CASTLING_KEYS[castling]
+            self.castling = castling
+
+        if self.ep_square is not None:
+            key ^= EN_PASSANT_KEYS[self.ep_square & 7]
+        if move & FLAG_DOUBLE_PUSH:
+            self.ep_square = (from_sq + to_sq) >> 1
+            key ^= EN_PASSANT_KEYS[to_sq & 7]
+        else:
+            self.ep_square = None
+
+        if captured or piece & 7 == PAWN or promotion:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if us == BLACK:
+            self.fullmove_number += 1
+
+        self.side = us ^ 1
+        self.key = key ^ SIDE_KEY
+        self.mg_score = mg
+        self.eg_score = eg
+
+    def unmake_move(self):
+        (move, captured, self.castling, self.ep_square, self.halfmove_clock, self.key,
+         self.mg_score, self.eg_score, self.phase) = self.history.pop()
+        squares = self.squares
+        piece_lists = self.piece_lists
+        bitboards = self.bitboards
+        occupied = self.occupied
+        from_sq = move & 63
+        to_sq = (move >> 6) & 63
+        from_bit = 1 << from_sq
+        to_bit = 1 << to_sq
+
+        us = self.side ^ 1
+        self.side = us
+        if us == BLACK:
+            self.fullmove_number -= 1
+
+        piece = squares[to_sq]
+        occupied[us] ^= from_bit | to_bit
+        if (move >> PROMOTION_SHIFT) & 7:
+            piece_lists[piece].remove(to_sq)
+            bitboards[piece] ^= to_bit
+            piece = PAWN | (piece & 8)
+            piece_lists[piece].append(from_sq)
+            bitboards[piece] ^= from_bit
+        else:
+            squares_list = piece_lists[piece]
+            squares_list[squares_list.index(to_sq)] = from_sq
+            bitboards[piece] ^= from_bit | to_bit
+        squares[from_sq] = piece
+        squares[to_sq] = captured
+        if captured:
+            piece_lists[captured].append(to_sq)
+            bitboards[captured] ^= to_bit
+            occupied[us ^ 1] ^= to_bit
+        elif move & FLAG_EN_PASSANT:
+            victim_sq = (from_sq & 56) | (to_sq & 7)
+            victim = PAWN | ((us ^ 1) << 3)
+            squares[victim_sq] = victim
+            piece_lists[victim].append(victim_sq)
+            bitboards[victim] ^= 1 << victim_sq
+            occupied[us ^ 1] ^= 1 << victim_sq
+
+        if move & FLAG_CASTLING:
+            rook_from, rook_to = CASTLING_ROOKS[to_sq]
+            rook = squares[rook_to]
+            squares[rook_to] = EMPTY
+            squares[rook_from] = rook
+            rook_list = piece_lists[rook]
+            rook_list[rook_list.index(rook_to)] = rook_from
+            rook_bits = (1 << rook_from) | (1 << rook_to)
+            bitboards[rook] ^= rook_bits
+            occupied[us] ^= rook_bits
+
+    def make_null_move(self):
+        """Передача хода без хода (для отсечения нулевым ходом)"""
+        self.history.append((NULL_MOVE, EMPTY, self.castling, self.ep_square, self.halfmove_clock, self.key,
+                             self.mg_score, self.eg_score, self.phase))
+        key = self.key ^ SIDE_KEY
+        if self.ep_square is not None:
+            key ^= EN_PASSANT_KEYS[self.ep_square & 7]
+            self.ep_square = None
+        self.key = key
+        self.halfmove_clock += 1
+        self.side ^= 1
+
+    def unmake_null_move(self):
+        _, _, self.castling, self.ep_square, self.halfmove_clock, self.key, _, _, _ = self.history.pop()
+        self.side ^= 1
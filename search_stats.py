@@ -0,0 +1,52 @@
+"""Статистика и профилирование поиска ChessAI.
+
+Счетчики узлов, отсечений и таблицы транспозиций ведутся всегда и почти
+ничего не стоят. Замер времени по частям поиска включается только
+профилировщиком: он подменяет функции на обертки с таймером, поэтому без
+него поиск не выполняет ни одной лишней проверки.
+"""
+import json
+import time
+
+PROFILE_SECTIONS = ('movegen', 'evaluation', 'hashing')
+
+
+class SearchProfiler:
+    """Время в генераторе ходов, оценке и таблице транспозиций"""
+
+    def __init__(self):
+        self.times = dict.fromkeys(PROFILE_SECTIONS, 0.0)
+
+    def reset(self):
+        for section in self.times:
+            self.times[section] = 0.0
+
+    def wrap(self, section, function):
+        times = self.times
+        perf_counter = time.perf_counter
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                times[section] += perf_counter() - start
+
+        return timed
+
+
+class JsonTrace:
+    """Слушатель ChessAI: каждый завершенный поиск дописывается в файл строкой JSON"""
+
+    def __init__(self, path):
+        self.path = path
+
+    def __call__(self, event, data):
+        if event != 'search':
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(data, ensure_ascii=False) + '\n')
+
+
+def ratio(part, total):
+    return round(part / total, 4) if total else 0.0
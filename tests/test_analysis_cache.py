@@ -0,0 +1,104 @@
+import math
+import threading
+
+import pytest
+
+import analysis_cache
+from analysis_cache import AnalysisCache, params_salt
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = AnalysisCache(str(tmp_path / 'cache.db'), max_entries=10)
+    yield cache
+    cache.close()
+
+
+def used(cache, key):
+    return cache.connection.execute('SELECT used FROM positions WHERE key = ?', (cache._key(key),)).fetchone()[0]
+
+
+def test_round_trip_and_unsigned_keys(cache):
+    big_key = (1 << 64) - 1
+    cache.store_many([(1, 4, 25, 0, 100), (big_key, 3, -7.5, 1, None)])
+    assert cache.get(1) == (4, 25, 0, 100)
+    assert cache.get(big_key) == (3, -7.5, 1, None)
+    assert cache.get(2) is None
+    assert (cache.hits, cache.misses) == (2, 1)
+
+
+def test_shallower_result_does_not_replace_deeper(cache):
+    cache.store_many([(1, 6, 30, 0, 100)])
+    cache.store_many([(1, 2, -50, 0, 200)])
+    assert cache.get(1) == (6, 30, 0, 100)
+    cache.store_many([(1, 6, 10, 0, 300)])
+    assert cache.get(1) == (6, 10, 0, 300)
+
+
+def test_infinite_scores_are_not_stored(cache):
+    cache.store_many([(1, 3, math.inf, 0, None), (2, 3, -math.inf, 0, None)])
+    assert len(cache) == 0
+
+
+def test_salt_separates_parameter_sets(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    first = AnalysisCache(path, salt=params_salt({'knight': 320}))
+    second = AnalysisCache(path, salt=params_salt({'knight': 300}))
+    first.store_many([(1, 4, 25, 0, 100)])
+    assert first.get(1) is not None
+    assert second.get(1) is None
+    first.close()
+    second.close()
+
+
+def test_prune_evicts_least_recently_used_shallow_entries(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(analysis_cache.time, 'time', lambda: clock[0])
+    for key in range(10):
+        clock[0] += 1
+        cache.store_many([(key, 1, 0, 0, None)])
+    assert len(cache) == 10
+
+    # Переполнение: уходят самые давние мелкие записи, а глубокая живет дольше
+    # (каждый полуход - DEPTH_BONUS_SECONDS)
+    clock[0] += 1
+    cache.store_many([(100, 8, 0, 0, None)])
+    assert cache.get(0) is None and cache.get(1) is None
+    assert cache.get(100) is not None
+
+    # Использованная запись становится свежей
+    clock[0] += analysis_cache.TOUCH_INTERVAL_SECONDS
+    assert cache.get(2) is not None
+    cache.store_many([(key, 1, 0, 0, None) for key in (200, 201, 202)])
+    assert len(cache) <= cache.max_entries
+    assert cache.get(2) is not None
+    assert cache.get(3) is None
+
+
+def test_recency_is_refreshed_only_after_interval(cache, monkeypatch):
+    clock = [1000.0]
+    monkeypatch.setattr(analysis_cache.time, 'time', lambda: clock[0])
+    cache.store_many([(1, 4, 25, 0, 100)])
+    clock[0] += analysis_cache.TOUCH_INTERVAL_SECONDS - 1
+    cache.get(1)
+    assert used(cache, 1) == 1000.0
+    clock[0] += 1
+    cache.get(1)
+    assert used(cache, 1) == clock[0]
+
+
+def test_shared_between_connections_and_threads(tmp_path):
+    path = str(tmp_path / 'cache.db')
+    writer = AnalysisCache(path)
+    reader = AnalysisCache(path)
+    writer.store_many([(7, 5, 12, 0, 42)])
+    assert reader.get(7) == (5, 12, 0, 42)
+
+    # ChessAI создает кэш в одном потоке, а ищет в другом
+    results = []
+    thread = threading.Thread(target=lambda: results.append(writer.get(7)))
+    thread.start()
+    thread.join()
+    assert results == [(5, 12, 0, 42)]
+    writer.close()
+    reader.close()
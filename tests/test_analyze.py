@@ -0,0 +1,117 @@
+import csv
+import io
+import json
+
+import pytest
+
+import analyze
+from analyze import FIELDS, analyze_position, iter_positions, run_analysis
+
+POSITIONS = '''# позиции для анализа
+rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 id "e4";
+6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1
+r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3
+8/8/8/8/8/8/8/8 w - - 0 1
+4k3/8/8/8/8/8/8/4K2P w - - 0 1
+'''
+
+GAMES = '''[Event "first"]
+
+1. e4 e5 2. Nf3 *
+
+[Event "second"]
+[FEN "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"]
+[SetUp "1"]
+
+1. e4 Kd7 *
+'''
+
+
+@pytest.fixture
+def positions(tmp_path):
+    path = tmp_path / 'positions.epd'
+    path.write_text(POSITIONS, encoding='utf-8')
+    return path
+
+
+def read_jsonl(path):
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f]
+
+
+def test_iter_positions_epd_and_fen(positions):
+    found = list(iter_positions(str(positions)))
+    assert [position_id for position_id, _ in found] == ['e4', '3', '4', '5', '6']
+    assert found[0][1] == 'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3'
+    assert found[1][1] == '6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1'
+
+
+def test_iter_positions_pgn(tmp_path):
+    path = tmp_path / 'games.pgn'
+    path.write_text(GAMES, encoding='utf-8')
+    found = list(iter_positions(str(path)))
+    assert [position_id for position_id, _ in found] == ['1:0', '1:1', '1:2', '2:0', '2:1']
+    assert found[3][1].startswith('4k3/8/8/8/8/8/4P3/4K3 w')
+    assert [position_id for position_id, _ in iter_positions(str(path), every=2, skip_plies=1)] == ['1:1', '2:1']
+
+
+@pytest.mark.parametrize('fen', [
+    '8/8/8/8/8/8/8/8 w - - 0 1',
+    '4k3/8/8/8/8/8/8/4K2P w - - 0 1',
+    'P3k3/8/8/8/8/8/8/4K3 b - - 0 1',
+    # Ходят белые, а черный король под шахом
+    '4k3/8/8/8/8/8/8/4R1K1 w - - 0 1',
+    'not a fen',
+])
+def test_invalid_positions_give_empty_rows(fen):
+    analyze._init_worker({'depth': 1, 'bitbase_dir': None}, None)
+    result = analyze_position('x', fen)
+    assert result['id'] == 'x' and result['fen'] == fen
+    assert all(result[field] is None for field in FIELDS[2:])
+
+
+def test_run_analysis_jsonl_and_csv(positions, tmp_path):
+    options = {'depth': 1, 'bitbase_dir': None}
+    output = tmp_path / 'out.jsonl'
+    assert run_analysis(str(positions), str(output), workers=1, ai_options=options, out=io.StringIO()) == 5
+    rows = read_jsonl(output)
+    assert [row['id'] for row in rows] == ['e4', '3', '4', '5', '6']
+    assert rows[1]['best_move'] == 'd1d8' and rows[1]['depth'] == 1
+    assert rows[3]['best_move'] is None and rows[4]['best_move'] is None
+
+    output = tmp_path / 'out.csv'
+    run_analysis(str(positions), str(output), output_format='csv', workers=1, ai_options=options, out=io.StringIO())
+    with open(output, encoding='utf-8', newline='') as f:
+        table = list(csv.DictReader(f))
+    assert [row['id'] for row in table] == ['e4', '3', '4', '5', '6']
+    assert table[1]['best_move'] == 'd1d8' and table[3]['best_move'] == ''
+
+
+def test_resume_continues_from_checkpoint(positions, tmp_path):
+    options = {'depth': 1, 'bitbase_dir': None}
+    output = tmp_path / 'out.jsonl'
+    checkpoint = tmp_path / 'out.jsonl.checkpoint'
+    run_analysis(str(positions), str(output), workers=1, ai_options=options, out=io.StringIO())
+    expected = [(row['id'], row['best_move']) for row in read_jsonl(output)]
+    assert json.loads(checkpoint.read_text())['done'] == 5
+
+    # Завершенный прогон продолжать нечего
+    assert run_analysis(str(positions), str(output), workers=1, ai_options=options, resume=True,
+                        out=io.StringIO()) == 0
+    assert len(read_jsonl(output)) == 5
+
+    # Прерванный прогон: точка после двух позиций, а дальше в файле недописанный хвост
+    with open(output, 'rb') as f:
+        head = f.readline() + f.readline()
+    output.write_bytes(head + b'{"id": "3", "fen')
+    checkpoint.write_text(json.dumps({'input': str(positions.resolve()), 'done': 2, 'offset': len(head)}))
+    assert run_analysis(str(positions), str(output), workers=1, ai_options=options, resume=True,
+                        checkpoint_every=1, out=io.StringIO()) == 3
+    assert [(row['id'], row['best_move']) for row in read_jsonl(output)] == expected
+
+
+def test_checkpoint_of_other_input_is_rejected(positions, tmp_path):
+    output = tmp_path / 'out.jsonl'
+    (tmp_path / 'out.jsonl.checkpoint').write_text(json.dumps({'input': '/elsewhere.epd', 'done': 1, 'offset': 0}))
+    with pytest.raises(SystemExit):
+        run_analysis(str(positions), str(output), workers=1, resume=True, out=io.StringIO())
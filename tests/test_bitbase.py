@@ -0,0 +1,119 @@
+import io
+import os
+import random
+import shutil
+
+import pytest
+
+from bitbase import DRAW, LOSS, TABLES, WIN, Bitbases, build_tables
+from movegen import generate_moves
+from search_board import SearchBoard, move_to_uci
+
+
+@pytest.fixture(scope='module')
+def bitbase_dir(tmp_path_factory):
+    directory = tmp_path_factory.mktemp('bitbases')
+    # KPK строится из KQK и KRK, и они записываются вместе с ним
+    build_tables(str(directory), ('KPK',), out=io.StringIO())
+    return directory
+
+
+@pytest.fixture(scope='module')
+def bitbases(bitbase_dir):
+    with Bitbases(str(bitbase_dir)) as tables:
+        yield tables
+
+
+def test_kpk_build_writes_dependencies(bitbase_dir):
+    assert sorted(os.listdir(bitbase_dir)) == sorted(name + '.bin' for name in TABLES)
+
+
+@pytest.mark.parametrize('fen, expected', [
+    ('k7/8/1K6/8/8/8/8/7R w - - 0 1', (WIN, 1)),
+    ('k7/8/1K6/8/8/8/8/7R b - - 0 1', (LOSS, 2)),
+    # Те же позиции с сильной стороной за черных
+    ('7r/8/8/8/8/1k6/8/K7 b - - 0 1', (WIN, 1)),
+    ('K7/8/1k6/8/8/8/8/7r w - - 0 1', (LOSS, 2)),
+    # Король перед пешкой с оппозицией - ничья; король на шестой перед пешкой - выигрыш
+    ('8/8/8/8/8/4k3/4P3/4K3 w - - 0 1', (DRAW, 0)),
+    ('4k3/8/4K3/4P3/8/8/8/8 w - - 0 1', (WIN, 21)),
+    ('4k3/8/4K3/4P3/8/8/8/8 b - - 0 1', (LOSS, 24)),
+    ('8/8/8/8/8/8/4k3/K7 w - - 0 1', (DRAW, 0)),
+])
+def test_probe(bitbases, fen, expected):
+    assert bitbases.probe(SearchBoard.from_fen(fen)) == expected
+
+
+def test_probe_outside_tables(bitbases):
+    assert bitbases.probe(SearchBoard.from_fen('4k3/8/8/8/8/8/4PP2/4K3 w - - 0 1')) is None
+
+
+@pytest.mark.parametrize('fen, move, result', [
+    ('k7/8/1K6/8/8/8/8/7R w - - 0 1', 'h1h8', WIN),
+    # Незащищенную ладью можно взять
+    ('kR6/8/1K6/8/8/8/8/8 b - - 0 1', 'a8b8', DRAW),
+    ('8/4P3/8/8/8/k7/8/4K3 w - - 0 1', 'e7e8q', WIN),
+])
+def test_choose(bitbases, fen, move, result):
+    chosen = bitbases.choose(SearchBoard.from_fen(fen))
+    assert (move_to_uci(chosen[0]), chosen[1]) == (move, result)
+
+
+def test_choose_without_promotion_tables_defers_to_search(bitbase_dir, tmp_path):
+    shutil.copy(bitbase_dir / 'KPK.bin', tmp_path / 'KPK.bin')
+    with Bitbases(str(tmp_path)) as only_kpk:
+        board = SearchBoard.from_fen('8/4P3/8/8/8/k7/8/4K3 w - - 0 1')
+        assert only_kpk.probe(board) == (WIN, 13)
+        assert only_kpk.choose(board) is None
+
+
+def random_position(rng, piece):
+    """Случайная расстановка: короли и фигура piece (FEN-символ) на разных полях"""
+    placement = [None] * 64
+    for symbol, sq in zip('Kk' + piece, rng.sample(range(64), 3)):
+        placement[sq] = symbol
+    rows = []
+    for row in range(8):
+        text, empty = '', 0
+        for symbol in placement[row * 8:row * 8 + 8]:
+            if symbol is None:
+                empty += 1
+                continue
+            text += (str(empty) if empty else '') + symbol
+            empty = 0
+        rows.append(text + (str(empty) if empty else ''))
+    return SearchBoard.from_fen('/'.join(rows) + f' {rng.choice("wb")} - - 0 1')
+
+
+@pytest.mark.parametrize('piece', ['Q', 'R', 'P'])
+def test_tables_agree_with_successors(bitbases, piece):
+    """Результат позиции следует из результатов ее ходов (выборка случайных позиций)"""
+    rng = random.Random(piece)
+    checked = 0
+    while checked < 200:
+        board = random_position(rng, piece)
+        white_king, black_king = board.king_square(0), board.king_square(1)
+        if abs(white_king // 8 - black_king // 8) <= 1 and abs(white_king % 8 - black_king % 8) <= 1:
+            continue
+        if piece == 'P' and not 8 <= board.piece_lists[1][0] < 56:
+            continue
+        if board.is_square_attacked(board.king_square(board.side ^ 1), board.side):
+            continue
+        result, distance = bitbases.probe(board)
+        children = []
+        for move in generate_moves(board):
+            board.make_move(move)
+            # Превращение в слона или коня - ничья без таблицы
+            children.append(bitbases.probe(board) or (DRAW, 0))
+            board.unmake_move()
+        if not children:
+            assert result in (DRAW, LOSS) and distance == 0
+        elif result == WIN:
+            assert min(child[1] for child in children if child[0] == LOSS) == distance - 1
+        elif result == LOSS:
+            assert all(child[0] == WIN for child in children)
+            assert max(child[1] for child in children) == distance - 1
+        else:
+            assert not any(child[0] == LOSS for child in children)
+            assert any(child[0] == DRAW for child in children)
+        checked += 1
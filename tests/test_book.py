@@ -0,0 +1,108 @@
+import io
+
+import pytest
+
+from ai_player import ChessAI
+from book import ENTRY, OpeningBook, build_book, encode_book_move, polyglot_key
+from search_board import START_FEN, SearchBoard, move_to_uci
+from uci import parse_uci_move
+
+# Контрольные ключи из описания формата Polyglot
+POLYGLOT_KEYS = [
+    ('', 0x463B96181691FC9C),
+    ('e2e4', 0x823C9B50FD114196),
+    ('e2e4 d7d5', 0x0756B94461C50FB0),
+    ('e2e4 d7d5 e4e5', 0x662FAFB965DB29D4),
+    ('e2e4 d7d5 e4e5 f7f5', 0x22A48B5A8E47FF78),
+    ('e2e4 d7d5 e4e5 f7f5 e1e2', 0x652A607CA3F242C1),
+    ('e2e4 d7d5 e4e5 f7f5 e1e2 e8f7', 0x00FDD303C946BDD9),
+    ('a2a4 b7b5 h2h4 b5b4 c2c4', 0x3C8123EA7B067637),
+    ('a2a4 b7b5 h2h4 b5b4 c2c4 b4c3 a1a3', 0x5C3F9B829B279560),
+]
+
+GAMES = '''[Result "1-0"]
+
+1. e4 e5 2. Nf3 Nc6 1-0
+
+[Result "1/2-1/2"]
+
+1. e4 e5 2. Nf3 Nf6 1/2-1/2
+
+[Result "0-1"]
+
+1. d4 d5 0-1
+
+[Result "1-0"]
+
+1. d4 d5 1-0
+
+[Result "*"]
+
+1. c4 *
+'''
+
+
+def play(moves):
+    board = SearchBoard.from_fen(START_FEN)
+    for text in moves.split():
+        board.make_move(parse_uci_move(board, text))
+    return board
+
+
+@pytest.mark.parametrize('moves, key', POLYGLOT_KEYS)
+def test_polyglot_key(moves, key):
+    assert polyglot_key(play(moves)) == key
+
+
+def test_polyglot_key_survives_fen_round_trip():
+    board = play('e2e4 d7d5 e4e5 f7f5')
+    assert polyglot_key(SearchBoard.from_fen(board.fen())) == polyglot_key(board)
+
+
+def test_build_and_probe_round_trip(tmp_path):
+    pgn = tmp_path / 'games.pgn'
+    pgn.write_text(GAMES, encoding='utf-8')
+    path = tmp_path / 'book.bin'
+    assert build_book([str(pgn)], str(path), out=io.StringIO()) == 5
+
+    with OpeningBook(str(path)) as book:
+        assert len(book) == 5
+        start = {move_to_uci(move): weight for move, weight in book.moves(play(''))}
+        # e4: победа и ничья; d4: победа белых и победа черных (за белых - одна)
+        assert start == {'e2e4': 3, 'd2d4': 2}
+        assert [move_to_uci(move) for move, _ in book.moves(play('e2e4'))] == ['e7e5']
+        # Ход сыгран в одной партии - меньше min_games
+        assert book.moves(play('e2e4 e7e5 g1f3')) == []
+        assert move_to_uci(book.choose(play('d2d4'))) == 'd7d5'
+
+
+def test_reads_foreign_book_castling_and_underpromotion(tmp_path):
+    board = SearchBoard.from_fen('r3k2r/1P6/8/8/8/8/8/R3K2R w KQkq - 0 1')
+    key = polyglot_key(board)
+    moves = [parse_uci_move(board, text) for text in ('e1g1', 'b7a8n', 'e1c1')]
+    path = tmp_path / 'foreign.bin'
+    # Книги Polyglot записывают рокировку как взятие своей ладьи королем
+    entries = sorted((key, encode_book_move(move), 10 + index, 0) for index, move in enumerate(moves))
+    path.write_bytes(b''.join(ENTRY.pack(*entry) for entry in entries))
+    assert encode_book_move(moves[0]) & 63 == 7
+
+    with OpeningBook(str(path)) as book:
+        found = {move_to_uci(move): weight for move, weight in book.moves(board)}
+    assert found == {'e1g1': 10, 'b7a8n': 11, 'e1c1': 12}
+
+
+def test_empty_book(tmp_path):
+    path = tmp_path / 'empty.bin'
+    path.write_bytes(b'')
+    with OpeningBook(str(path)) as book:
+        assert len(book) == 0
+        assert book.choose(play('')) is None
+
+
+def test_truncated_book_is_rejected(tmp_path):
+    path = tmp_path / 'broken.bin'
+    path.write_bytes(b'\0' * 20)
+    with pytest.raises(ValueError):
+        OpeningBook(str(path))
+    ai = ChessAI(verbose=False, book_path=str(path), bitbase_dir=None)
+    assert ai.book is None
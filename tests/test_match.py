@@ -0,0 +1,89 @@
+import math
+from collections import Counter
+
+import pytest
+
+from match import (DEFAULT_OPENINGS, elo_difference, game_over, insufficient_material, load_openings,
+                   parse_engine, play_game, schedule_openings, sprt_bounds, sprt_llr)
+from search_board import SearchBoard
+
+
+def test_elo_difference():
+    assert elo_difference(10, 0, 10)[0] == pytest.approx(0.0)
+    elo, margin = elo_difference(60, 20, 20)
+    # Очки 0.7 -> 400 * log10(0.7 / 0.3)
+    assert elo == pytest.approx(400 * math.log10(0.7 / 0.3))
+    assert 0 < margin < math.inf
+    assert elo_difference(30, 20, 50)[0] == pytest.approx(-elo_difference(50, 20, 30)[0])
+    assert elo_difference(0, 0, 0) == (0.0, math.inf)
+    assert elo_difference(5, 0, 0)[0] == math.inf
+
+
+def test_sprt_bounds():
+    lower, upper = sprt_bounds(0.05, 0.05)
+    assert lower == pytest.approx(-math.log(19))
+    assert upper == pytest.approx(math.log(19))
+
+
+def test_sprt_llr_sign_and_symmetry():
+    assert sprt_llr(0, 0, 0, 0, 10) == 0.0
+    assert sprt_llr(550, 300, 450, 0, 10) > 0
+    assert sprt_llr(450, 300, 550, 0, 10) < 0
+    assert sprt_llr(450, 300, 550, 0, 10) == pytest.approx(-sprt_llr(550, 300, 450, -10, 0))
+
+
+@pytest.mark.parametrize('wins, losses', [(0, 20), (20, 0)])
+def test_sprt_decides_one_sided_matches(wins, losses):
+    lower, upper = sprt_bounds()
+    # Без поправки дисперсия нулевая и LLR оставался 0
+    assert sprt_llr(min(wins, 4), 0, min(losses, 4), 0, 10) != 0.0
+    llr = sprt_llr(wins, 0, losses, 0, 10)
+    assert llr <= lower if losses else llr >= upper
+
+
+def test_parse_engine():
+    assert parse_engine(['new', 'depth=3', 'lmr=false', 'label=x']) == (
+        'new', {'book_path': None, 'depth': 3, 'lmr': False, 'label': 'x'})
+
+
+def test_default_openings_are_varied_and_not_repeated():
+    openings = load_openings(None)
+    assert len(openings) == len(DEFAULT_OPENINGS) == len(set(openings))
+    scheduled = schedule_openings(openings, 3 * len(openings), seed=1)
+    assert scheduled[:len(openings)] == openings
+    assert len(set(scheduled)) == len(scheduled)
+    assert schedule_openings(openings, 60, seed=1) == scheduled[:60]
+
+
+def test_load_openings_from_epd(tmp_path):
+    path = tmp_path / 'openings.epd'
+    path.write_text('# comment\n'
+                    'rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 id "e4";\n'
+                    'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - 0 1\n', encoding='utf-8')
+    assert load_openings(str(path)) == ['rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3',
+                                        'rnbqkbnr/pppppppp/8/8/3P4/8/PPP1PPPP/RNBQKBNR b KQkq - 0 1']
+
+
+@pytest.mark.parametrize('fen, expected', [
+    ('7k/6Q1/6K1/8/8/8/8/8 b - - 0 1', ('1-0', 'мат')),
+    ('7k/8/6QK/8/8/8/8/8 b - - 0 1', ('1/2-1/2', 'пат')),
+    ('7k/8/6NK/8/8/8/8/8 b - - 0 1', ('1/2-1/2', 'недостаточно материала')),
+    ('7k/8/8/8/8/8/8/R6K b - - 100 80', ('1/2-1/2', 'правило 50 ходов')),
+    ('7k/8/8/8/8/8/8/R6K b - - 0 1', None),
+])
+def test_game_over(fen, expected):
+    board = SearchBoard.from_fen(fen)
+    assert game_over(board, Counter([board.key])) == expected
+
+
+def test_insufficient_material():
+    assert insufficient_material(SearchBoard.from_fen('7k/8/8/8/8/8/8/B6K w - - 0 1'))
+    assert not insufficient_material(SearchBoard.from_fen('7k/8/8/8/8/8/8/BB5K w - - 0 1'))
+    assert not insufficient_material(SearchBoard.from_fen('7k/8/8/8/8/8/P7/7K w - - 0 1'))
+
+
+def test_tiny_budget_does_not_resign():
+    # С бюджетом в несколько узлов итерация может не завершиться: оценки нет, присуждать нечего
+    engine = ('tiny', {'book_path': None, 'bitbase_dir': None, 'node_limit': 1})
+    game = play_game(0, engine, ('other', dict(engine[1])), load_openings(None)[0], max_plies=12)
+    assert game['termination'] != 'присуждено по оценке'
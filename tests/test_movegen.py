@@ -0,0 +1,73 @@
+import pytest
+
+from movegen import PERFT_SUITE, generate_moves, is_legal, perft
+from search_board import SearchBoard, encode_move, move_to_uci, parse_square
+
+
+def uci_moves(fen, **kwargs):
+    return {move_to_uci(move) for move in generate_moves(SearchBoard.from_fen(fen), **kwargs)}
+
+
+@pytest.mark.parametrize('name, fen, expected', PERFT_SUITE, ids=[name for name, _, _ in PERFT_SUITE])
+def test_perft(name, fen, expected):
+    board = SearchBoard.from_fen(fen)
+    for depth, nodes in enumerate(expected[:3], start=1):
+        assert perft(board, depth) == nodes
+    # make/unmake возвращает доску в исходное состояние
+    assert board.fen() == SearchBoard.from_fen(fen).fen()
+
+
+def test_en_passant_exposing_king_on_rank_is_illegal():
+    # После c7c5 взятие bxc6 убрало бы обе пешки с пятой горизонтали под ладью h5
+    moves = uci_moves('4k3/8/8/KPp4r/8/8/8/8 w - c6 0 2')
+    assert 'b5c6' not in moves
+    assert 'b5b6' in moves
+
+
+def test_en_passant_capture_available():
+    assert 'e5d6' in uci_moves('4k3/8/8/3pP3/8/8/8/4K3 w - d6 0 2')
+
+
+def test_castling_through_attacked_square():
+    moves = uci_moves('4k3/8/8/8/8/8/5r2/R3K2R w KQ - 0 1')
+    assert 'e1g1' not in moves
+    assert 'e1c1' in moves
+
+
+def test_no_castling_out_of_check():
+    moves = uci_moves('4k3/8/8/8/8/8/4r3/R3K2R w KQ - 0 1')
+    assert not {'e1g1', 'e1c1'} & moves
+
+
+def test_promotions_and_capture_promotions():
+    moves = uci_moves('1n2k3/P7/8/8/8/8/8/4K3 w - - 0 1')
+    for target in ('a8', 'b8'):
+        assert {f'a7{target}{piece}' for piece in 'qrbn'} <= moves
+
+
+def test_noisy_and_quiet_split_all_moves():
+    fen = 'r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1'
+    noisy = uci_moves(fen, noisy_only=True)
+    quiet = uci_moves(fen, quiet_only=True)
+    assert not noisy & quiet
+    assert noisy | quiet == uci_moves(fen)
+
+
+def test_check_evasions_only():
+    # Шах ладьей: король уходит или ладья перекрывается/берется
+    moves = uci_moves('4k3/8/8/8/8/8/3B4/r3K3 w - - 0 1')
+    assert moves == {'e1e2', 'e1f2', 'd2c1'}
+
+
+@pytest.mark.parametrize('fen', ['7k/6Q1/6K1/8/8/8/8/8 b - - 0 1', '7k/8/6QK/8/8/8/8/8 b - - 0 1'])
+def test_no_moves_in_mate_and_stalemate(fen):
+    assert generate_moves(SearchBoard.from_fen(fen)) == []
+
+
+def test_is_legal_rejects_pinned_piece_move():
+    board = SearchBoard.from_fen('4k3/4r3/8/8/8/8/4B3/4K3 w - - 0 1')
+    legal = {move_to_uci(move) for move in generate_moves(board)}
+    assert not any(move.startswith('e2') for move in legal)
+    for move in generate_moves(board):
+        assert is_legal(board, move)
+    assert not is_legal(board, encode_move(parse_square('e2'), parse_square('d3')))
@@ -0,0 +1,88 @@
+EXACT = 0
+LOWER = 1  # оценка не меньше сохраненной (отсечение по beta)
+UPPER = 2  # оценка не больше сохраненной (ни один ход не поднял alpha)
+
+# Примерный размер одной записи в памяти Python: кортеж и его числа
+ENTRY_BYTES = 160
+
+
+class TranspositionTable:
+    """Таблица фиксированного размера из корзин по две записи.
+
+    Позиция, уже лежащая в корзине, обновляется на своем месте, и только если
+    новый результат не мельче, точный (EXACT) или старый остался от прошлых
+    поисков. Новая позиция занимает первую запись, если она глубже (или
+    первая устарела), иначе вторую, которая перезаписывается всегда.
+    Запись - кортеж (key, depth, value, flag, move, age); value хранится
+    относительно стороны, которая ходит в позиции.
+    """
+
+    def __init__(self, size_mb=16, entries=None):
+        if entries is None:
+            entries = size_mb * 1024 * 1024 // ENTRY_BYTES
+        assert entries >= 2
+
+        self.buckets = entries // 2
+        self.entries = [None] * (self.buckets * 2)
+        self.age = 0
+
+        self.probes = 0
+        self.hits = 0
+        self.stores = 0
+        # Записи других позиций, вытесненные при сохранении
+        self.overwrites = 0
+
+    def __len__(self):
+        return sum(1 for entry in self.entries if entry is not None)
+
+    def clear(self):
+        self.entries = [None] * (self.buckets * 2)
+        self.age = 0
+
+    def new_search(self):
+        """Старые записи остаются, но уступают место новым в первой ячейке"""
+        self.age += 1
+
+    def probe(self, key):
+        self.probes += 1
+        index = (key % self.buckets) * 2
+        entries = self.entries
+
+        entry = entries[index]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        entry = entries[index + 1]
+        if entry is not None and entry[0] == key:
+            self.hits += 1
+            return entry
+        return None
+
+    def store(self, key, depth, value, flag, move=None):
+        self.stores += 1
+        index = (key % self.buckets) * 2
+        entries = self.entries
+
+        for slot in (index, index + 1):
+            entry = entries[slot]
+            if entry is not None and entry[0] == key:
+                if depth >= entry[1] or flag == EXACT or entry[5] != self.age:
+                    entries[slot] = (key, depth, value, flag, move if move is not None else entry[4], self.age)
+                return
+
+        deep = entries[index]
+        if deep is None or depth >= deep[1] or deep[5] != self.age:
+            if deep is not None:
+                self.overwrites += 1
+            entries[index] = (key, depth, value, flag, move, self.age)
+            return
+
+        if entries[index + 1] is not None:
+            self.overwrites += 1
+        entries[index + 1] = (key, depth, value, flag, move, self.age)
+
+    def counters(self):
+        return {'probes': self.probes, 'hits': self.hits, 'stores': self.stores, 'overwrites': self.overwrites}
+
+    def hit_rate(self):
+        return self.hits / self.probes if self.probes else 0.0
@@ -0,0 +1,320 @@
+"""Подбор параметров оценки по результатам партий (метод Texel).
+
+    python tune.py quiet-labeled.epd -o eval_params.json --epochs 100
+    python tune.py games.pgn --skip-plies 10 --max-positions 2000000
+
+Позиции загружаются один раз в массив кодов фигур (N, 64). Оценка
+evaluation.py линейна по параметрам при известной фазе партии, поэтому
+градиент логистической функции потерь по всем таблицам считается
+пакетно через numpy (bincount по номерам признаков), без поиска и без
+вызова оценки ChessAI на каждую позицию. Результат пишется в формате
+DEFAULT_PARAMS, который ChessAI читает при запуске.
+"""
+import argparse
+import math
+import os
+import sys
+import time
+from array import array
+
+import numpy as np
+
+from evaluation import (DEFAULT_PARAMS, DEFAULT_PARAMS_PATH, MAX_PHASE, PHASE_WEIGHTS, PIECE_ORDER, load_params,
+                        save_params)
+from pgn import parse_san, read_games
+from search_board import FEN_PIECES, FLAG_EN_PASSANT, START_FEN, SearchBoard
+from zobrist import PIECE_CODES
+
+RESULT_LABELS = {'1-0': 1.0, '0-1': 0.0, '1/2-1/2': 0.5}
+
+# Параметры: поле (со стороны белых) для каждой фигуры, материал входит в каждое значение;
+# последний номер - пустая клетка, ее вес всегда 0
+TABLE_SIZE = len(PIECE_ORDER) * 64
+EMPTY_FEATURE = TABLE_SIZE
+
+
+def parse_label(text):
+    """Результат для белых из хвоста строки EPD: c9 "1-0";  [0.5]  1/2-1/2"""
+    for token in reversed(text.replace(';', ' ').replace('"', ' ').split()):
+        if token in RESULT_LABELS:
+            return RESULT_LABELS[token]
+        if token.startswith('[') and token.endswith(']'):
+            return float(token[1:-1])
+    return None
+
+
+def placement_codes(placement):
+    """Первое поле FEN -> 64 кода фигур"""
+    codes = bytearray(64)
+    sq = 0
+    for symbol in placement:
+        if symbol == '/':
+            continue
+        if symbol.isdigit():
+            sq += int(symbol)
+        else:
+            codes[sq] = FEN_PIECES[symbol.lower()] | (0 if symbol.isupper() else 8)
+            sq += 1
+    return codes
+
+
+def iter_samples(path, skip_plies=8):
+    """(64 кода фигур, результат для белых): строки EPD/FEN с результатом или позиции партий PGN.
+
+    Из партий берутся только спокойные позиции: без шаха и перед ходом, который не берет фигуру.
+    """
+    if path.lower().endswith('.pgn'):
+        for headers, sans in read_games(path):
+            label = RESULT_LABELS.get(headers.get('Result'))
+            if label is None:
+                continue
+            board = SearchBoard.from_fen(headers.get('FEN', START_FEN))
+            for ply, san in enumerate(sans):
+                try:
+                    move = parse_san(board, san)
+                except ValueError:
+                    break
+                capture = board.squares[(move >> 6) & 63] or move & FLAG_EN_PASSANT
+                if ply >= skip_plies and not capture and not board.in_check():
+                    yield bytes(board.squares), label
+                board.make_move(move)
+        return
+
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            fields = line.split(maxsplit=4)
+            if len(fields) < 5:
+                continue
+            label = parse_label(fields[4])
+            if label is not None:
+                yield placement_codes(fields[0]), label
+
+
+def load_samples(paths, skip_plies=8, max_positions=None, out=sys.stderr):
+    """Коды фигур (N, 64) uint8 и результаты (N,) float32"""
+    codes = array('B')
+    labels = array('f')
+    for path in paths:
+        for squares, label in iter_samples(path, skip_plies):
+            codes.extend(squares)
+            labels.append(label)
+            if len(labels) == max_positions:
+                break
+        print(f'{path}: всего {len(labels)} позиций', file=out, flush=True)
+        if len(labels) == max_positions:
+            break
+    return np.frombuffer(codes, dtype=np.uint8).reshape(-1, 64), np.frombuffer(labels, dtype=np.float32)
+
+
+def feature_map():
+    """Для каждой пары (код фигуры, поле) - номер параметра и знак (черные отражаются и вычитаются)"""
+    index = np.full(16 * 64, EMPTY_FEATURE, dtype=np.int64)
+    sign = np.zeros(16 * 64)
+    for piece, name in enumerate(PIECE_ORDER):
+        code = PIECE_CODES[name]
+        for sq in range(64):
+            mirrored = (7 - (sq >> 3)) * 8 + (sq & 7)
+            index[code * 64 + sq], sign[code * 64 + sq] = piece * 64 + sq, 1.0
+            index[(code | 8) * 64 + sq], sign[(code | 8) * 64 + sq] = piece * 64 + mirrored, -1.0
+    return index, sign
+
+
+def params_to_vector(params):
+    """Параметры в формате DEFAULT_PARAMS -> (миттельшпиль, эндшпиль): материал + поле"""
+    vectors = []
+    for phase in ('mg', 'eg'):
+        vector = np.zeros(TABLE_SIZE + 1)
+        for piece, name in enumerate(PIECE_ORDER):
+            table = np.array(params[f'pst_{phase}'][name], dtype=np.float64).ravel()
+            vector[piece * 64:(piece + 1) * 64] = params[f'piece_values_{phase}'][name] + table
+        vectors.append(vector)
+    return vectors
+
+
+def vector_to_params(mg, eg):
+    """Обратно: ценность фигуры - среднее по полям, таблица - отклонения от него"""
+    params = {}
+    for phase, vector in (('mg', mg), ('eg', eg)):
+        values = {}
+        tables = {}
+        for piece, name in enumerate(PIECE_ORDER):
+            table = vector[piece * 64:(piece + 1) * 64].reshape(8, 8)
+            if name == 'King':
+                value = 0
+            elif name == 'Pawn':
+                # Пешек не бывает на первой и последней горизонталях
+                value = int(round(table[1:7].mean()))
+            else:
+                value = int(round(table.mean()))
+            pst = np.rint(table - value).astype(int)
+            if name == 'Pawn':
+                pst[0] = pst[7] = 0
+            values[name] = value
+            tables[name] = pst.tolist()
+        params[f'piece_values_{phase}'] = values
+        params[f'pst_{phase}'] = tables
+    return params
+
+
+def game_phase(codes, batch_size=65536):
+    """Доля миттельшпиля 0..1 для каждой позиции"""
+    weights = np.zeros(16)
+    for name in PIECE_ORDER:
+        weights[PIECE_CODES[name]] = weights[PIECE_CODES[name] | 8] = PHASE_WEIGHTS[name]
+    phase = np.empty(len(codes), dtype=np.float32)
+    for start in range(0, len(codes), batch_size):
+        counts = weights[codes[start:start + batch_size]].sum(axis=1)
+        phase[start:start + batch_size] = np.minimum(counts, MAX_PHASE) / MAX_PHASE
+    return phase
+
+
+class TexelModel:
+    """Оценка и градиент логистической функции потерь для пачки позиций"""
+
+    def __init__(self, params):
+        self.mg, self.eg = params_to_vector(params)
+        self.index, self.sign = feature_map()
+        self.columns = np.arange(64)
+
+    def _tables(self):
+        return self.sign * self.mg[self.index], self.sign * self.eg[self.index]
+
+    def evaluate(self, codes, phase):
+        """Оценки за белых, как EvalTables.evaluate_batch, но без округления"""
+        mg_table, eg_table = self._tables()
+        features = codes.astype(np.int64) * 64 + self.columns
+        return mg_table[features].sum(axis=1) * phase + eg_table[features].sum(axis=1) * (1 - phase)
+
+    def loss(self, codes, phase, labels, scale, batch_size=65536):
+        total = 0.0
+        for start in range(0, len(codes), batch_size):
+            part = slice(start, start + batch_size)
+            probability = win_probability(self.evaluate(codes[part], phase[part]), scale)
+            total += log_loss(probability, labels[part]).sum()
+        return total / len(codes)
+
+    def gradient(self, codes, phase, labels, scale):
+        """Средняя потеря пачки и градиенты по векторам миттельшпиля и эндшпиля"""
+        mg_table, eg_table = self._tables()
+        features = codes.astype(np.int64) * 64 + self.columns
+        scores = mg_table[features].sum(axis=1) * phase + eg_table[features].sum(axis=1) * (1 - phase)
+        probability = win_probability(scores, scale)
+
+        # d loss / d score для логистической потери с сигмоидой 1 / (1 + 10^(-scale * score / 400))
+        slope = (probability - labels) * (scale * math.log(10) / 400) / len(codes)
+        flat = features.ravel()
+        grads = []
+        for weight in (slope * phase, slope * (1 - phase)):
+            per_feature = np.bincount(flat, weights=np.repeat(weight, 64), minlength=16 * 64)
+            grads.append(np.bincount(self.index, weights=self.sign * per_feature, minlength=TABLE_SIZE + 1))
+        return log_loss(probability, labels).mean(), grads[0], grads[1]
+
+    def params(self):
+        return vector_to_params(self.mg, self.eg)
+
+
+def win_probability(scores, scale):
+    return 1 / (1 + np.power(10.0, -scale * scores / 400))
+
+
+def log_loss(probability, labels):
+    probability = np.clip(probability, 1e-7, 1 - 1e-7)
+    return -(labels * np.log(probability) + (1 - labels) * np.log(1 - probability))
+
+
+def fit_scale(model, codes, phase, labels, sample=200000):
+    """Масштаб сигмоиды, при котором исходная оценка лучше всего предсказывает результаты"""
+    if len(codes) > sample:
+        chosen = np.random.default_rng(0).choice(len(codes), sample, replace=False)
+        codes, phase, labels = codes[chosen], phase[chosen], labels[chosen]
+    scores = model.evaluate(codes, phase)
+    low, high = 0.05, 5.0
+    # Потеря выпукла по масштабу: поиск золотым сечением
+    ratio = (math.sqrt(5) - 1) / 2
+    for _ in range(40):
+        a = high - ratio * (high - low)
+        b = low + ratio * (high - low)
+        if log_loss(win_probability(scores, a), labels).mean() < log_loss(win_probability(scores, b), labels).mean():
+            high = b
+        else:
+            low = a
+    return (low + high) / 2
+
+
+def tune(model, codes, phase, labels, scale, epochs=100, batch_size=16384, learning_rate=1.0, l2=0.0, seed=0,
+         out=sys.stderr):
+    """Adam по случайным пачкам; l2 притягивает параметры к начальным значениям"""
+    rng = np.random.default_rng(seed)
+    start_mg, start_eg = model.mg.copy(), model.eg.copy()
+    moments = [np.zeros_like(model.mg) for _ in range(4)]
+    beta1, beta2, epsilon = 0.9, 0.999, 1e-8
+    step = 0
+
+    for epoch in range(1, epochs + 1):
+        started = time.perf_counter()
+        order = rng.permutation(len(codes))
+        total = 0.0
+        for start in range(0, len(codes), batch_size):
+            chosen = np.sort(order[start:start + batch_size])
+            loss, grad_mg, grad_eg = model.gradient(codes[chosen], phase[chosen], labels[chosen], scale)
+            total += loss * len(chosen)
+            if l2:
+                grad_mg += l2 * (model.mg - start_mg)
+                grad_eg += l2 * (model.eg - start_eg)
+
+            step += 1
+            for vector, grad, first, second in ((model.mg, grad_mg, moments[0], moments[1]),
+                                                (model.eg, grad_eg, moments[2], moments[3])):
+                first *= beta1
+                first += (1 - beta1) * grad
+                second *= beta2
+                second += (1 - beta2) * grad * grad
+                corrected = first / (1 - beta1 ** step)
+                vector -= learning_rate * corrected / (np.sqrt(second / (1 - beta2 ** step)) + epsilon)
+                vector[EMPTY_FEATURE] = 0.0
+        print(f'эпоха {epoch}: потеря {total / len(codes):.6f} ({time.perf_counter() - started:.1f} с)',
+              file=out, flush=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Подбор параметров оценки ChessAI по результатам партий')
+    parser.add_argument('inputs', nargs='+', help='EPD/FEN с результатом в конце строки или PGN')
+    parser.add_argument('-o', '--output', default=DEFAULT_PARAMS_PATH, help='файл параметров для ChessAI')
+    parser.add_argument('--init', help='начальные параметры (по умолчанию текущие параметры ChessAI)')
+    parser.add_argument('--epochs', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=16384)
+    parser.add_argument('--lr', type=float, default=1.0, help='шаг Adam в сантипешках')
+    parser.add_argument('--l2', type=float, default=0.0, help='притяжение к начальным параметрам')
+    parser.add_argument('--scale', type=float, help='масштаб сигмоиды (по умолчанию подбирается)')
+    parser.add_argument('--skip-plies', type=int, default=8, help='PGN: пропустить дебютные полуходы')
+    parser.add_argument('--max-positions', type=int, help='не больше стольких позиций')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    init = args.init or (DEFAULT_PARAMS_PATH if os.path.exists(DEFAULT_PARAMS_PATH) else None)
+    params = load_params(init) if init else DEFAULT_PARAMS
+
+    started = time.perf_counter()
+    codes, labels = load_samples(args.inputs, args.skip_plies, args.max_positions)
+    if not len(codes):
+        print('Нет позиций с результатом', file=sys.stderr)
+        return 1
+    phase = game_phase(codes)
+    print(f'Загружено {len(codes)} позиций за {time.perf_counter() - started:.1f} с', file=sys.stderr)
+
+    model = TexelModel(params)
+    scale = args.scale or fit_scale(model, codes, phase, labels)
+    print(f'Масштаб {scale:.4f}, потеря до подбора {model.loss(codes, phase, labels, scale):.6f}',
+          file=sys.stderr)
+
+    tune(model, codes, phase, labels, scale, args.epochs, args.batch_size, args.lr, args.l2, args.seed)
+    tuned = model.params()
+    # Потеря после округления до целых, с которыми работает ChessAI
+    rounded = TexelModel(tuned).loss(codes, phase, labels, scale)
+    save_params(tuned, args.output)
+    print(f'Потеря после подбора {rounded:.6f}; параметры записаны в {args.output}', file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
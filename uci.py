@@ -0,0 +1,228 @@
+"""UCI-протокол для ChessAI: движок без окна для турниров и серверов.
+
+    python -m ai_player --uci
+
+Поиск идет в отдельном потоке, поэтому stop и ponderhit обрабатываются,
+пока движок думает. pygame здесь не импортируется.
+"""
+import sys
+import threading
+
+from ai_player import MATE_SCORE, MATE_THRESHOLD, MAX_DEPTH, ChessAI
+from movegen import generate_moves
+from search_board import START_FEN, WHITE, SearchBoard, move_to_uci
+from transposition import TranspositionTable
+
+ENGINE_NAME = 'ChessAI'
+ENGINE_AUTHOR = 'Rizzalenok'
+
+# Если movestogo не задан, оставшееся время делится на столько ходов
+DEFAULT_MOVES_TO_GO = 30
+# Запас на ввод-вывод и запуск поиска, мс
+MOVE_OVERHEAD_MS = 50
+
+
+def time_for_move(remaining_ms, increment_ms=0, moves_to_go=None):
+    """Время на ход в секундах по часам партии"""
+    moves_to_go = moves_to_go or DEFAULT_MOVES_TO_GO
+    budget = remaining_ms / moves_to_go + increment_ms * 0.8
+    # Никогда не тратить больше половины оставшегося времени
+    budget = min(budget, remaining_ms / 2) - MOVE_OVERHEAD_MS
+    return max(budget, 10) / 1000
+
+
+def parse_uci_move(board, text):
+    for move in generate_moves(board):
+        if move_to_uci(move) == text:
+            return move
+    raise ValueError(f'Нелегальный ход {text}')
+
+
+class UCIEngine:
+
+    def __init__(self, out=sys.stdout):
+        self.out = out
+        self.ai = ChessAI(verbose=False)
+        self.ai.add_listener(self._on_search_event)
+        self.board = SearchBoard.from_fen(START_FEN)
+        self._output_lock = threading.Lock()
+        self._thread = None
+        # bestmove отдается только после этого события (go infinite и go ponder ждут stop/ponderhit)
+        self._release = threading.Event()
+        self._ponder_time_limit = None
+
+    def send(self, line):
+        with self._output_lock:
+            self.out.write(line + '\n')
+            self.out.flush()
+
+    def run(self, source=sys.stdin):
+        for line in source:
+            if not self.handle(line):
+                break
+        self._stop_search()
+        self.ai.close()
+
+    def handle(self, line):
+        """Одна команда GUI; False - пора завершаться"""
+        tokens = line.split()
+        if not tokens:
+            return True
+        command, args = tokens[0], tokens[1:]
+
+        if command == 'uci':
+            self.send(f'id name {ENGINE_NAME}')
+            self.send(f'id author {ENGINE_AUTHOR}')
+            self.send('option name Hash type spin default 16 min 1 max 1024')
+            self.send(f'option name OwnBook type check default {"true" if self.ai.book else "false"}')
+            self.send('option name Ponder type check default false')
+            self.send('uciok')
+        elif command == 'isready':
+            self.send('readyok')
+        elif command == 'ucinewgame':
+            self._stop_search()
+            self.ai.new_game()
+        elif command == 'setoption':
+            self._set_option(args)
+        elif command == 'position':
+            self._stop_search()
+            self._set_position(args)
+        elif command == 'go':
+            self._stop_search()
+            self._go(args)
+        elif command == 'stop':
+            self._stop_search()
+        elif command == 'ponderhit':
+            if self._ponder_time_limit is not None:
+                self.ai.set_time_limit(self._ponder_time_limit)
+            self._release.set()
+        elif command == 'quit':
+            return False
+        return True
+
+    def _set_option(self, args):
+        text = ' '.join(args)
+        name, _, value = text.partition(' value ')
+        name = name.replace('name', '', 1).strip().lower()
+        value = value.strip()
+        if name == 'hash' and value.isdigit():
+            self.ai.transposition_table = TranspositionTable(size_mb=int(value))
+        elif name == 'ownbook' and value.lower() == 'false' and self.ai.book is not None:
+            self.ai.book.close()
+            self.ai.book = None
+
+    def _set_position(self, args):
+        if not args:
+            return
+        if args[0] == 'startpos':
+            fen, rest = START_FEN, args[1:]
+        elif args[0] == 'fen':
+            fen_fields = []
+            rest = args[1:]
+            while rest and rest[0] != 'moves':
+                fen_fields.append(rest.pop(0))
+            fen = ' '.join(fen_fields)
+        else:
+            return
+
+        board = SearchBoard.from_fen(fen)
+        if rest and rest[0] == 'moves':
+            for text in rest[1:]:
+                try:
+                    board.make_move(parse_uci_move(board, text))
+                except ValueError as error:
+                    self.send(f'info string {error}')
+                    break
+        self.board = board
+
+    def _go(self, args):
+        params = {}
+        flags = set()
+        index = 0
+        while index < len(args):
+            name = args[index]
+            if name in ('infinite', 'ponder'):
+                flags.add(name)
+                index += 1
+            elif index + 1 < len(args) and args[index + 1].lstrip('-').isdigit():
+                params[name] = int(args[index + 1])
+                index += 2
+            else:
+                index += 1
+
+        time_limit = None
+        max_depth = params.get('depth')
+        node_limit = params.get('nodes')
+        if 'movetime' in params:
+            time_limit = params['movetime'] / 1000
+        elif 'wtime' in params or 'btime' in params:
+            white = self.board.side == WHITE
+            remaining = params.get('wtime' if white else 'btime', 0)
+            increment = params.get('winc' if white else 'binc', 0)
+            time_limit = time_for_move(remaining, increment, params.get('movestogo'))
+
+        self._ponder_time_limit = None
+        if 'ponder' in flags:
+            # До ponderhit думаем без ограничения, потом - обычное время на ход
+            self._ponder_time_limit, time_limit = time_limit, None
+        if time_limit is None and max_depth is None and node_limit is None:
+            max_depth = MAX_DEPTH
+
+        if 'infinite' in flags or 'ponder' in flags:
+            self._release.clear()
+        else:
+            self._release.set()
+
+        self.ai.prepare_search()
+        self._thread = threading.Thread(target=self._search,
+                                        args=(self.board.copy(), time_limit, max_depth, node_limit),
+                                        name='uci-search', daemon=True)
+        self._thread.start()
+
+    def _search(self, board, time_limit, max_depth, node_limit):
+        self.ai.get_best_move(board, time_limit=time_limit, max_depth=max_depth, node_limit=node_limit)
+        self._release.wait()
+
+        move = self.ai.best_move
+        if move is None:
+            self.send('bestmove 0000')
+            return
+        pv = self.ai.principal_variation
+        if len(pv) > 1 and pv[0] == move:
+            self.send(f'bestmove {move_to_uci(move)} ponder {move_to_uci(pv[1])}')
+        else:
+            self.send(f'bestmove {move_to_uci(move)}')
+
+    def _stop_search(self):
+        thread = self._thread
+        if thread is None:
+            return
+        self._release.set()
+        self.ai.stop()
+        thread.join()
+        self._thread = None
+
+    def _on_search_event(self, event, data):
+        if event != 'iteration':
+            return
+        score = data['score']
+        if abs(score) >= MATE_THRESHOLD:
+            # MATE_SCORE минус полуходы до мата
+            moves = (MATE_SCORE - abs(score) + 1) // 2
+            score_text = f'mate {moves if score > 0 else -moves}'
+        else:
+            score_text = f'cp {int(score)}'
+        elapsed = data['time']
+        nps = int(data['nodes'] / elapsed) if elapsed else 0
+        pv = ' '.join(move_to_uci(move) for move in data['pv'])
+        self.send(f"info depth {data['depth']} score {score_text} nodes {data['nodes']} "
+                  f"nps {nps} time {int(elapsed * 1000)} pv {pv}")
+
+
+def main():
+    UCIEngine().run()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())